@@ -76,4 +76,25 @@ def create_app(config_name: str | None = None) -> Flask:
     # ── 確保快取目錄存在 ──────────────────────────────────
     os.makedirs(app.config.get('CACHE_DIR', 'cache'), exist_ok=True)
 
+    # ── 快取預熱（還原快照至記憶體層，並定期寫入新快照）──────
+    # 以 gunicorn --preload 啟動時只在 master 還原一次，worker 經 fork 繼承
+    if app.config.get('CACHE_SNAPSHOT_ENABLED'):
+        from utils.cache import restore_snapshot, start_snapshot_writer
+        restore_snapshot()
+        start_snapshot_writer(app.config.get('CACHE_SNAPSHOT_INTERVAL'))
+
+    # ── 啟動背景快取清理 ──────────────────────────────────
+    if app.config.get('CACHE_SWEEPER_ENABLED'):
+        from utils.cache import start_cache_sweeper
+        start_cache_sweeper(
+            app.config.get('CACHE_SWEEP_INTERVAL'),
+            max_entries=app.config.get('CACHE_MAX_ENTRIES'),
+            max_bytes=app.config.get('CACHE_MAX_BYTES'),
+        )
+
+    # ── 啟動評分歷史背景寫入 ──────────────────────────────
+    if app.config.get('SCORE_HISTORY_ENABLED'):
+        from utils.score_history import start_score_recorder
+        start_score_recorder(app, app.config.get('SCORE_HISTORY_FLUSH_INTERVAL'))
+
     return app
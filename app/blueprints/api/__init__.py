@@ -4,16 +4,18 @@ REST API 端點 - /api/*
 所有端點統一回傳 JSON 格式
 """
 
+import hmac
 import threading
 from datetime import datetime
+from functools import wraps
 
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, jsonify, request, current_app
 from flask_login import login_required, current_user
 
 from database import db, Watchlist
 from utils.twse import (
-    get_stock_basic_info, get_market_summary,
-    get_stock_name, get_stock_chart_data
+    get_stock_basic_info, get_stocks_basic_info, get_market_summary,
+    get_stock_name, get_stock_chart_data, is_unknown_symbol
 )
 
 api_bp = Blueprint('api', __name__, url_prefix='/api')
@@ -49,6 +51,35 @@ def _now_iso() -> str:
     return datetime.now().isoformat()
 
 
+def _compact_quote(code: str, info: dict) -> dict:
+    """批次報價的精簡格式"""
+    return {
+        'name': info.get('股票名稱') or get_stock_name(code),
+        'price': info.get('收盤價', 'N/A'),
+        'change': info.get('漲跌價差', 'N/A'),
+        'change_percent': info.get('漲跌幅', 'N/A'),
+        'open': info.get('開盤價', 'N/A'),
+        'high': info.get('最高價', 'N/A'),
+        'low': info.get('最低價', 'N/A'),
+        'volume': info.get('成交量', 'N/A'),
+    }
+
+
+def _admin_required(view):
+    """管理端點授權：X-Admin-Token 符合 ADMIN_TOKEN，或登入帳號在 ADMIN_USERNAMES 中"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        token = current_app.config.get('ADMIN_TOKEN')
+        provided = request.headers.get('X-Admin-Token', '')
+        if token and provided and hmac.compare_digest(provided, token):
+            return view(*args, **kwargs)
+        if (current_user.is_authenticated
+                and current_user.username in current_app.config.get('ADMIN_USERNAMES', [])):
+            return view(*args, **kwargs)
+        return jsonify({'success': False, 'error': '需要管理員權限', 'timestamp': _now_iso()}), 403
+    return wrapper
+
+
 # ── 股票資訊 API ─────────────────────────────────────────
 
 @api_bp.route('/stock/<stock_code>')
@@ -84,6 +115,58 @@ def api_stock_chart(stock_code):
         return jsonify({'success': False, 'error': str(e), 'timestamp': _now_iso()}), 500
 
 
+@api_bp.route('/stock/<stock_code>/indicators')
+def api_stock_indicators(stock_code):
+    """
+    GET /api/stock/<code>/indicators?names=rsi,macd,bb,ma&period=14&days=90 - 技術指標完整序列
+    其他參數：bb_period、bb_std、ma=5,10,20,60、macd=12,26,9
+    回傳欄位式資料：time / close 與各指標序列等長，資料不足處為 null
+    """
+    try:
+        from utils.indicator_service import get_indicator_series
+
+        names = [name.strip() for name in request.args.get('names', 'rsi,macd,bb,ma').split(',')
+                 if name.strip()]
+        days = max(1, min(request.args.get('days', 90, type=int), 365))
+        params = {
+            'rsi_period': request.args.get('period', type=int),
+            'bb_window': request.args.get('bb_period', type=int),
+            'bb_std': request.args.get('bb_std', type=float),
+        }
+        if request.args.get('ma'):
+            params['ma_windows'] = [int(window) for window in request.args['ma'].split(',')]
+        if request.args.get('macd'):
+            params['macd_fast'], params['macd_slow'], params['macd_signal'] = (
+                int(value) for value in request.args['macd'].split(','))
+
+        series = get_indicator_series(stock_code, days, names, params)
+        if series is None:
+            return jsonify({'success': False, 'error': '無法獲取圖表資料', 'timestamp': _now_iso()}), 404
+        return jsonify({'success': True, 'data': series, 'timestamp': _now_iso()})
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e), 'timestamp': _now_iso()}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e), 'timestamp': _now_iso()}), 500
+
+
+@api_bp.route('/stock/<stock_code>/score-history')
+def api_stock_score_history(stock_code):
+    """
+    GET /api/stock/<code>/score-history?days=30 - 評分走勢
+    每筆包含評分與指標快照（current_price、rsi、macd、histogram、ma20、price_change_5d、volume），
+    較舊的資料為每日 / 每週彙整後的最後一筆（resolution）
+    """
+    try:
+        from datetime import timedelta
+        from utils.score_history import score_series
+
+        days = max(1, min(request.args.get('days', 30, type=int), 3650))
+        series = score_series(stock_code.strip().upper(), start=datetime.now() - timedelta(days=days))
+        return jsonify({'success': True, 'stock_code': stock_code, 'data': series, 'timestamp': _now_iso()})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e), 'timestamp': _now_iso()}), 500
+
+
 @api_bp.route('/market')
 def api_market():
     """GET /api/market - 大盤指數"""
@@ -97,25 +180,46 @@ def api_market():
 def api_popular():
     """GET /api/popular - 熱門股票清單"""
     try:
-        results = []
-        for code in POPULAR_CODES:
-            try:
-                info = get_stock_basic_info(code)
-                if info and not info.get('錯誤'):
-                    results.append({
-                        'code': code,
-                        'name': info.get('股票名稱', get_stock_name(code)),
-                        'price': info.get('收盤價', 'N/A'),
-                        'change': info.get('漲跌價差', 'N/A'),
-                        'change_percent': info.get('漲跌幅', 'N/A'),
-                    })
-            except Exception:
-                continue
+        quotes, _ = get_stocks_basic_info(POPULAR_CODES, current_app.config.get('QUOTES_WORKERS', 8))
+        results = [dict(code=code, **_compact_quote(code, info)) for code, info in quotes.items()]
         return jsonify({'success': True, 'data': results, 'timestamp': _now_iso()})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e), 'timestamp': _now_iso()}), 500
 
 
+@api_bp.route('/quotes', methods=['GET', 'POST'])
+def api_quotes():
+    """
+    GET /api/quotes?codes=2330,2317 或 POST {"codes": ["2330", ...]} - 批次報價
+    所有代號一次檢查快取，只查詢未命中的代號；回傳 {代號: 精簡報價} 與 {代號: 錯誤訊息}
+    """
+    try:
+        if request.method == 'POST':
+            codes = (request.get_json(silent=True) or {}).get('codes') or []
+            if isinstance(codes, str):
+                codes = codes.split(',')
+        else:
+            codes = request.args.get('codes', '').split(',')
+        codes = list(dict.fromkeys(str(code).strip() for code in codes if str(code).strip()))
+        max_batch = current_app.config.get('QUOTES_MAX_BATCH', 100)
+        if not codes:
+            raise ValueError('請指定 codes')
+        if len(codes) > max_batch:
+            raise ValueError(f'一次最多查詢 {max_batch} 檔股票（目前 {len(codes)} 檔）')
+        quotes, errors = get_stocks_basic_info(codes, current_app.config.get('QUOTES_WORKERS', 8))
+        return jsonify({
+            'success': True,
+            'data': {code: _compact_quote(code, info) for code, info in quotes.items()},
+            'errors': errors,
+            'count': len(quotes),
+            'timestamp': _now_iso(),
+        })
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e), 'timestamp': _now_iso()}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e), 'timestamp': _now_iso()}), 500
+
+
 @api_bp.route('/search')
 def api_search():
     """GET /api/search?q=<query>&limit=10 - 股票代號模糊搜尋"""
@@ -129,7 +233,7 @@ def api_search():
             s for s in _SEARCH_INDEX
             if q_lower in s['code'].lower() or q in s['name']
         ]
-        if not results:
+        if not results and not is_unknown_symbol(q.upper()):
             results = [{'code': q.upper(), 'name': get_stock_name(q.upper())}]
         return jsonify({'results': results[:limit]})
     except Exception as e:
@@ -155,6 +259,9 @@ def api_add_to_watchlist():
         if existing:
             return jsonify({'success': False, 'message': '該股票已在自選股中'})
 
+        if is_unknown_symbol(stock_code):
+            return jsonify({'success': False, 'message': '無法找到此股票代號'})
+
         stock_name = get_stock_name(stock_code)
         item = Watchlist(
             user_id=current_user.id,
@@ -173,42 +280,145 @@ def api_add_to_watchlist():
 
 # ── 選股 API ───────────────────────────────────────────
 
+# 串流選股的取消請求記錄於共用檔案快取（stream_cancel_<id>），多個 worker 下
+# 取消端點不必與串流落在同一個行程；串流所在行程每隔此秒數檢查一次
+STREAM_CANCEL_POLL = 1.0
+
+
+def _watch_stream_cancel(stream_id: str, cancel_event: threading.Event) -> None:
+    """輪詢共用快取中的取消記錄，出現時設定取消事件；串流結束（事件已設定）即停止"""
+    from utils.cache import has_fresh_cache
+
+    while not cancel_event.wait(STREAM_CANCEL_POLL):
+        if has_fresh_cache(f'stream_cancel_{stream_id}'):
+            cancel_event.set()
+
+
+def _screener_criteria(criteria) -> dict:
+    """
+    整理選股條件；選股範圍包含自選股時，於請求內先取得登入使用者的清單
+    :raises PermissionError: 非 VIP 會員使用自訂指標
+    """
+    criteria = dict(criteria or {})
+    if criteria.get('custom_indicators') and not (
+            current_user.is_authenticated
+            and current_user.get_membership_features().get('custom_indicators')):
+        raise PermissionError('自訂指標為 VIP 會員功能')
+    if 'watchlist' in str(criteria.get('universe', '')):
+        criteria['watchlist'] = [
+            item.stock_code for item in Watchlist.query.filter_by(user_id=current_user.id)
+        ] if current_user.is_authenticated else []
+    return criteria
+
+
+@api_bp.errorhandler(PermissionError)
+def _permission_denied(error):
+    return jsonify({'success': False, 'error': str(error), 'timestamp': _now_iso()}), 403
+
+
+def _event_stream(events, ndjson: bool, on_close=None):
+    """
+    將事件 dict 序列包成串流回應：預設為 Server-Sent Events，ndjson 時每行一個 JSON 物件
+    :param on_close: 串流結束或用戶端斷線時呼叫
+    """
+    import json
+    from flask import Response, stream_with_context
+
+    def _format(event):
+        payload = json.dumps(event, ensure_ascii=False, default=str)
+        if ndjson:
+            return payload + '\n'
+        return f"event: {event['type']}\ndata: {payload}\n\n"
+
+    def _generate():
+        try:
+            for event in events:
+                yield _format(event)
+        except Exception as e:
+            print(f"串流選股錯誤: {e}")
+            yield _format({'type': 'error', 'error': f'選股處理失敗: {e}'})
+        finally:
+            if on_close:
+                on_close()
+
+    return Response(
+        stream_with_context(_generate()),
+        mimetype='application/x-ndjson' if ndjson else 'text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
+
+
 @api_bp.route('/screener', methods=['POST'])
 def api_stock_screener():
-    """POST /api/screener - 股票篩選（Windows 線程超時版）"""
+    """
+    POST /api/screener - 股票篩選
+    每日選股表可用時以索引範圍查詢回應；否則（或 criteria.source 為 live）先查選股結果快取
+    （可由較寬鬆條件的結果重新過濾），再以即時選股工作篩選，相同條件共用同一個工作，最多等待 60 秒
+    """
     try:
+        from utils import screener_cache
+        from utils.screener_jobs import get_job_queue
+        from utils.screening_table import screen_from_table
         from utils.stock_screener import StockScreener
 
-        criteria = (request.get_json() or {}).get('criteria', {})
+        criteria = _screener_criteria((request.get_json() or {}).get('criteria', {}))
         print(f"🔍 收到選股請求，條件: {criteria}")
 
-        screener = StockScreener()
-        results = []
-        error_box = [None]
+        try:
+            table = screen_from_table(criteria) if criteria.get('source') != 'live' else None
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e), 'timestamp': _now_iso()}), 400
+        if table is not None:
+            results = table['results']
+            print(f"✅ 選股表查詢完成（{table['elapsed_ms']} ms），回傳 {len(results)} 支股票")
+            return jsonify({
+                'success': True,
+                'results': results,
+                'total_count': len(results),
+                'criteria': criteria,
+                'source': 'table',
+                'data_date': table['data_date'],
+                'message': f'成功篩選出 {len(results)} 支股票',
+                'timestamp': _now_iso(),
+            })
 
-        def _run():
-            try:
-                results.extend(screener.screen_stocks(criteria))
-            except Exception as e:
-                error_box[0] = e
+        try:
+            screener = StockScreener()
+            cached = screener_cache.lookup(screener, screener.validate_criteria(criteria))
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e), 'timestamp': _now_iso()}), 400
+        if cached is not None:
+            results = cached['results'][:30]
+            print(f"✅ 選股結果快取命中（{'相同條件' if cached['exact'] else '由較寬鬆條件過濾'}），"
+                  f"回傳 {len(results)} 支股票")
+            return jsonify({
+                'success': True,
+                'results': results,
+                'total_count': len(results),
+                'criteria': criteria,
+                'source': 'cache',
+                'cached_at': datetime.fromtimestamp(cached['cached_at']).isoformat(),
+                'message': f'成功篩選出 {len(results)} 支股票',
+                'timestamp': _now_iso(),
+            })
 
-        t = threading.Thread(target=_run, daemon=True)
-        t.start()
-        t.join(timeout=60)
+        try:
+            job, _ = get_job_queue().submit(criteria)
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e), 'timestamp': _now_iso()}), 400
 
-        if t.is_alive():
+        if not job.wait(timeout=60):
             return jsonify({
                 'success': False,
                 'error': '處理時間過長，請稍後再試或調整篩選條件',
+                'job_id': job.id,
                 'timestamp': _now_iso(),
             }), 408
 
-        if error_box[0]:
-            raise error_box[0]
-
-        if not isinstance(results, list):
-            results = []
+        if job.status != 'done':
+            raise RuntimeError(job.error)
 
+        results = job.results if isinstance(job.results, list) else []
         results = results[:30]
         print(f"✅ 選股完成，回傳 {len(results)} 支股票")
 
@@ -217,10 +427,14 @@ def api_stock_screener():
             'results': results,
             'total_count': len(results),
             'criteria': criteria,
+            'job_id': job.id,
+            'source': 'live',
             'message': f'成功篩選出 {len(results)} 支股票',
             'timestamp': _now_iso(),
         })
 
+    except PermissionError:
+        raise
     except ImportError:
         return jsonify({
             'success': False,
@@ -236,17 +450,347 @@ def api_stock_screener():
         }), 500
 
 
+@api_bp.route('/screener/stream', methods=['GET', 'POST'])
+def api_stock_screener_stream():
+    """
+    GET|POST /api/screener/stream - 串流選股結果
+    每找到一支符合條件的股票即送出 result 事件，並穿插 progress 事件（processed / errors / found），
+    最後以 done 事件結束。預設為 Server-Sent Events；?format=ndjson 時每行一個 JSON 物件。
+    GET 以 ?criteria=<JSON> 傳入條件（供 EventSource 使用）。
+    用戶端斷線或呼叫 /api/screener/stream/<stream_id>/cancel 時停止上游抓取。
+    """
+    import json
+    import uuid
+    import itertools
+    from utils.cache import clear_cache, save_cache
+    from utils.stock_screener import StockScreener
+
+    if request.method == 'POST':
+        criteria = (request.get_json(silent=True) or {}).get('criteria', {})
+    else:
+        try:
+            criteria = json.loads(request.args.get('criteria') or '{}')
+        except ValueError:
+            criteria = None
+    if not isinstance(criteria, dict):
+        return jsonify({'success': False, 'error': 'criteria 必須為 JSON 物件', 'timestamp': _now_iso()}), 400
+    criteria = _screener_criteria(criteria)
+    ndjson = request.args.get('format') == 'ndjson'
+
+    stream_id = uuid.uuid4().hex
+    cancel_event = threading.Event()
+    events = StockScreener().iter_screen(criteria, cancel_event=cancel_event)
+    try:
+        # 先取得 start 事件，條件不合法時直接回傳 400
+        first = next(events)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e), 'timestamp': _now_iso()}), 400
+    first['stream_id'] = stream_id
+    save_cache(f'stream_{stream_id}', True)
+    threading.Thread(target=_watch_stream_cancel, args=(stream_id, cancel_event),
+                     daemon=True).start()
+
+    def _close():
+        # 用戶端斷線時 WSGI 伺服器會關閉串流，一併停止上游抓取
+        cancel_event.set()
+        events.close()
+        clear_cache(f'stream_{stream_id}')
+        clear_cache(f'stream_cancel_{stream_id}')
+
+    return _event_stream(itertools.chain([first], events), ndjson, on_close=_close)
+
+
+@api_bp.route('/screener/stream/<stream_id>/cancel', methods=['POST'])
+def api_stock_screener_stream_cancel(stream_id):
+    """
+    POST /api/screener/stream/<stream_id>/cancel - 取消進行中的串流選股
+    取消請求寫入共用快取，由串流所在的 worker 於 STREAM_CANCEL_POLL 秒內接手停止
+    """
+    from utils.cache import has_fresh_cache, save_cache
+
+    if not has_fresh_cache(f'stream_{stream_id}'):
+        return jsonify({'success': False, 'error': '找不到此選股串流', 'timestamp': _now_iso()}), 404
+    save_cache(f'stream_cancel_{stream_id}', True)
+    return jsonify({'success': True, 'stream_id': stream_id, 'timestamp': _now_iso()})
+
+
+@api_bp.route('/screener/jobs', methods=['POST'])
+def api_screener_job_create():
+    """
+    POST /api/screener/jobs - 建立或加入選股工作
+    相同條件（正規化後）進行中或尚在保留期限內的工作直接共用，回傳其 job_id
+    """
+    from utils.screener_jobs import get_job_queue
+
+    criteria = _screener_criteria((request.get_json(silent=True) or {}).get('criteria', {}))
+    try:
+        job, created = get_job_queue().submit(criteria)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e), 'timestamp': _now_iso()}), 400
+    return jsonify({
+        'success': True,
+        'job': job.to_dict(),
+        'created': created,
+        'timestamp': _now_iso(),
+    }), 201 if created else 200
+
+
+@api_bp.route('/screener/jobs/<job_id>')
+def api_screener_job(job_id):
+    """GET /api/screener/jobs/<job_id> - 查詢選股工作狀態；完成後包含結果"""
+    from utils.screener_jobs import get_job_queue
+
+    job = get_job_queue().get(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': '找不到此選股工作或結果已過期', 'timestamp': _now_iso()}), 404
+    return jsonify({'success': True, 'job': job.to_dict(), 'timestamp': _now_iso()})
+
+
+@api_bp.route('/screener/jobs/<job_id>/events')
+def api_screener_job_events(job_id):
+    """
+    GET /api/screener/jobs/<job_id>/events - 訂閱選股工作事件
+    先重播已發生的事件，再持續送出新事件直到工作完成（格式同 /api/screener/stream）。
+    訂閱者斷線不影響工作本身。
+    """
+    from utils.screener_jobs import get_job_queue
+
+    job = get_job_queue().get(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': '找不到此選股工作或結果已過期', 'timestamp': _now_iso()}), 404
+    return _event_stream(job.iter_events(timeout=60), request.args.get('format') == 'ndjson')
+
+
+@api_bp.route('/screener/live', methods=['POST'])
+def api_live_screen_create():
+    """
+    POST /api/screener/live - 登記即時選股
+    背景報價輪詢每次更新時增量重算受影響股票的評分並維護排名；相同條件共用同一個即時選股
+    """
+    from utils.live_screener import get_registry
+
+    criteria = _screener_criteria((request.get_json(silent=True) or {}).get('criteria', {}))
+    try:
+        screen, created = get_registry().register(criteria)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e), 'timestamp': _now_iso()}), 400
+    return jsonify({
+        'success': True,
+        'screen': screen.to_dict(limit=30),
+        'created': created,
+        'timestamp': _now_iso(),
+    }), 201 if created else 200
+
+
+@api_bp.route('/screener/live/<screen_id>', methods=['GET', 'DELETE'])
+def api_live_screen(screen_id):
+    """
+    GET /api/screener/live/<screen_id>?limit=30 - 目前排名
+    DELETE /api/screener/live/<screen_id> - 取消登記
+    """
+    from utils.live_screener import get_registry
+
+    if request.method == 'DELETE':
+        if not get_registry().unregister(screen_id):
+            return jsonify({'success': False, 'error': '找不到此即時選股', 'timestamp': _now_iso()}), 404
+        return jsonify({'success': True, 'screen_id': screen_id, 'timestamp': _now_iso()})
+
+    screen = get_registry().get(screen_id)
+    if screen is None:
+        return jsonify({'success': False, 'error': '找不到此即時選股', 'timestamp': _now_iso()}), 404
+    limit = request.args.get('limit', 30, type=int)
+    return jsonify({'success': True, 'screen': screen.to_dict(limit=limit), 'timestamp': _now_iso()})
+
+
+@api_bp.route('/screener/live/<screen_id>/events')
+def api_live_screen_events(screen_id):
+    """
+    GET /api/screener/live/<screen_id>/events - 訂閱即時選股事件
+    先送出目前排名（snapshot），之後每當股票進入或離開選股結果時送出 entered / left 事件，
+    閒置時定期送出 heartbeat（格式同 /api/screener/stream）
+    """
+    from utils.live_screener import get_registry
+
+    screen = get_registry().get(screen_id)
+    if screen is None:
+        return jsonify({'success': False, 'error': '找不到此即時選股', 'timestamp': _now_iso()}), 404
+    cancel_event = threading.Event()
+    return _event_stream(screen.iter_events(cancel_event=cancel_event),
+                         request.args.get('format') == 'ndjson', on_close=cancel_event.set)
+
+
+@api_bp.route('/screener/score-changes')
+def api_screener_score_changes():
+    """
+    GET /api/screener/score-changes?days=7&direction=up&limit=20 - 評分與排名變化
+    比較 days 天前與現在各股票的最後一筆評分及全市場名次，依評分變化排序
+    （up 為進步最多、down 為退步最多）
+    """
+    try:
+        from datetime import timedelta
+        from utils.score_history import rank_changes
+
+        days = max(1, min(request.args.get('days', 7, type=int), 3650))
+        limit = max(1, min(request.args.get('limit', 20, type=int), 200))
+        direction = request.args.get('direction', 'up')
+        changes = rank_changes(datetime.now() - timedelta(days=days), limit=limit, direction=direction)
+        return jsonify({'success': True, 'days': days, 'direction': direction, 'data': changes,
+                        'timestamp': _now_iso()})
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e), 'timestamp': _now_iso()}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e), 'timestamp': _now_iso()}), 500
+
+
+@api_bp.route('/scanner/unusual')
+def api_scanner_unusual():
+    """
+    GET /api/scanner/unusual?type=volume&limit=50 - 異常交易（爆量、跳空、波幅異常、接近漲跌停）
+    由記憶體中最新一次的全市場快照掃描結果回應；type 可為 volume、gap、range、limit_up、limit_down、limit
+    """
+    try:
+        from utils.unusual_activity import get_latest, get_scanner
+
+        limit = max(1, min(request.args.get('limit', 50, type=int), 500))
+        flag_type = request.args.get('type', '').strip() or None
+        latest = get_latest()
+        results = get_scanner().results(flag_type, limit)
+        if latest is None:
+            return jsonify({'success': False, 'error': '尚無掃描結果', 'timestamp': _now_iso()}), 503
+        return jsonify({
+            'success': True,
+            'date': latest['date'],
+            'scanned_at': latest['scanned_at'],
+            'symbols': latest['symbols'],
+            'thresholds': latest['thresholds'],
+            'count': len(results),
+            'data': results,
+            'timestamp': _now_iso(),
+        })
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e), 'timestamp': _now_iso()}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e), 'timestamp': _now_iso()}), 500
+
+
 @api_bp.route('/screener/strategies')
 def api_screener_strategies():
     """GET /api/screener/strategies - 取得預設選股策略"""
     try:
         from utils.stock_screener import StockScreener
+        from utils.universe import available_universes
+        from utils.criteria_expr import FIELDS
         screener = StockScreener()
         return jsonify({
             'success': True,
             'strategies': screener.get_preset_strategies(),
+            'universes': available_universes(),
+            'expression_fields': sorted(FIELDS),
             'timestamp': _now_iso(),
         })
     except Exception as e:
         print(f"取得策略錯誤: {e}")
         return jsonify({'success': False, 'error': str(e), 'timestamp': _now_iso()}), 500
+
+
+# ── 管理 API ───────────────────────────────────────────
+
+@api_bp.route('/admin/cache/stats')
+@_admin_required
+def api_admin_cache_stats():
+    """GET /api/admin/cache/stats - 快取命中率與延遲統計（合併所有 worker）"""
+    try:
+        from utils.cache import namespace_policies
+        from utils.cache_stats import aggregate_stats
+        return jsonify({
+            'success': True,
+            'data': aggregate_stats(),
+            'policies': namespace_policies(),
+            'timestamp': _now_iso(),
+        })
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e), 'timestamp': _now_iso()}), 500
+
+
+@api_bp.route('/admin/cache/stats/reset', methods=['POST'])
+@_admin_required
+def api_admin_cache_stats_reset():
+    """POST /api/admin/cache/stats/reset - 清空快取統計"""
+    try:
+        from utils.cache_stats import reset_stats
+        reset_stats()
+        return jsonify({'success': True, 'timestamp': _now_iso()})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e), 'timestamp': _now_iso()}), 500
+
+
+@api_bp.route('/admin/screener/refresh', methods=['POST'])
+@_admin_required
+def api_admin_screener_refresh():
+    """
+    POST /api/admin/screener/refresh - 盤中以即時資料更新選股表中評分最高的熱門股
+    body: {"limit": 50}
+    """
+    try:
+        from utils.screening_table import HOT_SUBSET_SIZE, refresh_hot_subset, table_status
+        limit = int((request.get_json(silent=True) or {}).get('limit') or HOT_SUBSET_SIZE)
+        if not 1 <= limit <= 500:
+            raise ValueError('limit 必須介於 1 到 500')
+        updated = refresh_hot_subset(limit)
+        return jsonify({'success': True, 'updated': updated, 'table': table_status(),
+                        'timestamp': _now_iso()})
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e), 'timestamp': _now_iso()}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e), 'timestamp': _now_iso()}), 500
+
+
+@api_bp.route('/admin/score-history/rollup', methods=['POST'])
+@_admin_required
+def api_admin_score_history_rollup():
+    """
+    POST /api/admin/score-history/rollup - 將舊的評分歷史降採樣為每日 / 每週一筆
+    body: {"raw_days": 14, "daily_days": 180}
+    """
+    try:
+        from utils.score_history import DAILY_DAYS, RAW_DAYS, flush, rollup
+        data = request.get_json(silent=True) or {}
+        raw_days = int(data.get('raw_days') or RAW_DAYS)
+        daily_days = int(data.get('daily_days') or DAILY_DAYS)
+        if not 1 <= raw_days <= daily_days:
+            raise ValueError('raw_days 必須介於 1 到 daily_days')
+        flush()
+        return jsonify({'success': True, 'data': rollup(raw_days, daily_days), 'timestamp': _now_iso()})
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e), 'timestamp': _now_iso()}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e), 'timestamp': _now_iso()}), 500
+
+
+@api_bp.route('/admin/cache/invalidate', methods=['POST'])
+@_admin_required
+def api_admin_cache_invalidate():
+    """
+    POST /api/admin/cache/invalidate - 批次使快取失效
+    body: {"namespace": "chart", "purge": false} 或 {"symbol": "2330"}
+    """
+    from utils.cache import invalidate_namespace, invalidate_symbol
+
+    data = request.get_json() or {}
+    namespace = (data.get('namespace') or '').strip()
+    symbol = (data.get('symbol') or '').strip().upper()
+    try:
+        if namespace:
+            generation = invalidate_namespace(namespace, purge=bool(data.get('purge')))
+            return jsonify({'success': True, 'namespace': namespace,
+                            'generation': generation, 'timestamp': _now_iso()})
+        if symbol:
+            generation = invalidate_symbol(symbol)
+            return jsonify({'success': True, 'symbol': symbol,
+                            'generation': generation, 'timestamp': _now_iso()})
+        return jsonify({'success': False, 'error': '請指定 namespace 或 symbol',
+                        'timestamp': _now_iso()}), 400
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e), 'timestamp': _now_iso()}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e), 'timestamp': _now_iso()}), 500
@@ -18,6 +18,34 @@ class BaseConfig:
     # 快取設定
     CACHE_DURATION = int(os.environ.get('CACHE_DURATION', 300))  # 5 分鐘
     CACHE_DIR = os.environ.get('CACHE_DIR', 'cache')
+    CACHE_MAX_ENTRIES = int(os.environ.get('CACHE_MAX_ENTRIES', 5000))
+    CACHE_MAX_BYTES = int(os.environ.get('CACHE_MAX_BYTES', 50 * 1024 * 1024))
+    CACHE_SWEEP_INTERVAL = int(os.environ.get('CACHE_SWEEP_INTERVAL', 600))  # 10 分鐘
+    CACHE_SWEEPER_ENABLED = True
+
+    # 記憶體快取層與啟動預熱快照
+    CACHE_MEMORY_MAX_ENTRIES = int(os.environ.get('CACHE_MEMORY_MAX_ENTRIES', 2000))
+    CACHE_SNAPSHOT_INTERVAL = int(os.environ.get('CACHE_SNAPSHOT_INTERVAL', 120))  # 2 分鐘
+    CACHE_SNAPSHOT_ENABLED = True
+
+    # 評分歷史：分析結果先放進記憶體緩衝區，背景執行緒定期批次寫入
+    SCORE_HISTORY_FLUSH_INTERVAL = int(os.environ.get('SCORE_HISTORY_FLUSH_INTERVAL', 30))
+    SCORE_HISTORY_ENABLED = True
+
+    # 負向快取：查無資料的股票代號短暫快取，連續查無時有效時間加倍
+    NEGATIVE_CACHE_TTL = int(os.environ.get('NEGATIVE_CACHE_TTL', 60))
+    NEGATIVE_CACHE_MAX_TTL = int(os.environ.get('NEGATIVE_CACHE_MAX_TTL', 3600))
+
+    # 批次報價 /api/quotes：每次請求最多的股票數、未命中快取時的並行查詢數
+    QUOTES_MAX_BATCH = int(os.environ.get('QUOTES_MAX_BATCH', 100))
+    QUOTES_WORKERS = int(os.environ.get('QUOTES_WORKERS', 8))
+
+    # 管理端點：以 X-Admin-Token 標頭或登入帳號（ADMIN_USERNAMES，逗號分隔）授權
+    ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN')
+    ADMIN_USERNAMES = [
+        name.strip() for name in os.environ.get('ADMIN_USERNAMES', '').split(',')
+        if name.strip()
+    ]
 
     # 熱門股票清單
     POPULAR_STOCK_CODES = [
@@ -39,6 +67,9 @@ class TestingConfig(BaseConfig):
     TESTING = True
     SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
     WTF_CSRF_ENABLED = False
+    CACHE_SWEEPER_ENABLED = False
+    CACHE_SNAPSHOT_ENABLED = False
+    SCORE_HISTORY_ENABLED = False
 
 
 class ProductionConfig(BaseConfig):
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+技術指標效能測試
+比較逐支股票的 list 版本（StockScreener.calculate_technical_indicators）
+與向量化引擎（utils/indicators.py）在整個股票池上的耗時
+
+用法：python benchmarks/bench_indicators.py [--symbols 2000] [--days 250] [--repeat 3]
+"""
+
+import os
+import sys
+import time
+import argparse
+
+# 確保可以導入 utils 模組
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if parent_dir not in sys.path:
+    sys.path.insert(0, parent_dir)
+
+from utils import indicators
+from utils.stock_screener import StockScreener
+from synthetic_market import SyntheticMarket
+
+
+def best_of(repeat, func):
+    """執行 repeat 次，回傳最短耗時（秒）"""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='技術指標效能測試')
+    parser.add_argument('--symbols', type=int, default=2000)
+    parser.add_argument('--days', type=int, default=250)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    matrix = SyntheticMarket(args.symbols, args.days).close
+    price_lists = matrix.tolist()
+    screener = StockScreener()
+
+    print(f"📊 {args.symbols} 支股票 × {args.days} 天，取 {args.repeat} 次最佳")
+
+    list_time = best_of(args.repeat, lambda: [
+        screener.calculate_technical_indicators(prices) for prices in price_lists
+    ])
+    print(f"🐢 逐支 list 計算（最新值）: {list_time * 1000:10.1f} ms")
+
+    batch_time = best_of(args.repeat, lambda: screener.calculate_indicators_batch(price_lists))
+    print(f"🚀 向量化批次計算（最新值）: {batch_time * 1000:10.1f} ms  ({list_time / batch_time:.1f}x)")
+
+    full_time = best_of(args.repeat, lambda: indicators.compute_all(matrix))
+    print(f"📈 向量化完整序列 compute_all: {full_time * 1000:10.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+多行程指標計算效能測試
+比較本行程的向量化計算（indicators.compute_all）與行程池分塊計算
+（parallel_indicators.compute_all）在不同股票池大小下的耗時，
+找出改用行程池划算的最小股票數（設定為 INDICATOR_PARALLEL_MIN_SYMBOLS）
+
+用法：python benchmarks/bench_parallel_indicators.py [--sizes 250,500,1000,2000,4000,8000]
+          [--days 250] [--processes 4] [--repeat 3]
+"""
+
+import os
+import sys
+import argparse
+
+import numpy as np
+
+# 確保可以導入 utils 模組
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if parent_dir not in sys.path:
+    sys.path.insert(0, parent_dir)
+
+from utils import indicators
+from utils import parallel_indicators
+from bench_indicators import best_of
+from synthetic_market import SyntheticMarket
+
+
+def main():
+    parser = argparse.ArgumentParser(description='多行程指標計算效能測試')
+    parser.add_argument('--sizes', default='250,500,1000,2000,4000,8000', help='股票數，以逗號分隔')
+    parser.add_argument('--days', type=int, default=250)
+    parser.add_argument('--processes', type=int, default=parallel_indicators.PROCESSES)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(',')]
+    print(f"📊 {args.days} 天，{args.processes} 個行程，取 {args.repeat} 次最佳")
+    if args.processes <= 1:
+        print("⚠️ 只有 1 個行程，行程池不會比本行程計算快")
+
+    # 先暖機，讓行程池的啟動成本不計入量測
+    parallel_indicators.compute_all(SyntheticMarket(args.processes * 2, args.days).close,
+                                    processes=args.processes, min_symbols=0)
+
+    crossover = None
+    print(f"{'股票數':>8}{'本行程 (ms)':>14}{'行程池 (ms)':>14}{'加速':>8}")
+    print("-" * 46)
+    for size in sizes:
+        matrix = SyntheticMarket(size, args.days).close
+        expected = indicators.compute_all(matrix)
+        actual = parallel_indicators.compute_all(matrix, processes=args.processes, min_symbols=0)
+        for name, values in expected.items():
+            np.testing.assert_allclose(actual[name], values, equal_nan=True)
+
+        serial = best_of(args.repeat, lambda: indicators.compute_all(matrix))
+        pooled = best_of(args.repeat, lambda: parallel_indicators.compute_all(
+            matrix, processes=args.processes, min_symbols=0))
+        print(f"{size:>8}{serial * 1000:>14.1f}{pooled * 1000:>14.1f}{serial / pooled:>7.2f}x")
+        if crossover is None and pooled < serial:
+            crossover = size
+
+    parallel_indicators.shutdown()
+    if crossover is None:
+        print("🐢 測試範圍內行程池都沒有比較快，建議維持本行程計算")
+    else:
+        print(f"🚀 建議 INDICATOR_PARALLEL_MIN_SYMBOLS={crossover}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+選股效能測試
+以合成行情（synthetic_market.py，固定種子可重現）替換上游抓取，分段量測 StockScreener：
+  fetch       逐檔 fetch_inputs（報價與日線由合成行情回應，不發出網路請求）
+  prepare     解析日線價格、檢查分析快取
+  indicators  批次計算技術指標（calculate_indicators_batch）
+  changes     價格變化（calculate_price_changes）
+  signals     產生訊號（generate_signals）
+  scoring     評分（calculate_score）
+  filtering   向量化條件遮罩與 top-k（select_top）
+  filter_loop 逐筆 meets_criteria 後排序
+  end_to_end  價格歷史庫全市場篩選（screen_history）
+每段記錄耗時（取 --repeat 次最佳）、吞吐量（股票數 / 秒）與 tracemalloc 記憶體峰值，
+並與基準檔比較：耗時或記憶體超過基準 (1 + --tolerance) 倍即標示為退步，結束碼為 1。
+
+用法：python benchmarks/bench_screener.py [--symbols 2000] [--days 120] [--repeat 3]
+          [--baseline benchmarks/baselines/screener.json] [--save-baseline] [--tolerance 0.2]
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import tracemalloc
+
+# 確保可以導入 utils 模組
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if parent_dir not in sys.path:
+    sys.path.insert(0, parent_dir)
+
+# 使用暫存快取目錄，避免讀到既有的分析快取或汙染正式快取
+os.environ.setdefault('CACHE_DIR', tempfile.mkdtemp(prefix='bench_screener_'))
+
+import numpy as np
+
+import utils.stock_screener as stock_screener
+from utils.stock_screener import StockScreener
+from synthetic_market import SyntheticMarket
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines', 'screener.json')
+
+# 差距小於此值視為量測雜訊，不標示退步
+MIN_SECONDS_DELTA = 0.002
+MIN_MEMORY_DELTA_MB = 1.0
+
+CRITERIA = {'min_rsi': 20, 'max_rsi': 80, 'min_score': 50, 'price_trend': 'any', 'volume_filter': True}
+
+
+def install_stub(market: SyntheticMarket, screener: StockScreener) -> None:
+    """以合成行情回應上游抓取，並關閉速率限制（不會真的發出請求）"""
+    stock_screener.get_stock_basic_info = market.basic_info
+    stock_screener.get_stock_chart_data = market.chart_data
+    screener._throttle = lambda cache_key: None
+
+
+def measure(func, symbols: int, repeat: int) -> dict:
+    """量測一個階段：最佳耗時、吞吐量與 tracemalloc 記憶體峰值（另外執行一次，不影響計時）"""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    seconds = min(timings)
+
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        'seconds': round(seconds, 6),
+        'throughput': round(symbols / seconds, 1) if seconds > 0 else None,
+        'peak_mb': round(peak / 1024 / 1024, 3),
+    }
+
+
+def run_stages(market: SyntheticMarket, repeat: int) -> dict:
+    screener = StockScreener()
+    install_stub(market, screener)
+    criteria = screener.validate_criteria(CRITERIA)
+    codes = market.codes
+    symbols = len(codes)
+    state = {}
+
+    def fetch():
+        state['inputs'] = [(code,) + screener.fetch_inputs(code) for code in codes]
+
+    def prepare():
+        prepared = []
+        for code, basic_info, chart_data in state['inputs']:
+            _, prices, _, _ = screener._prepare_analysis(code, basic_info, chart_data)
+            prepared.append((code, basic_info, prices))
+        state['prepared'] = prepared
+
+    def indicators():
+        state['indicators'] = screener.calculate_indicators_batch([item[2] for item in state['prepared']])
+
+    def changes():
+        analyses = []
+        for (code, basic_info, prices), values in zip(state['prepared'], state['indicators']):
+            analysis = {'stock_code': code, 'stock_name': basic_info['股票名稱'], 'current_price': prices[-1]}
+            analysis.update(screener.calculate_price_changes(prices))
+            analysis.update(values)
+            analysis['volume'] = screener.parse_volume(basic_info['成交量'])
+            analyses.append(analysis)
+        state['analyses'] = analyses
+
+    def signals():
+        for analysis in state['analyses']:
+            analysis['signals'] = screener.generate_signals(analysis)
+
+    def scoring():
+        for analysis in state['analyses']:
+            analysis['score'] = screener.calculate_score(analysis)
+
+    def filtering():
+        screener.select_top(state['analyses'], criteria)
+
+    def filter_loop():
+        results = [analysis for analysis in state['analyses'] if screener.meets_criteria(analysis, criteria)]
+        results.sort(key=lambda analysis: analysis['score'], reverse=True)
+        return results[:screener.max_results]
+
+    history = market.price_history()
+
+    def end_to_end():
+        screener.screen_history(codes, criteria, history)
+
+    stages = {}
+    stages_funcs = [('fetch', fetch), ('prepare', prepare), ('indicators', indicators), ('changes', changes),
+                    ('signals', signals), ('scoring', scoring), ('filtering', filtering),
+                    ('filter_loop', filter_loop), ('end_to_end', end_to_end)]
+    # 篩選過程的逐檔輸出會淹沒結果，量測期間暫時關閉標準輸出
+    stdout = sys.stdout
+    for name, func in stages_funcs:
+        sys.stdout = open(os.devnull, 'w')
+        try:
+            stages[name] = measure(func, symbols, repeat)
+        finally:
+            sys.stdout.close()
+            sys.stdout = stdout
+        print(f"  {name:<12}{stages[name]['seconds'] * 1000:>10.1f} ms{stages[name]['throughput'] or 0:>12,.0f}/s"
+              f"{stages[name]['peak_mb']:>10.1f} MB")
+    return stages
+
+
+def compare(stages: dict, baseline: dict, tolerance: float) -> list:
+    """與基準比較，回傳退步的項目"""
+    regressions = []
+    print(f"\n{'階段':<12}{'耗時比':>10}{'記憶體比':>10}  狀態")
+    print("-" * 46)
+    for name, current in stages.items():
+        base = baseline['stages'].get(name)
+        if base is None:
+            print(f"{name:<12}{'—':>10}{'—':>10}  🆕 無基準")
+            continue
+        time_ratio = current['seconds'] / base['seconds'] if base['seconds'] else 1.0
+        memory_ratio = current['peak_mb'] / base['peak_mb'] if base['peak_mb'] else 1.0
+        slower = (time_ratio > 1 + tolerance
+                  and current['seconds'] - base['seconds'] > MIN_SECONDS_DELTA)
+        bigger = (memory_ratio > 1 + tolerance
+                  and current['peak_mb'] - base['peak_mb'] > MIN_MEMORY_DELTA_MB)
+        status = '✅'
+        if slower or bigger:
+            status = '❌ 退步（' + '、'.join(label for label, flag in (('耗時', slower), ('記憶體', bigger)) if flag) + '）'
+            regressions.append(name)
+        elif time_ratio < 1 - tolerance:
+            status = '🚀 進步'
+        print(f"{name:<12}{time_ratio:>9.2f}x{memory_ratio:>9.2f}x  {status}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='選股效能測試')
+    parser.add_argument('--symbols', type=int, default=2000)
+    parser.add_argument('--days', type=int, default=120, help='合成行情交易日數（需大於日線天數 90）')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='基準檔路徑')
+    parser.add_argument('--save-baseline', action='store_true', help='將本次結果存為基準')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='允許的退步比例')
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    market = SyntheticMarket(args.symbols, args.days, args.seed)
+    print(f"🧪 合成行情：{args.symbols} 支股票 × {args.days} 天（種子 {args.seed}），"
+          f"產生耗時 {time.perf_counter() - started:.2f} 秒；各階段取 {args.repeat} 次最佳")
+    print(f"  {'階段':<10}{'耗時':>13}{'吞吐量':>11}{'記憶體峰值':>9}")
+
+    stages = run_stages(market, args.repeat)
+    report = {
+        'meta': {
+            'symbols': args.symbols, 'days': args.days, 'seed': args.seed,
+            'python': platform.python_version(), 'numpy': np.__version__,
+            'machine': platform.machine(), 'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+        'stages': stages,
+    }
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(args.baseline) or '.', exist_ok=True)
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n💾 已儲存基準: {args.baseline}")
+        return
+
+    if not os.path.exists(args.baseline):
+        print(f"\n💡 找不到基準檔 {args.baseline}，以 --save-baseline 建立")
+        return
+    with open(args.baseline, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    meta = baseline.get('meta', {})
+    if (meta.get('symbols'), meta.get('days'), meta.get('seed')) != (args.symbols, args.days, args.seed):
+        print(f"\n⚠️ 基準的資料規模不同（{meta.get('symbols')} 支 × {meta.get('days')} 天，種子 {meta.get('seed')}），"
+              f"無法比較")
+        return
+
+    regressions = compare(stages, baseline, args.tolerance)
+    if regressions:
+        print(f"\n❌ {len(regressions)} 個階段退步超過 {args.tolerance:.0%}: {', '.join(regressions)}")
+        sys.exit(1)
+    print(f"\n✅ 沒有超過 {args.tolerance:.0%} 的退步")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+合成行情產生器
+以固定亂數種子產生可重現的全市場日線：幾何布朗運動加上 Poisson 跳空（Merton 跳躍擴散），
+成交量為對數常態分布並隨當日漲跌幅放大。可輸出價格 / 成交量矩陣、價格歷史庫（PriceHistory），
+或與 utils/twse.py 相同格式的報價與日線資料（供效能測試替換上游抓取）。
+"""
+
+from datetime import date, timedelta
+
+import numpy as np
+
+
+class SyntheticMarket:
+    """
+    :param symbols: 股票數
+    :param days: 交易日數
+    :param seed: 亂數種子，相同參數產生相同資料
+    :param drift / volatility: 年化報酬與波動度（每支股票在 ±50% 範圍內隨機調整）
+    :param jump_rate: 每年平均跳空次數；jump_mean / jump_std 為跳空幅度（對數報酬）
+    """
+
+    def __init__(self, symbols: int = 2000, days: int = 250, seed: int = 42,
+                 drift: float = 0.06, volatility: float = 0.3,
+                 jump_rate: float = 4.0, jump_mean: float = -0.01, jump_std: float = 0.06):
+        rng = np.random.default_rng(seed)
+        dt = 1 / 252
+        sigma = volatility * rng.uniform(0.5, 1.5, size=(symbols, 1))
+        mu = drift * rng.uniform(0.5, 1.5, size=(symbols, 1))
+
+        diffusion = (mu - sigma ** 2 / 2) * dt + sigma * np.sqrt(dt) * rng.standard_normal((symbols, days))
+        jumps = rng.poisson(jump_rate * dt, size=(symbols, days))
+        jump_sizes = jumps * jump_mean + np.sqrt(jumps) * jump_std * rng.standard_normal((symbols, days))
+        log_returns = diffusion + jump_sizes
+
+        start = rng.uniform(10, 1000, size=(symbols, 1))
+        self.close = np.round(start * np.exp(np.cumsum(log_returns, axis=1)), 2)
+
+        # 成交量（張）：每支股票的基準量 × 對數常態雜訊 × 漲跌幅放大
+        base_volume = rng.lognormal(mean=7, sigma=1.2, size=(symbols, 1))
+        noise = rng.lognormal(mean=0, sigma=0.4, size=(symbols, days))
+        self.volume = np.round(base_volume * noise * (1 + 20 * np.abs(log_returns))).astype(np.int64)
+
+        self.codes = [f"{9000 + index:04d}" if index < 1000 else f"{90000 + index:05d}"
+                      for index in range(symbols)]
+        self.names = {code: f"合成{code}" for code in self.codes}
+        self.dates = self._trading_dates(days)
+        self._rows = {code: row for row, code in enumerate(self.codes)}
+
+    @staticmethod
+    def _trading_dates(days: int) -> list:
+        """由 2024-01-02 起算的平日日期（YYYYMMDD）"""
+        dates, current = [], date(2024, 1, 2)
+        while len(dates) < days:
+            if current.weekday() < 5:
+                dates.append(current.strftime('%Y%m%d'))
+            current += timedelta(days=1)
+        return dates
+
+    def price_history(self):
+        """轉為價格歷史庫（utils/price_history.PriceHistory）"""
+        from utils.price_history import PriceHistory
+        return PriceHistory(list(self.codes), list(self.dates), self.close.astype(float),
+                            self.volume.astype(float))
+
+    def basic_info(self, stock_code: str) -> dict:
+        """與 get_stock_basic_info 相同格式的報價（最後一個交易日）"""
+        row = self._rows.get(stock_code)
+        if row is None:
+            return {'股票代碼': stock_code, '錯誤': f'無法從任何資料來源獲取股票 {stock_code} 的資料'}
+        price, previous = self.close[row, -1], self.close[row, -2]
+        return {
+            '股票代碼': stock_code,
+            '股票名稱': self.names[stock_code],
+            '即時股價': f"{price:.2f}",
+            '收盤價': f"{price:.2f}",
+            '昨收': f"{previous:.2f}",
+            '漲跌': f"{price - previous:+.2f}",
+            '成交量': f"{int(self.volume[row, -1]):,}",
+            '資料來源': '合成行情',
+        }
+
+    def chart_data(self, stock_code: str, days: int = 7) -> dict:
+        """與 get_stock_chart_data 相同格式的日線（最近 days 個交易日）"""
+        row = self._rows.get(stock_code)
+        if row is None:
+            return {'success': False, 'error': f'查無 {stock_code} 的圖表資料'}
+        prices, volumes = self.close[row, -days:], self.volume[row, -days:]
+        dates = self.dates[-days:]
+        return {
+            'success': True,
+            'data': [{'time': f"{day[:4]}-{day[4:6]}-{day[6:]}", 'price': float(price), 'volume': int(volume)}
+                     for day, price, volume in zip(dates, prices, volumes)],
+        }
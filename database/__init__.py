@@ -3,7 +3,7 @@ Database 模組
 包含模型定義和資料庫管理工具
 """
 
-from .models import db, User, Watchlist, SearchHistory, PriceAlert
+from .models import db, User, Watchlist, SearchHistory, PriceAlert, ScreeningSnapshot, ScoreHistory
 
 __version__ = "2.0.0"
 
@@ -13,4 +13,6 @@ __all__ = [
     'Watchlist',
     'SearchHistory',
     'PriceAlert',
+    'ScreeningSnapshot',
+    'ScoreHistory',
 ]
\ No newline at end of file
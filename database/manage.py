@@ -253,6 +253,124 @@ def show_stats():
         print(f"❌ 統計資訊獲取失敗: {e}")
         return False
 
+def sweep_cache_dir():
+    """清理快取目錄（移除過期檔案並依容量上限淘汰）"""
+    print("🧹 清理快取目錄...")
+
+    try:
+        from utils.cache import sweep_cache
+        report = sweep_cache()
+        print("-" * 50)
+        print(f"📂 掃描檔案: {report['scanned']}")
+        print(f"📦 搬移至分片: {report['migrated']}")
+        print(f"⌛ 過期移除: {report['expired']}")
+        print(f"💥 毀損移除: {report['corrupt']}")
+        print(f"🗑️ 容量淘汰: {report['evicted']}")
+        print(f"💾 回收空間: {report['bytes_reclaimed']:,} bytes")
+        print(f"📊 剩餘: {report['entries']} 筆 / {report['bytes']:,} bytes")
+        print("-" * 50)
+        return True
+    except Exception as e:
+        print(f"❌ 快取清理失敗: {e}")
+        return False
+
+def show_cache_stats():
+    """顯示快取命中率與延遲統計（合併所有 worker）"""
+    print("📈 快取統計資訊...")
+
+    try:
+        from utils.cache_stats import aggregate_stats
+        stats = aggregate_stats()
+        print("-" * 90)
+        print(f"{'命名空間':<14}{'命中率':>8}{'命中':>8}{'未命中':>8}{'過期':>8}"
+              f"{'淘汰':>8}{'讀取KB':>10}{'寫入KB':>10}{'get ms':>9}{'set ms':>9}")
+        rows = list(stats['namespaces'].items()) + [('總計', stats['total'])]
+        for ns, entry in rows:
+            ratio = f"{entry['hit_ratio'] * 100:.1f}%" if entry['hit_ratio'] is not None else '-'
+            get_ms = f"{entry['get_avg_ms']:.2f}" if entry['get_avg_ms'] is not None else '-'
+            set_ms = f"{entry['set_avg_ms']:.2f}" if entry['set_avg_ms'] is not None else '-'
+            print(f"{ns:<14}{ratio:>8}{entry['hits']:>8}{entry['misses']:>8}"
+                  f"{entry['expirations']:>8}{entry['evictions']:>8}"
+                  f"{entry['bytes_read'] / 1024:>10.1f}{entry['bytes_written'] / 1024:>10.1f}"
+                  f"{get_ms:>9}{set_ms:>9}")
+        print(f"\n👷 統計來源 worker 數: {stats['workers']}")
+        print("-" * 90)
+        return True
+    except Exception as e:
+        print(f"❌ 快取統計獲取失敗: {e}")
+        return False
+
+def update_market_data():
+    """更新股票清單主檔與全市場價格歷史（建議每個交易日收盤後執行）"""
+    print("📥 更新股票清單與價格資料...")
+
+    try:
+        from utils.universe import refresh_listings, load_listings
+        from utils.price_history import update_price_history, backfill_price_history, load_price_history
+        print(f"📋 股票清單: {refresh_listings()} 筆")
+        report = update_price_history()
+        print(f"📈 {report['date']} 行情: {report['symbols']} 支股票")
+        print(f"📚 價格歷史: {report['total_symbols']} 支股票 × {report['days']} 個交易日")
+
+        history = load_price_history()
+        if history is not None and len(history.dates) < 60:
+            confirm = input("歷史資料不足 60 個交易日，是否逐檔回補近 90 天？(較慢) (y/N): ").lower()
+            if confirm == 'y':
+                codes = [row['code'] for row in load_listings()]
+                print(f"✅ 已回補 {backfill_price_history(codes)} 支股票")
+        return True
+    except Exception as e:
+        print(f"❌ 更新市場資料失敗: {e}")
+        return False
+
+def build_screening_table():
+    """以價格歷史庫重建每日選股表（建議在更新價格資料後執行）"""
+    print("🗂️ 重建每日選股表...")
+
+    try:
+        from database.models import db
+        from flask import Flask
+        from utils.screening_table import build_screening_table as build_table
+
+        app = Flask(__name__)
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///stock_app.db'
+        app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+        db.init_app(app)
+
+        with app.app_context():
+            # 首次執行時建立選股表
+            db.create_all()
+            report = build_table()
+        print(f"✅ {report['date']} 選股表: {report['rows']}/{report['symbols']} 支股票（{report['seconds']} 秒）")
+        return True
+    except Exception as e:
+        print(f"❌ 重建選股表失敗: {e}")
+        return False
+
+def rollup_score_history():
+    """將舊的評分歷史降採樣為每日 / 每週一筆（建議每日排程執行）"""
+    print("🗜️ 彙整評分歷史...")
+
+    try:
+        from database.models import db
+        from flask import Flask
+        from utils.score_history import rollup
+
+        app = Flask(__name__)
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///stock_app.db'
+        app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+        db.init_app(app)
+
+        with app.app_context():
+            db.create_all()
+            report = rollup()
+        print(f"✅ 原始紀錄 {report['raw_rows']} 筆 → 每日 {report['daily_rows']} 筆，"
+              f"每日紀錄 {report['daily_rolled']} 筆 → 每週 {report['weekly_rows']} 筆")
+        return True
+    except Exception as e:
+        print(f"❌ 彙整評分歷史失敗: {e}")
+        return False
+
 def main():
     """主函數"""
     print("🗄️ 資料庫管理工具")
@@ -265,9 +383,14 @@ def main():
         print("3. 備份資料庫")
         print("4. 重設資料庫")
         print("5. 顯示統計資訊")
+        print("6. 清理快取目錄")
+        print("7. 快取統計資訊")
+        print("8. 更新股票清單與價格資料")
+        print("9. 重建每日選股表")
+        print("10. 彙整評分歷史")
         print("0. 退出")
         
-        choice = input("\n請輸入選項 (0-5): ").strip()
+        choice = input("\n請輸入選項 (0-10): ").strip()
         
         if choice == '0':
             print("👋 再見！")
@@ -282,6 +405,16 @@ def main():
             reset_database()
         elif choice == '5':
             show_stats()
+        elif choice == '6':
+            sweep_cache_dir()
+        elif choice == '7':
+            show_cache_stats()
+        elif choice == '8':
+            update_market_data()
+        elif choice == '9':
+            build_screening_table()
+        elif choice == '10':
+            rollup_score_history()
         else:
             print("❌ 無效選項，請重新輸入")
 
@@ -161,4 +161,65 @@ class PriceAlert(db.Model):
     )
 
     def __repr__(self) -> str:
-        return f'<PriceAlert {self.user_id}:{self.stock_code}@{self.target_price}>'
\ No newline at end of file
+        return f'<PriceAlert {self.user_id}:{self.stock_code}@{self.target_price}>'
+
+
+class ScreeningSnapshot(db.Model):
+    """
+    每日選股表：收盤後批次寫入每支股票的分析結果，
+    選股條件（RSI、評分、5 日漲跌、成交量）以索引範圍查詢
+    """
+    __tablename__ = 'screening_snapshots'
+
+    id = db.Column(db.Integer, primary_key=True)
+    stock_code = db.Column(db.String(10), unique=True, nullable=False)
+    stock_name = db.Column(db.String(100))
+    data_date = db.Column(db.String(8), nullable=False)        # 行情日期 YYYYMMDD
+    current_price = db.Column(db.Float, nullable=False)
+    rsi = db.Column(db.Float, nullable=False)
+    score = db.Column(db.Integer, nullable=False)
+    price_change_5d = db.Column(db.Float, nullable=False, default=0)
+    volume = db.Column(db.Integer, nullable=False, default=0)
+    analysis = db.Column(db.Text, nullable=False)               # 完整分析結果（JSON）
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow,
+                            onupdate=datetime.utcnow, nullable=False)
+
+    __table_args__ = (
+        db.Index('idx_snapshot_score_rsi', 'score', 'rsi'),
+        db.Index('idx_snapshot_rsi', 'rsi'),
+        db.Index('idx_snapshot_change_5d', 'price_change_5d'),
+    )
+
+    def __repr__(self) -> str:
+        return f'<ScreeningSnapshot {self.stock_code}@{self.data_date}:{self.score}>'
+
+
+class ScoreHistory(db.Model):
+    """
+    評分歷史（只新增不修改）：每次分析的評分與主要指標快照，
+    供單一股票的評分走勢與跨股票的排名變化查詢；舊資料由彙整工作降為每日 / 每週一筆
+    """
+    __tablename__ = 'score_history'
+
+    id = db.Column(db.Integer, primary_key=True)
+    stock_code = db.Column(db.String(10), nullable=False)
+    recorded_at = db.Column(db.DateTime, nullable=False)         # 分析時間（彙整後為該期間最後一筆）
+    resolution = db.Column(db.String(6), nullable=False, default='raw')  # raw | day | week
+    samples = db.Column(db.Integer, nullable=False, default=1)   # 彙整的原始筆數
+    score = db.Column(db.SmallInteger, nullable=False)
+    current_price = db.Column(db.Float)
+    rsi = db.Column(db.Float)
+    macd = db.Column(db.Float)
+    histogram = db.Column(db.Float)
+    ma20 = db.Column(db.Float)
+    price_change_5d = db.Column(db.Float)
+    volume = db.Column(db.Integer)
+
+    __table_args__ = (
+        db.Index('idx_score_history_stock_time', 'stock_code', 'recorded_at'),
+        db.Index('idx_score_history_time', 'recorded_at'),
+        db.Index('idx_score_history_resolution_time', 'resolution', 'recorded_at'),
+    )
+
+    def __repr__(self) -> str:
+        return f'<ScoreHistory {self.stock_code}@{self.recorded_at:%Y-%m-%d %H:%M}:{self.score}>'
@@ -0,0 +1,10 @@
+"""
+gunicorn 設定（在專案根目錄執行 gunicorn 時自動載入）
+以 --preload 啟動時，快取背景工作在 master 的 create_app 中啟動，fork 後的 worker 不會繼承執行緒，
+由 post_fork 在每個伺服器 worker 中重新啟動（worker 之後再 fork 的行程池子行程不會啟動）。
+"""
+
+
+def post_fork(server, worker):
+    from utils.cache import restart_background_threads
+    restart_background_threads()
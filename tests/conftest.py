@@ -0,0 +1,31 @@
+"""
+測試共用設定
+快取目錄改為暫存目錄（需在匯入 utils 之前設定），避免讀寫正式快取。
+"""
+
+import os
+import sys
+import tempfile
+
+os.environ.setdefault('CACHE_DIR', tempfile.mkdtemp(prefix='twstock_test_cache_'))
+
+# 確保可以導入 utils / app 模組
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+import pytest
+
+
+@pytest.fixture
+def app_ctx():
+    """testing 設定（記憶體 SQLite）的 app context，並建立資料表"""
+    from app import create_app
+    from database import db
+
+    app = create_app('testing')
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
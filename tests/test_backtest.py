@@ -0,0 +1,79 @@
+"""回測引擎：以手工建立的小矩陣檢查進出場時點、停損停利、交易成本與上市前缺值"""
+
+import numpy as np
+import pytest
+
+from utils.backtest import BacktestData, _forward_fill, run_backtest
+
+NAN = np.nan
+
+
+def _data(close, eligible) -> BacktestData:
+    """
+    手工分析欄位：eligible 為 True 的日子 RSI 為 50（可進場），其餘為 100（max_rsi=60 時不進場）；
+    其他欄位固定，讓評分不影響進出場
+    """
+    close = np.array(close, dtype=float)
+    filled = _forward_fill(close)
+    zeros = np.zeros_like(filled)
+    columns = {
+        'rsi': np.where(np.array(eligible, dtype=bool), 50.0, 100.0),
+        'macd': zeros, 'signal': zeros, 'histogram': zeros,
+        'ma20': filled.copy(),
+        'current_price': filled,
+        'volume': np.full_like(filled, 1000.0),
+        'price_change_1d': zeros, 'price_change_5d': zeros, 'price_change_20d': zeros,
+    }
+    codes = [f'{1000 + row}' for row in range(close.shape[0])]
+    dates = [f'202601{day + 1:02d}' for day in range(close.shape[1])]
+    return BacktestData(codes, dates, close, columns['volume'], columns=columns)
+
+
+PARAMS = {'min_score': 0, 'max_rsi': 60, 'cost_bps': 0}
+
+
+def test_enters_at_close_and_exits_after_hold_days():
+    data = _data([[100, 100, 110, 121, 121, 121]], [[0, 1, 0, 0, 0, 0]])
+    result = run_backtest(data, dict(PARAMS, hold_days=2), include_equity=True)
+    # t=1 收盤進場，t=2、t=3 賺取報酬，t=3 收盤持滿 2 日出場
+    assert result['equity'] == [1.0, 1.0, 1.1, 1.21, 1.21, 1.21]
+    assert result['trades'] == 1
+    assert result['avg_trade_return'] == pytest.approx(0.21)
+    assert result['avg_holding_days'] == 2
+
+
+@pytest.mark.parametrize('close, rule, expected', [
+    ([100, 100, 95, 80, 90, 90], {'stop_loss': 0.1}, -0.2),
+    ([100, 100, 105, 120, 90, 90], {'take_profit': 0.15}, 0.2),
+])
+def test_stop_loss_and_take_profit_exit_at_close(close, rule, expected):
+    data = _data([close], [[0, 1, 0, 0, 0, 0]])
+    result = run_backtest(data, dict(PARAMS, hold_days=10, **rule), include_equity=True)
+    assert result['trades'] == 1
+    assert result['avg_trade_return'] == pytest.approx(expected)
+    assert result['avg_holding_days'] == 2
+    # 出場後不再承擔 t=4 的價格變動
+    assert result['equity'][3] == result['equity'][-1]
+
+
+def test_costs_are_charged_on_turnover():
+    data = _data([[100] * 5, [100] * 5], [[0, 1, 0, 0, 0], [0, 1, 0, 0, 0]])
+    result = run_backtest(data, dict(PARAMS, hold_days=2, cost_bps=10), include_equity=True)
+    # 進場日權重 0 → 各 0.5、出場日各 0.5 → 0，單邊成本 0.1% 各扣一次
+    assert result['equity'] == [1.0, 0.999, 0.999, 0.998, 0.998]
+    assert result['turnover'] == pytest.approx((0.5 + 0.5) / 5)
+
+
+def test_forward_fill_backfills_before_listing():
+    matrix = np.array([[NAN, NAN, 10, NAN, 12],
+                       [1, NAN, 3, NAN, NAN]])
+    assert _forward_fill(matrix).tolist() == [[10, 10, 10, 10, 12], [1, 1, 3, 3, 3]]
+
+
+def test_symbol_is_not_traded_before_listing():
+    # 上市前補上的價格只供指標計算，不可在 t=0、t=1 進場
+    data = _data([[NAN, NAN, 50, 55, 55]], [[1, 1, 1, 1, 1]])
+    result = run_backtest(data, dict(PARAMS, hold_days=1), include_equity=True)
+    assert result['equity'] == [1.0, 1.0, 1.0, 1.1, 1.1]
+    assert result['trades'] == 2
+    assert result['avg_trade_return'] == pytest.approx(0.05)
@@ -0,0 +1,44 @@
+"""fork 後的子行程不自動啟動快取背景工作，只有明確呼叫 restart_background_threads() 的 worker 會啟動"""
+
+import os
+import threading
+
+import pytest
+
+from utils import cache
+
+
+def _thread_names() -> set:
+    return {thread.name for thread in threading.enumerate()}
+
+
+def _in_child(func) -> str:
+    """在 fork 出的子行程執行 func，回傳其輸出字串"""
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:  # 子行程
+        os.close(read_fd)
+        try:
+            result = func()
+        except Exception as e:
+            result = f"error: {e}"
+        os.write(write_fd, result.encode('utf-8'))
+        os._exit(0)
+    os.close(write_fd)
+    with os.fdopen(read_fd, 'rb') as f:
+        output = f.read().decode('utf-8')
+    os.waitpid(pid, 0)
+    return output
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='需要 fork')
+def test_forked_children_do_not_restart_threads():
+    cache.start_cache_sweeper(interval=3600)
+    assert 'cache-sweeper' in _thread_names()
+
+    assert _in_child(lambda: str('cache-sweeper' in _thread_names())) == 'False'
+
+    def restarted():
+        cache.restart_background_threads()
+        return str('cache-sweeper' in _thread_names())
+    assert _in_child(restarted) == 'True'
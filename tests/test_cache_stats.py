@@ -0,0 +1,69 @@
+"""快取統計：合併各 worker 檔案時略過並移除已結束行程的檔案，並行寫入不互相干擾"""
+
+import json
+import os
+import subprocess
+import sys
+import threading
+
+import pytest
+
+from utils import cache_stats
+
+
+@pytest.fixture
+def stats_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache_stats, '_stats_dir', str(tmp_path))
+    return tmp_path
+
+
+def _dead_pid() -> int:
+    process = subprocess.Popen([sys.executable, '-c', 'pass'])
+    process.wait()
+    return process.pid
+
+
+def _write(path, pid, hits):
+    entry = cache_stats._empty_namespace()
+    entry['hits'] = hits
+    path.write_text(json.dumps({'pid': pid, 'namespaces': {'stock_basic': entry}}), encoding='utf-8')
+
+
+def test_dead_worker_files_are_removed(stats_dir):
+    dead = stats_dir / f"{_dead_pid()}.json"
+    _write(dead, int(dead.stem), 100)
+    alive = stats_dir / f"{os.getppid()}.json"
+    _write(alive, os.getppid(), 7)
+
+    stats = cache_stats.aggregate_stats()
+
+    assert not dead.exists()
+    assert alive.exists()
+    assert stats['namespaces']['stock_basic']['hits'] >= 7
+    assert stats['namespaces']['stock_basic']['hits'] < 100
+    # 本行程與仍存活的父行程
+    assert stats['workers'] == 2
+
+
+def test_concurrent_flush_leaves_no_temp_files(stats_dir, capsys):
+    cache_stats.record('market', 'hits')
+    errors = []
+
+    def worker():
+        try:
+            for _ in range(20):
+                cache_stats.flush()
+        except Exception as e:  # pragma: no cover - 失敗時記錄
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not errors
+    assert '寫入快取統計失敗' not in capsys.readouterr().out
+    assert sorted(os.listdir(stats_dir)) == [f"{os.getpid()}.json"]
+    data = json.loads((stats_dir / f"{os.getpid()}.json").read_text(encoding='utf-8'))
+    assert data['pid'] == os.getpid()
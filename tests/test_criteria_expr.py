@@ -0,0 +1,87 @@
+"""條件運算式：解析、錯誤訊息、向量化遮罩與逐筆判斷一致"""
+
+import numpy as np
+import pytest
+
+from utils import criteria_expr
+from utils.stock_screener import StockScreener
+
+
+def _analyses():
+    return [
+        {'stock_code': '1101', 'rsi': 25.0, 'current_price': 50.0, 'ma20': 48.0, 'volume': 2000, 'score': 70,
+         'price_change_5d': 1.0},
+        {'stock_code': '2330', 'rsi': 65.0, 'current_price': 900.0, 'ma20': 950.0, 'volume': 50000, 'score': 80,
+         'price_change_5d': -2.0},
+        {'stock_code': '2454', 'rsi': None, 'current_price': 1000.0, 'ma20': 990.0, 'volume': 800, 'score': 60,
+         'price_change_5d': 3.0},
+    ]
+
+
+@pytest.mark.parametrize('source, expected', [
+    ('rsi < 30 and close > ma20', [True, False, False]),
+    ('not (rsi < 30) or volume > 10000', [False, True, True]),
+    ('abs(close - ma20) / ma20 * 100 < 5', [True, False, True]),
+    ('max(rsi, 50) > 60', [False, True, False]),
+    ('1 < 2', [True, True, True]),
+    ('1 > 2', [False, False, False]),
+])
+def test_mask_agrees_with_matches(source, expected):
+    expression = criteria_expr.compile_expression(source)
+    analyses = _analyses()
+    mask = expression.mask(criteria_expr.columns_from_analyses(analyses), len(analyses))
+    assert mask.tolist() == expected
+    assert [expression.matches(analysis) for analysis in analyses] == expected
+
+
+def test_constant_expression_agrees_between_screening_paths():
+    screener = StockScreener()
+    criteria = screener.validate_criteria({'expression': '1 < 2'})
+    analyses = _analyses()[:2]
+    mask = screener.criteria_mask(criteria_expr.columns_from_analyses(analyses), criteria)
+    assert mask.tolist() == [screener.meets_criteria(analysis, criteria) for analysis in analyses]
+    assert mask.all()
+
+
+def test_custom_indicators_and_fields():
+    expression = criteria_expr.compile_expression('gap > 1', {'gap': '(close - ma20) / ma20 * 100'})
+    assert expression.fields == ['current_price', 'ma20']
+    values = expression.custom_values(criteria_expr.columns_from_analyses(_analyses()))['gap']
+    assert np.allclose(values, [(50 - 48) / 48 * 100, (900 - 950) / 950 * 100, (1000 - 990) / 990 * 100])
+
+
+@pytest.mark.parametrize('source, message', [
+    ('rsi <', '運算式不完整'),
+    ('rsi < 30 < 40', '比較運算不可連用'),
+    ('foo > 1', '未知的欄位'),
+    ('rsi + 1', '必須為比較或邏輯判斷'),
+    ('min(rsi) > 1', '需要 2 個參數'),
+    ('rsi < 30 and 5', '需要比較或邏輯判斷'),
+    ('__import__("os")', '無法解析'),
+])
+def test_invalid_expressions_raise_value_error(source, message):
+    with pytest.raises(ValueError, match=message):
+        criteria_expr.compile_expression(source)
+
+
+@pytest.mark.parametrize('source', [
+    '(' * 200 + 'rsi' + ')' * 200 + ' > 1',
+    'not ' * 100 + 'rsi > 1',
+    '-' * 200 + 'rsi > 1',
+])
+def test_deep_nesting_is_rejected_as_value_error(source):
+    with pytest.raises(ValueError, match='巢狀層數'):
+        criteria_expr.compile_expression(source[:criteria_expr.MAX_LENGTH])
+
+
+def test_nesting_within_limit_compiles():
+    depth = criteria_expr.MAX_DEPTH
+    expression = criteria_expr.compile_expression('(' * depth + 'rsi' + ')' * depth + ' < 30')
+    assert expression.matches({'rsi': 20})
+
+
+def test_top_k_picks_highest_masked_values():
+    values = np.array([5.0, 9.0, 1.0, 7.0, 3.0])
+    mask = np.array([True, False, True, True, True])
+    assert criteria_expr.top_k(values, mask, 2).tolist() == [3, 0]
+    assert criteria_expr.top_k(values, mask, 0).tolist() == []
@@ -0,0 +1,36 @@
+"""逐支計算（無 NumPy 或向量化失敗時的備援）與向量化指標引擎對同一序列的結果一致"""
+
+import math
+
+import numpy as np
+import pytest
+
+from utils import indicators
+from utils.stock_screener import StockScreener
+
+TOLERANCE = {'rsi': 0.01, 'macd': 0.001, 'signal': 0.001, 'histogram': 0.002}
+
+
+def _series(length: int, seed: int) -> list:
+    rng = np.random.default_rng(seed)
+    return [round(float(price), 2) for price in 100 * np.exp(np.cumsum(rng.normal(0, 0.02, length)))]
+
+
+@pytest.mark.parametrize('length,seed', [(60, 1), (60, 7), (90, 3)])
+def test_fallback_matches_vectorized_engine(length, seed):
+    prices = _series(length, seed)
+    screener = StockScreener()
+    fallback = screener.calculate_technical_indicators(prices)
+    vectorized = screener.calculate_indicators_batch([prices])[0]
+
+    for name in ('rsi', 'macd', 'signal', 'histogram', 'ma5', 'ma10', 'ma20', 'ma60',
+                 'bb_upper', 'bb_middle', 'bb_lower'):
+        tolerance = TOLERANCE.get(name, 0.01)
+        assert math.isclose(fallback[name], vectorized[name], abs_tol=tolerance), \
+            f"{name}: 逐支 {fallback[name]} ≠ 向量化 {vectorized[name]}"
+
+
+def test_rsi_uses_full_period():
+    prices = _series(60, 11)
+    expected = indicators.rsi(prices, 14)[0, -1]
+    assert StockScreener().calculate_rsi(prices) == pytest.approx(round(float(expected), 2), abs=0.01)
@@ -0,0 +1,38 @@
+"""即時選股報價輪詢：每輪一次批次報價，只把價格變動的股票交給登記表"""
+
+from utils import live_screener
+
+
+class _Registry:
+    def __init__(self, symbols):
+        self._symbols = set(symbols)
+        self.quotes = []
+
+    def symbols(self):
+        return self._symbols
+
+    def on_quote(self, stock_code, price, quote=None):
+        self.quotes.append((stock_code, price))
+        return {'stock_code': stock_code}
+
+
+def test_poll_once_uses_one_batch_quote_call(monkeypatch):
+    calls = []
+    prices = {'2330': '900', '2454': '1000'}
+
+    def batch(stock_codes, max_workers=8):
+        calls.append(list(stock_codes))
+        return {code: {'即時股價': prices[code]} for code in stock_codes if code in prices}, {'9999': '查無'}
+
+    monkeypatch.setattr(live_screener, 'get_stocks_basic_info', batch)
+    registry = _Registry(['2330', '2454', '9999'])
+    poller = live_screener.QuotePoller(registry, interval=1)
+
+    assert poller.poll_once() == 2
+    assert calls == [['2330', '2454', '9999']]
+    assert sorted(registry.quotes) == [('2330', 900.0), ('2454', 1000.0)]
+
+    # 價格未變動的股票不再交給登記表
+    prices['2454'] = '1005'
+    assert poller.poll_once() == 1
+    assert registry.quotes[-1] == ('2454', 1005.0)
@@ -0,0 +1,64 @@
+"""負向快取：只有資料來源明確回應查無代號時才記錄，暫時性失敗不延長有效時間"""
+
+import itertools
+
+import pytest
+
+import utils.twse as twse
+from utils.cache import NEGATIVE_CACHE_TTL, _negative_key, _read_file_entry, save_negative_cache
+
+_codes = (f"Z{index:05d}" for index in itertools.count())
+
+
+def _not_found(code):
+    raise twse.SymbolNotFound(f"查無 {code}")
+
+
+def _unavailable(code):
+    return None  # 資料來源吞掉逾時等例外後回傳 None
+
+
+@pytest.fixture
+def sources(monkeypatch):
+    monkeypatch.setattr(twse, 'get_stock_name', lambda code: code)
+    monkeypatch.setattr(twse, 'get_stock_from_twse_api', _unavailable)
+    monkeypatch.setattr(twse, 'get_stock_from_alternative_api', _unavailable)
+
+    def configure(realtime, yahoo):
+        monkeypatch.setattr(twse, 'get_stock_from_twse_realtime', realtime)
+        monkeypatch.setattr(twse, 'get_stock_from_yahoo', yahoo)
+    return configure
+
+
+def _negative_ttl(code):
+    _, entry = _read_file_entry(_negative_key(f"stock_basic_{code}"))
+    return entry['ttl'] if entry else None
+
+
+def test_transient_failures_are_not_negative_cached(sources):
+    sources(_unavailable, _unavailable)
+    code = next(_codes)
+    assert twse.get_stock_basic_info(code).get('錯誤')
+    assert not twse.is_unknown_symbol(code)
+    assert _negative_ttl(code) is None
+
+
+def test_confirmed_unknown_doubles_ttl(sources):
+    sources(_not_found, _not_found)
+    code = next(_codes)
+    twse.get_stock_basic_info(code)
+    assert twse.is_unknown_symbol(code)
+    assert _negative_ttl(code) == NEGATIVE_CACHE_TTL
+    # 再記錄一次（模擬有效時間過後再次查無）
+    save_negative_cache(f"stock_basic_{code}", {'錯誤': 'x'})
+    assert _negative_ttl(code) == NEGATIVE_CACHE_TTL * 2
+
+
+def test_partial_not_found_does_not_extend_ttl(sources):
+    sources(_not_found, _unavailable)
+    code = next(_codes)
+    key = f"stock_basic_{code}"
+    twse.get_stock_basic_info(code)
+    assert _negative_ttl(code) == NEGATIVE_CACHE_TTL
+    save_negative_cache(key, {'錯誤': 'x'}, extend=False)
+    assert _negative_ttl(code) == NEGATIVE_CACHE_TTL
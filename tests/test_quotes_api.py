@@ -0,0 +1,65 @@
+"""批次報價 API：GET / POST 解析、數量上限、查無代號的 errors 與重複或不合法的代號"""
+
+import pytest
+
+from utils import cache, twse
+
+KNOWN = {'9101': '101.50', '9102': '55.00'}
+
+
+@pytest.fixture
+def client(app_ctx, monkeypatch):
+    requested = []
+
+    def realtime(codes):
+        requested.extend(codes)
+        return {code: {'股票名稱': f'合成{code}', '收盤價': KNOWN[code], '成交量': '1,000'}
+                for code in codes if code in KNOWN}
+
+    def basic_info(code):
+        return {'股票代碼': code, '錯誤': f'查無股票 {code} 的資料'}
+
+    monkeypatch.setattr(twse, 'get_stocks_from_twse_realtime', realtime)
+    monkeypatch.setattr(twse, 'get_stock_basic_info', basic_info)
+    for code in ('9101', '9102', '9999'):
+        cache.clear_cache(f'stock_basic_{code}')
+        cache.clear_negative_cache(f'stock_basic_{code}')
+    test_client = app_ctx.test_client()
+    test_client.requested = requested
+    return test_client
+
+
+def test_get_and_post_return_the_same_quotes(client):
+    by_get = client.get('/api/quotes?codes=9101,9102').get_json()
+    by_post = client.post('/api/quotes', json={'codes': ['9101', '9102']}).get_json()
+    by_post_string = client.post('/api/quotes', json={'codes': '9101,9102'}).get_json()
+
+    assert by_get['success'] is True and by_get['count'] == 2
+    assert by_get['data']['9101']['price'] == '101.50'
+    assert list(by_get['data']) == ['9101', '9102']
+    assert by_post['data'] == by_get['data'] == by_post_string['data']
+
+
+def test_batch_limit_returns_400(client, app_ctx, monkeypatch):
+    monkeypatch.setitem(app_ctx.config, 'QUOTES_MAX_BATCH', 2)
+    response = client.get('/api/quotes?codes=9101,9102,9999')
+    assert response.status_code == 400
+    assert response.get_json()['success'] is False
+    assert client.requested == []
+
+
+def test_unknown_symbols_are_reported_in_errors(client):
+    body = client.get('/api/quotes?codes=9101,9999').get_json()
+    assert list(body['data']) == ['9101']
+    assert body['errors'] == {'9999': '查無股票 9999 的資料'}
+    assert body['count'] == 1
+
+
+def test_duplicate_and_invalid_codes(client):
+    body = client.post('/api/quotes', json={'codes': ['9101', ' 9101 ', '', '9101', 9102]}).get_json()
+    assert list(body['data']) == ['9101', '9102']
+    assert sorted(client.requested) == ['9101', '9102']
+
+    for response in (client.get('/api/quotes'), client.get('/api/quotes?codes=,%20,'),
+                     client.post('/api/quotes', json={'codes': []}), client.post('/api/quotes', data='x')):
+        assert response.status_code == 400
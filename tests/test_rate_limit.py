@@ -0,0 +1,30 @@
+"""選股器共用同一個權杖桶：並行的選股不會各自拿到一份完整額度"""
+
+import time
+
+from utils import stock_screener
+from utils.rate_limit import RateLimiter
+from utils.stock_screener import RATE_LIMITER, StockScreener
+
+
+def test_screeners_share_one_limiter():
+    first, second = StockScreener(), StockScreener()
+    assert first.rate_limiter is second.rate_limiter is RATE_LIMITER
+
+
+def test_bucket_budget_is_shared(monkeypatch):
+    # 以獨立的限制器代替行程共用的 RATE_LIMITER，不影響其他測試的額度
+    monkeypatch.setattr(stock_screener, 'RATE_LIMITER', RateLimiter(rate=1, burst=3))
+    first, second = StockScreener(), StockScreener()
+    # 以第一個選股器用完額度後，第二個選股器也拿不到權杖
+    for _ in range(3):
+        assert first.rate_limiter.acquire(timeout=0)
+    assert second.rate_limiter.acquire(timeout=0) is False
+
+
+def test_limiter_refills_at_rate():
+    limiter = RateLimiter(rate=50, burst=1)
+    assert limiter.acquire(timeout=0)
+    started = time.monotonic()
+    assert limiter.acquire(timeout=1)
+    assert time.monotonic() - started >= 0.01
@@ -0,0 +1,86 @@
+"""評分歷史：彙整（原始 → 每日 → 每週）與排名變化查詢"""
+
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from database import ScoreHistory
+from utils import score_history
+
+NOW = datetime(2026, 10, 19, 12, 0)  # 週一
+
+
+def _seed(days: int = 250, per_day: int = 3) -> list:
+    """每支股票每天 per_day 筆原始紀錄，評分依時間遞增以便辨認最後一筆"""
+    analyses = []
+    for code_index, stock_code in enumerate(('1101', '2330')):
+        for day in range(days):
+            for slot in range(per_day):
+                moment = NOW - timedelta(days=day, hours=3 * slot + 1)
+                analyses.append(({'stock_code': stock_code, 'score': (day * 7 + slot + code_index) % 100,
+                                  'rsi': 50.0, 'volume': day}, moment))
+    for analysis, moment in analyses:
+        score_history.write_scores([analysis], moment)
+    return analyses
+
+
+def _expected(analyses: list, raw_days: int, daily_days: int) -> dict:
+    """逐筆計算每個（股票, 解析度, 期間）應保留的最後一筆與筆數"""
+    raw_before = datetime.combine(NOW.date() - timedelta(days=raw_days), datetime.min.time())
+    daily_before = datetime.combine(score_history._week_bucket(NOW - timedelta(days=daily_days)),
+                                    datetime.min.time())
+    groups = defaultdict(list)
+    for analysis, moment in analyses:
+        if moment >= raw_before:
+            key = (analysis['stock_code'], 'raw', moment)
+        elif moment.date() >= daily_before.date():
+            key = (analysis['stock_code'], 'day', moment.date())
+        else:
+            key = (analysis['stock_code'], 'week', score_history._week_bucket(moment))
+        groups[key].append((moment, analysis['score']))
+    return {key: (max(items)[0], max(items)[1], len(items)) for key, items in groups.items()}
+
+
+def _actual() -> dict:
+    rows = {}
+    for row in ScoreHistory.query.all():
+        period = {'raw': lambda moment: moment, 'day': lambda moment: moment.date(),
+                  'week': score_history._week_bucket}[row.resolution](row.recorded_at)
+        key = (row.stock_code, row.resolution, period)
+        assert key not in rows
+        rows[key] = (row.recorded_at, row.score, row.samples)
+    return rows
+
+
+def test_rollup_keeps_last_row_per_period(app_ctx):
+    analyses = _seed()
+    report = score_history.rollup(raw_days=14, daily_days=180, now=NOW)
+
+    assert _actual() == _expected(analyses, 14, 180)
+    assert sum(samples for _, _, samples in _actual().values()) == len(analyses)
+    assert report['raw_rows'] == sum(1 for _, moment in analyses
+                                     if moment < datetime.combine(NOW.date() - timedelta(days=14),
+                                                                  datetime.min.time()))
+
+
+def test_rollup_is_idempotent(app_ctx):
+    _seed(days=60)
+    score_history.rollup(raw_days=14, daily_days=30, now=NOW)
+    before = _actual()
+    report = score_history.rollup(raw_days=14, daily_days=30, now=NOW)
+    assert report == {'raw_rows': 0, 'daily_rows': 0, 'daily_rolled': 0, 'weekly_rows': 0}
+    assert _actual() == before
+
+
+def test_rank_changes_compares_latest_scores(app_ctx):
+    start, end = NOW - timedelta(days=7), NOW
+    score_history.write_scores([{'stock_code': '1101', 'score': 40}, {'stock_code': '2330', 'score': 80},
+                                {'stock_code': '2454', 'score': 60}], start)
+    score_history.write_scores([{'stock_code': '1101', 'score': 90}, {'stock_code': '2330', 'score': 70},
+                                {'stock_code': '3008', 'score': 99}], end)
+
+    # 2454 沿用起點的評分；3008 在起點之前沒有紀錄，不計入
+    changes = score_history.rank_changes(start, end)
+    assert [(item['stock_code'], item['score_change'], item['rank_change']) for item in changes] == [
+        ('1101', 50, 2), ('2454', 0, -1), ('2330', -10, -1)]
+    assert [item['stock_code'] for item in score_history.rank_changes(start, end, direction='down', limit=1)] == [
+        '2330']
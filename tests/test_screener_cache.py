@@ -0,0 +1,37 @@
+"""選股結果快取：以實際篩選的股票代號為鍵"""
+
+from types import SimpleNamespace
+
+from utils import price_history, screener_cache
+from utils.stock_screener import StockScreener
+
+
+def _screener(monkeypatch, history):
+    monkeypatch.setattr(price_history, 'load_price_history', lambda: history)
+    screener = StockScreener()
+    screener.stock_pool = ['1101', '1102', '1216', '2330', '2454']
+    screener.live_universe_limit = 2
+    return screener
+
+
+def test_truncated_live_screen_is_keyed_by_screened_codes(monkeypatch):
+    screener = _screener(monkeypatch, None)
+    criteria = screener.validate_criteria({'min_score': 41})
+    assert screener.screened_codes(screener.stock_pool) == (['1101', '1102'], None)
+
+    screener_cache.store(screener, criteria, [])
+    assert screener_cache.cache.get_cache(screener_cache.cache_key(criteria, ['1101', '1102']))
+    assert screener_cache.cache.get_cache(screener_cache.cache_key(criteria, screener.stock_pool)) is None
+    assert screener_cache.lookup(screener, criteria)['results'] == []
+
+
+def test_truncated_result_is_not_served_for_full_universe(monkeypatch):
+    screener = _screener(monkeypatch, None)
+    criteria = screener.validate_criteria({'min_score': 42})
+    screener_cache.store(screener, criteria, [])
+
+    # 價格歷史就緒後篩選全部股票，不可沿用只涵蓋前 2 支的結果
+    history = SimpleNamespace(dates=['20261016'])
+    monkeypatch.setattr(price_history, 'load_price_history', lambda: history)
+    assert screener.screened_codes(screener.stock_pool) == (screener.stock_pool, history)
+    assert screener_cache.lookup(screener, criteria) is None
@@ -0,0 +1,108 @@
+"""選股工作：相同條件共用工作、跨 worker 經由共用快取查詢與加入、保留期限與事件重播"""
+
+import json
+import threading
+import time
+
+import pytest
+
+from utils import screener_jobs
+from utils.screener_jobs import DONE, ScreenerJobQueue
+from utils.stock_screener import StockScreener
+
+ANALYSIS = {'stock_code': '2330', 'stock_name': '台積電', 'score': 80}
+
+
+class GatedScreener(StockScreener):
+    """放行前停在 start 之後的選股器，記錄實際執行次數"""
+
+    gate = threading.Event()
+    runs = 0
+
+    def iter_screen(self, criteria=None, cancel_event=None):
+        type(self).runs += 1
+        yield {'type': 'start', 'total': 1}
+        self.gate.wait(5)
+        yield {'type': 'result', 'data': ANALYSIS}
+        yield {'type': 'progress', 'processed': 1, 'total': 1, 'errors': 0, 'found': 1}
+        yield {'type': 'done', 'results': [ANALYSIS], 'cancelled': False}
+
+
+@pytest.fixture
+def gated():
+    GatedScreener.gate = threading.Event()
+    GatedScreener.runs = 0
+    yield GatedScreener
+    GatedScreener.gate.set()
+
+
+def _criteria(min_score: int) -> dict:
+    # 各測試使用不同條件，避免共用快取中的工作紀錄互相影響
+    return {'min_score': min_score}
+
+
+def test_same_criteria_joins_existing_job(app_ctx, gated, monkeypatch):
+    queue = ScreenerJobQueue(workers=1, ttl=60, screener_factory=gated)
+    monkeypatch.setattr(screener_jobs, '_queue', queue)
+    client = app_ctx.test_client()
+
+    first = client.post('/api/screener/jobs', json={'criteria': _criteria(41)})
+    second = client.post('/api/screener/jobs', json={'criteria': _criteria(41)})
+    assert first.status_code == 201 and first.get_json()['created'] is True
+    assert second.status_code == 200 and second.get_json()['created'] is False
+    assert first.get_json()['job']['job_id'] == second.get_json()['job']['job_id']
+
+    gated.gate.set()
+    job, _ = queue.submit(_criteria(41))
+    assert job.wait(5) and job.status == DONE
+    assert gated.runs == 1
+
+
+def test_other_worker_joins_and_polls_through_shared_record(gated):
+    owner = ScreenerJobQueue(workers=1, ttl=60, screener_factory=gated)
+    other = ScreenerJobQueue(workers=1, ttl=60, screener_factory=gated)
+
+    job, created = owner.submit(_criteria(42))
+    joined, joined_created = other.submit(_criteria(42))
+    assert created is True and joined_created is False
+    assert joined.id == job.id
+    assert other.get(job.id).status in ('queued', 'running')
+
+    gated.gate.set()
+    assert joined.wait(5)
+    assert joined.status == DONE and joined.results == [ANALYSIS]
+    assert other.get(job.id).to_dict()['progress'] == {'processed': 1, 'total': 1, 'errors': 0, 'found': 1}
+    assert gated.runs == 1
+
+
+def test_finished_job_expires_to_404(app_ctx, gated, monkeypatch):
+    queue = ScreenerJobQueue(workers=1, ttl=1, screener_factory=gated)
+    monkeypatch.setattr(screener_jobs, '_queue', queue)
+    client = app_ctx.test_client()
+    gated.gate.set()
+
+    job_id = client.post('/api/screener/jobs', json={'criteria': _criteria(43)}).get_json()['job']['job_id']
+    assert queue.get(job_id).wait(5)
+    response = client.get(f'/api/screener/jobs/{job_id}')
+    assert response.status_code == 200 and response.get_json()['job']['results'] == [ANALYSIS]
+
+    time.sleep(1.5)
+    assert client.get(f'/api/screener/jobs/{job_id}').status_code == 404
+    assert ScreenerJobQueue(workers=1, ttl=1, screener_factory=gated).get(job_id) is None
+
+
+def test_events_are_replayed_after_completion(app_ctx, gated, monkeypatch):
+    queue = ScreenerJobQueue(workers=1, ttl=60, screener_factory=gated)
+    monkeypatch.setattr(screener_jobs, '_queue', queue)
+    client = app_ctx.test_client()
+    gated.gate.set()
+
+    job, _ = queue.submit(_criteria(44))
+    assert job.wait(5)
+    response = client.get(f'/api/screener/jobs/{job.id}/events?format=ndjson')
+    types = [json.loads(line)['type'] for line in response.get_data(as_text=True).splitlines()]
+    assert types == ['start', 'result', 'progress', 'done']
+
+    # 其他 worker 由共用紀錄重播相同的事件
+    remote = ScreenerJobQueue(workers=1, ttl=60, screener_factory=gated).get(job.id)
+    assert [event['type'] for event in remote.iter_events(timeout=1)] == types
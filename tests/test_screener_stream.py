@@ -0,0 +1,51 @@
+"""串流選股：取消請求經由共用快取傳遞，取消端點不必與串流落在同一個 worker"""
+
+import json
+import threading
+
+from app.blueprints import api
+from utils import cache
+from utils.stock_screener import StockScreener
+
+
+def test_stream_keys_bypass_memory_layer():
+    cache.save_cache('stream_memory_check', True)
+    assert 'stream_memory_check' not in cache._memory
+    assert cache.has_fresh_cache('stream_memory_check')
+    cache.clear_cache('stream_memory_check')
+
+
+def test_cancel_reaches_stream_through_shared_cache(app_ctx, monkeypatch):
+    monkeypatch.setattr(api, 'STREAM_CANCEL_POLL', 0.05)
+    seen = {}
+
+    def iter_screen(self, criteria=None, cancel_event=None):
+        seen['cancel_event'] = cancel_event
+        yield {'type': 'start', 'total': 1}
+        cancel_event.wait(5)
+        yield {'type': 'done', 'cancelled': cancel_event.is_set(), 'results': []}
+
+    monkeypatch.setattr(StockScreener, 'iter_screen', iter_screen)
+    client = app_ctx.test_client()
+
+    response = client.post('/api/screener/stream?format=ndjson', json={'criteria': {}}, buffered=False)
+    chunks = iter(response.response)
+    stream_id = json.loads(next(chunks))['stream_id']
+
+    # 模擬另一個 worker：其記憶體層沒有此串流的任何紀錄
+    with cache._memory_lock:
+        cache._memory.clear()
+    result = client.post(f'/api/screener/stream/{stream_id}/cancel')
+    assert result.status_code == 200
+    assert seen['cancel_event'].wait(3)
+
+    done = json.loads(next(chunks))
+    assert done['type'] == 'done' and done['cancelled'] is True
+    response.close()
+    assert not cache.has_fresh_cache(f'stream_{stream_id}')
+    assert client.post(f'/api/screener/stream/{stream_id}/cancel').status_code == 404
+
+
+def test_cancel_unknown_stream_is_404(app_ctx):
+    client = app_ctx.test_client()
+    assert client.post('/api/screener/stream/nope/cancel').status_code == 404
@@ -0,0 +1,71 @@
+"""選股表：沒有價格歷史時的過期判斷，以及熱門股重新分析的交易日回看期間"""
+
+from datetime import datetime
+
+from utils import price_history, screening_table
+from utils.stock_screener import StockScreener
+
+
+def _analysis(code: str, data_date: str) -> dict:
+    return {'stock_code': code, 'stock_name': code, 'data_date': data_date, 'current_price': 100.0,
+            'rsi': 50.0, 'score': 60, 'price_change_5d': 1.0, 'volume': 1000}
+
+
+def test_expected_data_date_uses_previous_weekday_before_ready_time(monkeypatch):
+    monkeypatch.setattr(screening_table, 'READY_TIME', '18:00')
+    assert screening_table.expected_data_date(datetime(2026, 10, 19, 10, 0)) == '20261016'  # 週一盤中
+    assert screening_table.expected_data_date(datetime(2026, 10, 16, 19, 0)) == '20261016'  # 週五收盤後
+    assert screening_table.expected_data_date(datetime(2026, 10, 18, 20, 0)) == '20261016'  # 週日
+
+
+def test_stale_table_without_history_falls_back(app_ctx, monkeypatch):
+    monkeypatch.setattr(price_history, 'load_price_history', lambda: None)
+    monkeypatch.setattr(screening_table, 'expected_data_date', lambda now=None: '20261016')
+
+    screening_table.write_snapshots([_analysis('2330', '20261015')], replace=True)
+    assert screening_table.screen_from_table({}) is None
+
+    screening_table.write_snapshots([_analysis('2330', '20261016')], replace=True)
+    result = screening_table.screen_from_table({})
+    assert result is not None and result['data_date'] == '20261016'
+
+
+def test_hot_subset_uses_history_days_trading_bars(app_ctx, monkeypatch):
+    screening_table.write_snapshots([_analysis('2330', '20261016')], replace=True)
+    screener = StockScreener()
+    seen = {}
+
+    def fetch_inputs(code):
+        seen['chart_days'] = screener.chart_days
+        data = [{'time': index, 'price': 100 + index} for index in range(150)]
+        return {'股票名稱': code, '成交量': '1000'}, {'success': True, 'data': data}
+
+    def build_analyses(batch):
+        seen['bars'] = [len(chart_data['data']) for _, _, chart_data in batch]
+        return {}
+
+    monkeypatch.setattr(screener, 'fetch_inputs', fetch_inputs)
+    monkeypatch.setattr(screener, 'build_analyses', build_analyses)
+    monkeypatch.setattr(screening_table, '_screener', lambda: screener)
+
+    screening_table.refresh_hot_subset(1)
+    assert seen['chart_days'] >= screener.history_days * 7 // 5
+    assert seen['bars'] == [screener.history_days]
+
+
+def test_hot_subset_stamps_taipei_date(app_ctx, monkeypatch):
+    screening_table.write_snapshots([_analysis('2330', '20261016')], replace=True)
+    screener = StockScreener()
+    written = []
+
+    monkeypatch.setattr(screener, 'fetch_inputs', lambda code: (
+        {'股票名稱': code}, {'success': True, 'data': [{'time': 0, 'price': 100.0}]}))
+    monkeypatch.setattr(screener, 'build_analyses', lambda batch: {'2330': _analysis('2330', '')})
+    monkeypatch.setattr(screener, 'is_valid_analysis', lambda analysis: True)
+    monkeypatch.setattr(screening_table, '_screener', lambda: screener)
+    # 主機時區為 UTC 時，台北已是隔天
+    monkeypatch.setattr(screening_table, '_taipei_now', lambda: datetime(2026, 10, 17, 0, 30))
+    monkeypatch.setattr(screening_table, 'write_snapshots', lambda analyses: written.extend(analyses) or len(analyses))
+
+    assert screening_table.refresh_hot_subset(1) == 1
+    assert [analysis['data_date'] for analysis in written] == ['20261017']
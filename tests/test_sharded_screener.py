@@ -0,0 +1,118 @@
+"""分散式選股：分片失敗重試、worker 終止後收回分片，以及合併結果與單機篩選一致"""
+
+import os
+import signal
+import threading
+import time
+
+import pytest
+
+from benchmarks.synthetic_market import SyntheticMarket
+from utils import sharded_screener
+from utils.price_history import save_price_history
+from utils.stock_screener import StockScreener
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def market(tmp_path):
+    market = SyntheticMarket(symbols=40, days=90, seed=11)
+    path = str(tmp_path / 'price_history.npz')
+    save_price_history(market.price_history(), path)
+    return market, path
+
+
+def _criteria():
+    return StockScreener().validate_criteria({'min_score': 0})
+
+
+def _expected(codes, history_path, k):
+    from utils.price_history import load_price_history
+
+    screener = StockScreener()
+    screener.max_results = k
+    return screener.screen_history(codes, _criteria(), load_price_history(history_path))
+
+
+def _ranking(results):
+    return sorted((analysis['stock_code'], analysis['score']) for analysis in results)
+
+
+def test_partition_and_merge_top_k():
+    codes = [f"{1000 + index}" for index in range(50)]
+    buckets = sharded_screener.partition(codes, 4)
+    assert sorted(code for bucket in buckets for code in bucket) == codes
+    assert all(sharded_screener.shard_of(code, 4) == index for index, bucket in enumerate(buckets) for code in bucket)
+
+    partials = [[{'score': 90}, {'score': 40}], [{'score': 70}, {'score': 60}], []]
+    assert [item['score'] for item in sharded_screener.merge_top_k(partials, 3)] == [90, 70, 60]
+
+
+def test_failed_shard_is_retried_and_merged(market, tmp_path, monkeypatch):
+    market, history_path = market
+    k = len(market.codes)
+    failures = []
+    screen_shard = sharded_screener.screen_shard
+
+    def flaky(task):
+        if task['shard'] == 0 and task['attempt'] == 1:
+            failures.append(task['shard'])
+            raise RuntimeError('模擬分片失敗')
+        return screen_shard(task)
+
+    monkeypatch.setattr(sharded_screener, 'screen_shard', flaky)
+    queue_dir = str(tmp_path / 'queue')
+    screen = sharded_screener.ShardedScreen(_criteria(), market.codes, 3, k, queue_dir, history_path)
+    worker = threading.Thread(target=sharded_screener.run_worker, args=(queue_dir, 'test-worker', 2.0))
+    worker.start()
+    report = screen.run(deadline=30)
+    worker.join()
+
+    assert failures == [0]
+    assert report['retries'] == 1 and report['failed_shards'] == {}
+    assert report['processed'] == len(market.codes)
+    assert _ranking(report['results']) == _ranking(_expected(market.codes, history_path, k))
+
+
+def test_killed_worker_shard_is_picked_up_by_survivor(market, tmp_path, monkeypatch):
+    market, history_path = market
+    k = len(market.codes)
+    monkeypatch.chdir(ROOT)
+    monkeypatch.setenv('SCREENER_SHARD_HEARTBEAT', '0.2')
+    # 逾時長於倖存 worker 處理完其餘分片後的閒置時間，worker 須等到分片收回仍在線上
+    monkeypatch.setattr(sharded_screener, 'SHARD_TIMEOUT', 8)
+    queue_dir = str(tmp_path / 'queue')
+    screen = sharded_screener.ShardedScreen(_criteria(), market.codes, 4, k, queue_dir, history_path,
+                                            timeout=sharded_screener.SHARD_TIMEOUT)
+    claimed_dir = screen.claimed_dir
+
+    workers = sharded_screener.spawn_workers(2, queue_dir)
+    report = {}
+    coordinator = threading.Thread(target=lambda: report.update(screen.run(deadline=30)))
+    try:
+        coordinator.start()
+        # 第一個認領分片的 worker 在處理途中被終止（不再有心跳、不會交回結果）
+        killed = None
+        waited = time.monotonic()
+        while killed is None and time.monotonic() - waited < 30:
+            for name in os.listdir(claimed_dir):
+                worker_id = name[:-len('.json')].split('.', 1)[-1]
+                index = int(worker_id.rsplit('-', 1)[-1]) - 1
+                os.kill(workers[index].pid, signal.SIGKILL)
+                killed = index
+                break
+            time.sleep(0.001)
+        assert killed is not None
+        coordinator.join(60)
+        assert not coordinator.is_alive()
+    finally:
+        for process in workers:
+            process.terminate()
+            process.wait()
+
+    assert workers[killed].returncode == -signal.SIGKILL
+    assert report['failed_shards'] == {}
+    assert report['retries'] >= 1
+    assert report['processed'] == len(market.codes)
+    assert _ranking(report['results']) == _ranking(_expected(market.codes, history_path, k))
@@ -0,0 +1,38 @@
+"""get_stale_cache 直接讀取快取，不重複記錄 miss"""
+
+import json
+from datetime import datetime, timedelta
+
+from utils import cache, cache_stats
+
+
+def _counts(namespace: str) -> dict:
+    with cache_stats._lock:
+        return dict(cache_stats._stats.get(namespace, cache_stats._empty_namespace()))
+
+
+def test_stale_lookup_records_one_miss_and_one_stale_hit():
+    key = 'stock_basic_STALE1'
+    cache.save_cache(key, {'收盤價': '10'}, ttl=1)
+    cache._memory_pop(key)
+    # 將寫入時間提前，使資料過期但仍在 stale_ttl 內
+    _, entry = cache._read_file_entry(key)
+    entry['timestamp'] = (datetime.now() - timedelta(seconds=5)).isoformat()
+    with open(cache._cache_path(key), 'w', encoding='utf-8') as f:
+        f.write(json.dumps(entry))
+
+    before = _counts('stock_basic')
+    assert cache.get_cache(key) is None
+    assert cache.get_stale_cache(key) == {'收盤價': '10'}
+    after = _counts('stock_basic')
+
+    assert after['misses'] - before['misses'] == 1
+    assert after['stale_hits'] - before['stale_hits'] == 1
+    assert after['hits'] == before['hits']
+
+
+def test_missing_key_is_not_counted_twice():
+    before = _counts('stock_basic')
+    assert cache.get_cache('stock_basic_NOPE1') is None
+    assert cache.get_stale_cache('stock_basic_NOPE1') is None
+    assert _counts('stock_basic')['misses'] - before['misses'] == 1
@@ -0,0 +1,68 @@
+"""增量指標與向量化引擎（indicators.compute_all）逐根 K 棒一致，含盤中修正同一根 K 棒"""
+
+import math
+
+import numpy as np
+import pytest
+
+from utils import indicators
+from utils.streaming_indicators import StreamingIndicators
+
+FIELDS = ('rsi', 'macd', 'signal', 'histogram', 'ma5', 'ma10', 'ma20', 'ma60',
+          'bb_upper', 'bb_middle', 'bb_lower')
+
+
+def _series(length: int, seed: int) -> list:
+    rng = np.random.default_rng(seed)
+    return [round(float(price), 2) for price in 100 * np.exp(np.cumsum(rng.normal(0, 0.02, length)))]
+
+
+def _assert_matches(values: dict, expected: dict, column: int) -> None:
+    for field in FIELDS:
+        reference = float(expected[field][0, column])
+        if math.isnan(reference):
+            assert values[field] is None, (field, column)
+        else:
+            assert values[field] == pytest.approx(reference, rel=1e-9, abs=1e-9), (field, column)
+
+
+@pytest.mark.parametrize('seed', [1, 2, 3])
+def test_update_matches_vectorized_engine(seed):
+    prices = _series(90, seed)
+    expected = indicators.compute_all(prices)
+    streaming = StreamingIndicators()
+    for column, price in enumerate(prices):
+        _assert_matches(streaming.update(price), expected, column)
+
+
+@pytest.mark.parametrize('seed', [4, 5])
+def test_intraday_revisions_match_final_close(seed):
+    prices = _series(80, seed)
+    expected = indicators.compute_all(prices)
+    rng = np.random.default_rng(seed)
+    streaming = StreamingIndicators()
+    for column, price in enumerate(prices):
+        bar_time = f"bar-{column}"
+        # 盤中多筆報價修正同一根 K 棒，最後一筆為收盤價
+        for tick in price * (1 + rng.normal(0, 0.01, 3)):
+            streaming.on_price(float(tick), bar_time)
+        _assert_matches(streaming.on_price(price, bar_time), expected, column)
+
+
+def test_state_round_trip_continues_identically():
+    prices = _series(90, 6)
+    expected = indicators.compute_all(prices)
+    streaming = StreamingIndicators()
+    for column, price in enumerate(prices):
+        if column == 45:
+            streaming = StreamingIndicators.from_dict(streaming.to_dict())
+        values = streaming.on_price(price, column)
+    _assert_matches(values, expected, len(prices) - 1)
+
+
+def test_moving_averages_wait_for_full_window():
+    streaming = StreamingIndicators()
+    for price in _series(21, 7):
+        values = streaming.update(price)
+    assert values['ma20'] is not None and values['bb_middle'] is not None
+    assert values['ma60'] is None
@@ -0,0 +1,97 @@
+"""異常交易掃描：由價格歷史建立基準後標記量增、跳空與漲跌停，z-score 與逐筆計算一致"""
+
+import numpy as np
+import pytest
+
+from benchmarks.synthetic_market import SyntheticMarket
+from utils.unusual_activity import UnusualActivityScanner
+
+WINDOW = 20
+
+
+@pytest.fixture
+def market():
+    return SyntheticMarket(symbols=30, days=40, seed=5)
+
+
+def _scanner(market) -> UnusualActivityScanner:
+    scanner = UnusualActivityScanner(window=WINDOW)
+    scanner.seed_from_history(market.price_history(), before=market.dates[-1])
+    return scanner
+
+
+def _quiet_snapshot(market, column: int) -> dict:
+    """平盤、無波動、成交量等於基準平均的快照（不應觸發任何異常）"""
+    snapshot = {}
+    for row, code in enumerate(market.codes):
+        prev = float(market.close[row, column - 1])
+        volume = float(np.mean(market.volume[row, column - WINDOW:column]))
+        snapshot[code] = {'open': prev, 'high': prev, 'low': prev, 'close': prev, 'volume': volume,
+                          'change': 0.0}
+    return snapshot
+
+
+def _brute_z(volumes: list, volume: float) -> float:
+    window = np.array(volumes[-WINDOW:], dtype=float)
+    return (volume - window.mean()) / window.std()
+
+
+def test_injected_events_are_flagged(market):
+    scanner = _scanner(market)
+    column = len(market.dates) - 1
+    snapshot = _quiet_snapshot(market, column)
+    spike, gap, limit_up, limit_down = market.codes[:4]
+
+    history = market.volume[0, column - WINDOW:column].astype(float)
+    snapshot[spike]['volume'] = float(history.mean() + 6 * history.std())
+    prev = snapshot[gap]['close']
+    snapshot[gap].update(open=prev * 1.05, high=prev * 1.05)
+    prev = snapshot[limit_up]['close']
+    snapshot[limit_up].update(close=prev * 1.095, high=prev * 1.095, change=prev * 0.095)
+    prev = snapshot[limit_down]['close']
+    snapshot[limit_down].update(close=prev * 0.905, low=prev * 0.905, change=-prev * 0.095)
+
+    latest = scanner.scan(snapshot, market.dates[-1])
+    flagged = {item['stock_code']: item for item in latest['results']}
+    assert set(flagged) == {spike, gap, limit_up, limit_down}
+    assert 'volume' in flagged[spike]['flags']
+    assert flagged[spike]['volume_z'] == pytest.approx(6, abs=0.01)
+    assert 'gap' in flagged[gap]['flags'] and flagged[gap]['gap_pct'] == pytest.approx(5, abs=0.01)
+    assert 'limit_up' in flagged[limit_up]['flags']
+    assert 'limit_down' in flagged[limit_down]['flags']
+    assert {item['stock_code'] for item in scanner.results('limit')} == {limit_up, limit_down}
+    with pytest.raises(ValueError):
+        scanner.results('nope')
+
+
+def test_volume_z_matches_brute_force_across_buffer_wraparound(market):
+    scanner = _scanner(market)
+    rng = np.random.default_rng(9)
+    code, row = market.codes[5], 5
+    volumes = [float(value) for value in market.volume[row, -WINDOW - 1:-1]]
+    prev_close = float(market.close[row, -2])
+    base = float(np.mean(volumes))
+
+    # 超過一整個環狀緩衝的交易日；每天開盤跳空 4% 使該股一定被標記並回報 volume_z
+    for day in range(WINDOW + 5):
+        date = f"2025{1 + day // 28:02d}{1 + day % 28:02d}"
+        volume = float(np.float32(base * rng.lognormal(0, 0.5)))
+        close = round(prev_close * (1 + rng.normal(0, 0.01)), 2)
+        snapshot = {code: {'open': prev_close * 1.04, 'high': max(prev_close * 1.04, close),
+                           'low': min(prev_close, close), 'close': close, 'volume': volume,
+                           'change': close - prev_close}}
+        latest = scanner.scan(snapshot, date)
+        item = latest['results'][0]
+        assert item['stock_code'] == code and 'gap' in item['flags']
+        assert item['volume_z'] == pytest.approx(_brute_z(volumes, volume), abs=0.02)
+        volumes.append(volume)
+        prev_close = close
+
+
+def test_intraday_scan_does_not_roll_baseline(market):
+    scanner = _scanner(market)
+    column = len(market.dates) - 1
+    before = scanner.volume.copy()
+    scanner.scan(_quiet_snapshot(market, column), market.dates[-1], final=False)
+    assert np.array_equal(scanner.volume, before, equal_nan=True)
+    assert scanner.date == market.dates[-2]
@@ -0,0 +1,355 @@
+"""
+策略回測引擎
+以價格歷史庫（股票 × 交易日矩陣）重播歷史 K 棒：指標、評分（與 StockScreener.calculate_score
+相同的規則）與進場條件皆對整個矩陣一次向量化計算；持倉狀態在時間軸上逐日推進，
+每一步同時處理所有股票。多組參數可交給行程池平行回測。
+
+進場：收盤時符合選股條件（RSI 範圍、最低評分、趨勢、成交量、條件運算式）的股票，
+      依評分由高到低補滿 max_positions 個部位，等權重持有。
+出場：持有滿 hold_days、評分低於 exit_score、觸及 stop_loss / take_profit。
+
+用法：python -m utils.backtest [--strategy momentum|all] [--universe all] [--processes 4]
+"""
+
+import os
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from utils import indicators, price_history, universe
+from utils.criteria_expr import compile_expression, top_k
+
+TRADING_DAYS = 252
+
+DEFAULT_PARAMS = {
+    # 評分規則（StockScreener.calculate_score 的 RSI 門檻與各項權重倍數，1.0 即原始規則）
+    'rsi_oversold': 30,
+    'rsi_overbought': 70,
+    'weight_rsi': 1.0,
+    'weight_macd': 1.0,
+    'weight_trend': 1.0,
+    'weight_momentum': 1.0,
+    # 進場條件（與選股條件相同）
+    'min_rsi': 0,
+    'max_rsi': 100,
+    'min_score': 50,
+    'price_trend': 'any',
+    'trend_tolerance': 5,   # price_trend 允許的 5 日反向波動（%），同 meets_criteria
+    'volume_filter': False,
+    'expression': None,
+    'custom_indicators': None,
+    # 出場規則
+    'hold_days': 10,
+    'exit_score': None,
+    'stop_loss': None,      # 例如 0.1 代表虧損 10% 出場
+    'take_profit': None,
+    # 投資組合
+    'max_positions': 20,
+    'cost_bps': 10,         # 單邊交易成本（基點）
+}
+
+
+def normalize_params(params: dict | None = None) -> dict:
+    """
+    合併預設參數並檢查範圍
+    :raises ValueError: 參數不合法
+    """
+    merged = dict(DEFAULT_PARAMS)
+    for name, value in (params or {}).items():
+        if name not in DEFAULT_PARAMS:
+            raise ValueError(f'未知的回測參數: {name}')
+        merged[name] = value
+    if not 0 <= merged['rsi_oversold'] < merged['rsi_overbought'] <= 100:
+        raise ValueError('rsi_oversold 必須小於 rsi_overbought，且介於 0 到 100')
+    if int(merged['hold_days']) < 1 or int(merged['max_positions']) < 1:
+        raise ValueError('hold_days 與 max_positions 必須大於 0')
+    merged['hold_days'] = int(merged['hold_days'])
+    merged['max_positions'] = int(merged['max_positions'])
+    if merged['expression'] or merged['custom_indicators']:
+        compile_expression(merged['expression'], merged['custom_indicators'])
+    return merged
+
+
+def _forward_fill(matrix: np.ndarray) -> np.ndarray:
+    """沿時間軸以前值補缺；上市前的缺值以第一筆有效價格補上（不可交易，僅供指標計算）"""
+    valid = ~np.isnan(matrix)
+    positions = np.where(valid, np.arange(matrix.shape[1]), 0)
+    np.maximum.accumulate(positions, axis=1, out=positions)
+    first = valid.argmax(axis=1)
+    positions = np.maximum(positions, first[:, np.newaxis])
+    return np.take_along_axis(matrix, positions, axis=1)
+
+
+def _change(close: np.ndarray, days: int) -> np.ndarray:
+    """N 日漲跌幅（%）；資料不足 N 日時為 0，與 calculate_price_changes 相同"""
+    change = np.zeros_like(close)
+    if close.shape[1] > days:
+        with np.errstate(divide='ignore', invalid='ignore'):
+            change[:, days:] = (close[:, days:] / close[:, :-days] - 1) * 100
+    return np.nan_to_num(change)
+
+
+def analysis_columns(close: np.ndarray, volume: np.ndarray) -> dict:
+    """
+    整個價格矩陣的分析欄位（欄位名稱同 StockScreener 的分析結果），每項為股票 × 交易日矩陣；
+    資料不足的指標以 _fill_indicator_defaults 相同的預設值補上
+    """
+    filled = _forward_fill(close)
+    columns = indicators.compute_all(filled)
+    defaults = {'rsi': 50.0, 'macd': 0.0, 'signal': 0.0, 'histogram': 0.0}
+    for name, values in columns.items():
+        missing = np.isnan(values)
+        if missing.any():
+            values[missing] = defaults[name] if name in defaults else filled[missing]
+    columns['current_price'] = filled
+    columns['volume'] = np.nan_to_num(volume)
+    for days in (1, 5, 20):
+        columns[f'price_change_{days}d'] = _change(filled, days)
+    return columns
+
+
+def score_matrix(columns: dict, params: dict) -> np.ndarray:
+    """向量化的 StockScreener.calculate_score（RSI 門檻與各項權重可調）"""
+    rsi = columns['rsi']
+    price = columns['current_price']
+    ma20 = columns['ma20']
+    change_20d = columns['price_change_20d']
+    oversold, overbought = params['rsi_oversold'], params['rsi_overbought']
+
+    score = np.full(rsi.shape, 50.0)
+    score += params['weight_rsi'] * np.where((rsi >= oversold) & (rsi <= overbought), 10,
+                                             np.where(rsi < oversold, 15, -10))
+    score += params['weight_macd'] * np.where(columns['macd'] > columns['signal'], 10, -5)
+    score += params['weight_trend'] * np.where(price > ma20, 15, np.where(price < ma20, -10, 0))
+    score += params['weight_momentum'] * np.where(
+        (change_20d >= -5) & (change_20d <= 15), 10,
+        np.where(change_20d < -20, 5, np.where(change_20d > 30, -15, 0)))
+    return np.clip(score, 0, 100)
+
+
+def entry_mask(columns: dict, score: np.ndarray, params: dict) -> np.ndarray:
+    """進場條件遮罩（與 StockScreener.criteria_mask 相同的條件）"""
+    rsi = columns['rsi']
+    mask = (rsi >= params['min_rsi']) & (rsi <= params['max_rsi']) & (score >= params['min_score'])
+    if params['price_trend'] == 'up':
+        mask &= columns['price_change_5d'] >= -params['trend_tolerance']
+    elif params['price_trend'] == 'down':
+        mask &= columns['price_change_5d'] <= params['trend_tolerance']
+    if params['volume_filter']:
+        mask &= columns['volume'] >= 100
+    if params['expression']:
+        expression = compile_expression(params['expression'], params['custom_indicators'])
+        mask &= expression.mask(dict(columns, score=score))
+    return mask
+
+
+class BacktestData:
+    """回測輸入：價格矩陣與一次算好的分析欄位；start / end 為回測區間的欄位索引"""
+
+    def __init__(self, codes: list, dates: list, close: np.ndarray, volume: np.ndarray,
+                 start: int = 0, end: int | None = None, columns: dict | None = None):
+        self.codes = list(codes)
+        self.dates = list(dates)
+        self.close = close
+        self.volume = volume
+        self.start = start
+        self.end = len(self.dates) if end is None else end
+        self.tradable = ~np.isnan(close)
+        self.columns = columns if columns is not None else analysis_columns(close, volume)
+
+
+def load_backtest_data(path: str | None = None, universe_spec=None,
+                       start: str | None = None, end: str | None = None) -> BacktestData:
+    """
+    由價格歷史庫建立回測資料（指標以全部歷史計算，回測區間前的資料作為暖身）
+    :param universe_spec: 選股範圍設定，預設為價格歷史中的全部股票
+    :param start / end: 回測區間 YYYYMMDD（含）
+    :raises ValueError: 沒有價格歷史或區間內沒有資料
+    """
+    history = price_history.load_price_history(path)
+    if history is None or not history.dates:
+        raise ValueError('沒有價格歷史資料，請先更新股票清單與價格資料')
+    codes = [code for code in universe.resolve_universe(universe_spec, history.codes)
+             if history.row_of(code) is not None]
+    if not codes:
+        raise ValueError('選股範圍內沒有價格歷史資料')
+    rows = np.array([history.row_of(code) for code in codes])
+    dates = np.array(history.dates, dtype=str)
+    start_index = int(np.searchsorted(dates, start)) if start else 0
+    end_index = int(np.searchsorted(dates, end, side='right')) if end else len(dates)
+    if end_index - start_index < 2:
+        raise ValueError('回測區間至少需要 2 個交易日')
+    return BacktestData(codes, history.dates, history.close[rows], history.volume[rows],
+                        start_index, end_index)
+
+
+def run_backtest(data: BacktestData, params: dict | None = None, include_equity: bool = False) -> dict:
+    """
+    回測單一組參數
+    :return: 報酬、波動、最大回撤、勝率、周轉率等統計
+    """
+    params = normalize_params(params)
+    columns = data.columns
+    close = columns['current_price']
+    score = score_matrix(columns, params)
+    entries = entry_mask(columns, score, params) & data.tradable
+    with np.errstate(divide='ignore', invalid='ignore'):
+        returns = np.nan_to_num(close[:, 1:] / close[:, :-1] - 1)
+
+    symbols = len(data.codes)
+    held = np.zeros(symbols, dtype=bool)
+    age = np.zeros(symbols, dtype=int)
+    entry_price = np.full(symbols, np.nan)
+    weights = np.zeros(symbols)
+    cost_rate = params['cost_bps'] / 10000
+    daily_returns, daily_turnover, trade_returns, holding_days = [], [], [], []
+
+    for t in range(data.start, data.end):
+        # 前一日收盤持有的部位於今日收盤的損益
+        daily_return = returns[held, t - 1].mean() if t > data.start and held.any() else 0.0
+
+        # 收盤出場
+        price = close[:, t]
+        age[held] += 1
+        with np.errstate(divide='ignore', invalid='ignore'):
+            pnl = price / entry_price - 1
+        exits = held & (age >= params['hold_days'])
+        if params['exit_score'] is not None:
+            exits |= held & (score[:, t] < params['exit_score'])
+        if params['stop_loss'] is not None:
+            exits |= held & (pnl <= -params['stop_loss'])
+        if params['take_profit'] is not None:
+            exits |= held & (pnl >= params['take_profit'])
+        if t == data.end - 1:
+            exits = held.copy()  # 區間結束時全部結算
+        trade_returns.append(pnl[exits])
+        holding_days.append(age[exits])
+        held &= ~exits
+
+        # 收盤進場：評分最高的候選補滿部位
+        slots = params['max_positions'] - int(held.sum())
+        if slots > 0 and t < data.end - 1:
+            chosen = top_k(score[:, t], entries[:, t] & ~held, slots)
+            held[chosen] = True
+            age[chosen] = 0
+            entry_price[chosen] = price[chosen]
+
+        new_weights = held / held.sum() if held.any() else np.zeros(symbols)
+        traded = np.abs(new_weights - weights).sum()
+        weights = new_weights
+        daily_returns.append(daily_return - traded * cost_rate)
+        daily_turnover.append(traded / 2)
+
+    return _statistics(data, params, np.array(daily_returns), np.array(daily_turnover),
+                       np.concatenate(trade_returns), np.concatenate(holding_days), include_equity)
+
+
+def _statistics(data, params, daily_returns, daily_turnover, trade_returns, holding_days,
+                include_equity) -> dict:
+    equity = np.cumprod(1 + daily_returns)
+    drawdown = equity / np.maximum.accumulate(equity) - 1
+    days = len(daily_returns)
+    volatility = float(daily_returns.std() * np.sqrt(TRADING_DAYS)) if days > 1 else 0.0
+    annual_return = float(equity[-1] ** (TRADING_DAYS / days) - 1) if days else 0.0
+    result = {
+        'params': params,
+        'symbols': len(data.codes),
+        'start': data.dates[data.start],
+        'end': data.dates[data.end - 1],
+        'days': days,
+        'total_return': round(float(equity[-1] - 1), 4),
+        'annual_return': round(annual_return, 4),
+        'volatility': round(volatility, 4),
+        'sharpe': round(annual_return / volatility, 2) if volatility else 0.0,
+        'max_drawdown': round(float(drawdown.min()), 4),
+        'trades': int(len(trade_returns)),
+        'hit_rate': round(float((trade_returns > 0).mean()), 4) if len(trade_returns) else None,
+        'avg_trade_return': round(float(trade_returns.mean()), 4) if len(trade_returns) else None,
+        'avg_holding_days': round(float(holding_days.mean()), 1) if len(holding_days) else None,
+        'turnover': round(float(daily_turnover.mean()), 4),
+    }
+    if include_equity:
+        result['equity'] = [round(value, 4) for value in equity.tolist()]
+    return result
+
+
+# ── 平行回測 ───────────────────────────────────────────
+
+_worker_data = None
+
+
+def _init_worker(path, universe_spec, start, end):
+    """每個子行程只讀取一次價格歷史並計算指標"""
+    global _worker_data
+    _worker_data = load_backtest_data(path, universe_spec, start, end)
+
+
+def _run_worker(params):
+    return run_backtest(_worker_data, params)
+
+
+def run_backtests(param_sets: list, path: str | None = None, universe_spec=None,
+                  start: str | None = None, end: str | None = None,
+                  processes: int | None = None) -> list:
+    """
+    平行回測多組參數，結果順序與 param_sets 相同
+    :param processes: 子行程數，預設為 CPU 數；1 或只有一組參數時在本行程執行
+    """
+    for params in param_sets:
+        normalize_params(params)
+    processes = min(processes or os.cpu_count() or 1, len(param_sets))
+    if processes <= 1:
+        data = load_backtest_data(path, universe_spec, start, end)
+        return [run_backtest(data, params) for params in param_sets]
+    with ProcessPoolExecutor(max_workers=processes, initializer=_init_worker,
+                             initargs=(path, universe_spec, start, end)) as executor:
+        return list(executor.map(_run_worker, param_sets))
+
+
+def strategy_params(name: str) -> dict:
+    """預設選股策略（get_preset_strategies）對應的回測參數"""
+    from utils.stock_screener import StockScreener
+    strategies = StockScreener().get_preset_strategies()
+    if name not in strategies:
+        raise ValueError(f'未知的策略: {name}')
+    return dict(strategies[name]['criteria'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='以價格歷史庫回測預設選股策略')
+    parser.add_argument('--strategy', default='all', help='策略名稱，all 為全部預設策略')
+    parser.add_argument('--universe', default=None, help='選股範圍，例如 all、tse、industry:半導體業')
+    parser.add_argument('--history', default=None, help='價格歷史檔（預設 PRICE_HISTORY_FILE）')
+    parser.add_argument('--start', default=None, help='回測起日 YYYYMMDD')
+    parser.add_argument('--end', default=None, help='回測迄日 YYYYMMDD')
+    parser.add_argument('--hold-days', type=int, default=DEFAULT_PARAMS['hold_days'])
+    parser.add_argument('--max-positions', type=int, default=DEFAULT_PARAMS['max_positions'])
+    parser.add_argument('--processes', type=int, default=None)
+    args = parser.parse_args()
+
+    from utils.stock_screener import StockScreener
+    names = list(StockScreener().get_preset_strategies()) if args.strategy == 'all' else [args.strategy]
+    param_sets = [dict(strategy_params(name), hold_days=args.hold_days,
+                       max_positions=args.max_positions) for name in names]
+
+    started = time.perf_counter()
+    results = run_backtests(param_sets, args.history, args.universe, args.start, args.end, args.processes)
+    elapsed = time.perf_counter() - started
+
+    first = results[0]
+    print(f"📈 回測 {first['symbols']} 支股票，{first['start']} ~ {first['end']}（{first['days']} 個交易日），"
+          f"耗時 {elapsed:.2f} 秒")
+    print(f"{'策略':<18}{'總報酬':>9}{'年化':>9}{'波動':>8}{'Sharpe':>8}{'最大回撤':>9}"
+          f"{'交易數':>8}{'勝率':>8}{'周轉率':>8}")
+    print("-" * 87)
+    for name, result in zip(names, results):
+        hit_rate = f"{result['hit_rate']:.1%}" if result['hit_rate'] is not None else '—'
+        print(f"{name:<18}{result['total_return']:>9.1%}{result['annual_return']:>9.1%}"
+              f"{result['volatility']:>8.1%}{result['sharpe']:>8.2f}{result['max_drawdown']:>9.1%}"
+              f"{result['trades']:>8}{hit_rate:>8}{result['turnover']:>8.1%}")
+
+
+if __name__ == '__main__':
+    main()
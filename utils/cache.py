@@ -1,61 +1,876 @@
 """
 快取工具模組
 從 utils/twse.py 抽出，提供通用的文件型快取機制
+
+快取檔案依 key 的雜湊值分散到子目錄（cache/<2 碼雜湊>/<key>.json），
+避免單一目錄檔案過多；背景清理器會定期移除過期檔案，
+並在超過數量或容量上限時依 LRU 淘汰。
+
+檔案層前另有一層行程內的記憶體快取（LRU），熱門 key 不需每次讀檔；
+記憶體快取會定期寫成快照（cache/_snapshot/snapshot.json），
+重新啟動時先還原快照，避免重啟後所有請求同時打上游。
+
+每個 key 依前綴歸屬一個命名空間（見 CACHE_NAMESPACES），各自有
+有效時間、數量上限與過期後可作為備援的 stale 期間。命名空間與股票代號
+各有一個世代編號（generation），遞增編號即可讓整個命名空間或某股票
+在所有命名空間的快取一次失效，不需逐一刪檔。
 """
 
 import os
 import json
+import time
+import atexit
+import hashlib
+import threading
+from collections import OrderedDict
 from datetime import datetime, timedelta
 
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+from utils import cache_stats
+
 CACHE_DIR = os.environ.get('CACHE_DIR', 'cache')
 CACHE_DURATION = int(os.environ.get('CACHE_DURATION', 300))  # 預設 5 分鐘
+CACHE_MAX_ENTRIES = int(os.environ.get('CACHE_MAX_ENTRIES', 5000))
+CACHE_MAX_BYTES = int(os.environ.get('CACHE_MAX_BYTES', 50 * 1024 * 1024))  # 50 MB
+CACHE_SWEEP_INTERVAL = int(os.environ.get('CACHE_SWEEP_INTERVAL', 600))  # 10 分鐘
+NEGATIVE_CACHE_TTL = int(os.environ.get('NEGATIVE_CACHE_TTL', 60))  # 首次查無資料 1 分鐘
+NEGATIVE_CACHE_MAX_TTL = int(os.environ.get('NEGATIVE_CACHE_MAX_TTL', 3600))  # 最長 1 小時
+CACHE_MEMORY_MAX_ENTRIES = int(os.environ.get('CACHE_MEMORY_MAX_ENTRIES', 2000))
+CACHE_SNAPSHOT_INTERVAL = int(os.environ.get('CACHE_SNAPSHOT_INTERVAL', 120))  # 2 分鐘
+GENERATION_CHECK_INTERVAL = 1.0  # 秒，檢查其他 worker 是否遞增世代編號的間隔
+
+
+def _namespace_policy(prefix: str, name: str, ttl: int, max_entries: int,
+                      stale_ttl: int = 0, per_symbol: bool = False, memory: bool = True) -> dict:
+    """
+    建立命名空間策略，可用環境變數覆寫：
+    CACHE_TTL_<NAME> / CACHE_MAX_ENTRIES_<NAME> / CACHE_STALE_TTL_<NAME>
+    """
+    env_name = name.upper()
+    return {
+        'prefix': prefix,
+        'ttl': int(os.environ.get(f'CACHE_TTL_{env_name}', ttl)),
+        'max_entries': int(os.environ.get(f'CACHE_MAX_ENTRIES_{env_name}', max_entries)),
+        'stale_ttl': int(os.environ.get(f'CACHE_STALE_TTL_{env_name}', stale_ttl)),
+        'per_symbol': per_symbol,
+        'memory': memory,
+    }
+
+
+# 命名空間策略
+#   ttl        : 有效秒數
+#   max_entries: 檔案數量上限（清理時超過即依 LRU 淘汰）
+#   stale_ttl  : 過期後仍保留、可由 get_stale_cache() 作為上游失敗時備援的秒數
+#   per_symbol : key 格式為 <prefix><股票代號>[_...]，受股票世代編號影響
+#   memory     : False 時不經行程內記憶體層，每次讀取檔案（跨 worker 協調用的 key）
+CACHE_NAMESPACES = {
+    'stock_basic': _namespace_policy('stock_basic_', 'stock_basic', CACHE_DURATION, 3000,
+                                     stale_ttl=1800, per_symbol=True),
+    'stock_name': _namespace_policy('stock_name_', 'stock_name', 86400, 5000,
+                                    stale_ttl=7 * 86400, per_symbol=True),
+    'chart': _namespace_policy('chart_', 'chart', CACHE_DURATION, 2000,
+                               stale_ttl=3600, per_symbol=True),
+    # 分析結果記錄輸入資料版本，輸入變動才重算，因此有效時間較長
+    'analysis': _namespace_policy('analysis_', 'analysis', 86400, 3000,
+                                  per_symbol=True),
+    # 完整技術指標序列（utils/indicator_service.py），key 含股票、天數與參數版本
+    'indicators': _namespace_policy('indicators_', 'indicators', CACHE_DURATION, 2000,
+                                    per_symbol=True),
+    # 增量指標狀態（utils/streaming_indicators.py），逐筆報價更新，一週未更新則重新建立
+    'indicator_state': _namespace_policy('indicator_state_', 'indicator_state', 7 * 86400, 3000,
+                                         per_symbol=True),
+    # 即時選股結果（utils/screener_cache.py），與報價快取同樣的有效時間
+    'screener': _namespace_policy('screener_', 'screener', CACHE_DURATION, 200),
+    # 選股工作紀錄（utils/screener_jobs.py），各 worker 共用以輪詢與加入既有工作；ttl 由寫入端指定
+    'screener_jobs': _namespace_policy('screener_job_', 'screener_jobs', 300, 200, memory=False),
+    'market': _namespace_policy('market_', 'market', CACHE_DURATION, 50, stale_ttl=3600),
+    'news': _namespace_policy('yahoo_stock_news', 'news', CACHE_DURATION, 50, stale_ttl=3600),
+    # 串流選股的存在與取消紀錄，由任一 worker 的取消端點寫入、串流所在的 worker 輪詢
+    'stream': _namespace_policy('stream_', 'stream', 3600, 500, memory=False),
+    'negative': _namespace_policy('negative_', 'negative', NEGATIVE_CACHE_TTL, 2000,
+                                  stale_ttl=NEGATIVE_CACHE_MAX_TTL),
+    'other': _namespace_policy('', 'other', CACHE_DURATION, CACHE_MAX_ENTRIES),
+}
+
+# 寫入快照的命名空間（重啟後最先被大量讀取的資料）
+SNAPSHOT_NAMESPACES = ('stock_basic', 'market', 'news', 'stock_name')
+
+# 前綴由長到短比對，空前綴（other）最後
+_PREFIX_ORDER = sorted(
+    ((policy['prefix'], name) for name, policy in CACHE_NAMESPACES.items()),
+    key=lambda item: len(item[0]), reverse=True,
+)
 
 os.makedirs(CACHE_DIR, exist_ok=True)
+cache_stats.configure(CACHE_DIR)
+
+_sweeper_thread = None
+_sweeper_args = None
+_sweeper_lock = threading.Lock()
+
+_snapshot_thread = None
+_snapshot_interval = None
+_snapshot_lock = threading.Lock()
+
+# 記憶體層：key -> (建立時間 epoch, ttl, 序列化後的資料, 世代編號)
+# 以 JSON 字串保存，避免呼叫端修改回傳的 dict 汙染快取
+_memory: OrderedDict = OrderedDict()
+_memory_lock = threading.Lock()
+
+# 世代編號（跨 worker 共用 cache/_generations/generations.json）
+_generations = {'namespaces': {}, 'symbols': {}}
+_generations_mtime = None
+_generations_checked = 0.0
+_generations_lock = threading.Lock()
+
+
+# ── 命名空間 ────────────────────────────────────────────────
+
+def namespace_of(key: str) -> str:
+    """由快取 key 的前綴推得命名空間，無法辨識者歸類為 other"""
+    for prefix, namespace in _PREFIX_ORDER:
+        if key.startswith(prefix):
+            return namespace
+    return 'other'
+
+
+def symbol_of(key: str, namespace: str | None = None) -> str | None:
+    """取出 per_symbol 命名空間 key 中的股票代號（例如 chart_2330_14 → 2330）"""
+    namespace = namespace or namespace_of(key)
+    policy = CACHE_NAMESPACES[namespace]
+    if not policy['per_symbol']:
+        return None
+    rest = key[len(policy['prefix']):]
+    return rest.split('_', 1)[0] or None
+
+
+def namespace_policies() -> dict:
+    """回傳所有命名空間策略（供管理端點與 CLI 顯示）"""
+    return {name: dict(policy) for name, policy in CACHE_NAMESPACES.items()}
+
+
+# ── 世代編號 ────────────────────────────────────────────────
+
+def _generations_path() -> str:
+    return os.path.join(CACHE_DIR, '_generations', 'generations.json')
+
+
+def _load_generations_file() -> dict:
+    try:
+        with open(_generations_path(), 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        return {
+            'namespaces': data.get('namespaces', {}),
+            'symbols': data.get('symbols', {}),
+        }
+    except FileNotFoundError:
+        return {'namespaces': {}, 'symbols': {}}
+
+
+def _current_generations() -> dict:
+    """回傳目前的世代編號；每 GENERATION_CHECK_INTERVAL 秒檢查一次檔案是否被其他 worker 更新"""
+    global _generations, _generations_mtime, _generations_checked
+    now = time.monotonic()
+    if now - _generations_checked < GENERATION_CHECK_INTERVAL:
+        return _generations
+    with _generations_lock:
+        _generations_checked = now
+        try:
+            mtime = os.path.getmtime(_generations_path())
+        except OSError:
+            mtime = None
+        if mtime != _generations_mtime:
+            try:
+                _generations = _load_generations_file()
+                _generations_mtime = mtime
+            except Exception as e:
+                print(f"❌ 讀取快取世代編號失敗: {e}")
+    return _generations
+
+
+def _entry_generation(key: str, namespace: str) -> list:
+    """key 目前應有的 [命名空間世代, 股票世代]"""
+    generations = _current_generations()
+    symbol = symbol_of(key, namespace)
+    return [
+        generations['namespaces'].get(namespace, 0),
+        generations['symbols'].get(symbol, 0) if symbol else 0,
+    ]
+
+
+def _bump_generation(section: str, name: str) -> int:
+    """遞增世代編號並寫回檔案（以檔案鎖避免多個 worker 同時更新）"""
+    global _generations, _generations_mtime, _generations_checked
+    path = _generations_path()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with _generations_lock, open(f"{path}.lock", 'a') as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            generations = _load_generations_file()
+            generation = generations[section].get(name, 0) + 1
+            generations[section][name] = generation
+            tmp_file = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump(generations, f, ensure_ascii=False)
+            os.replace(tmp_file, path)
+            _generations = generations
+            _generations_mtime = os.path.getmtime(path)
+            _generations_checked = time.monotonic()
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+    return generation
+
+
+def bump_namespace_generation(namespace: str) -> int:
+    """遞增命名空間世代編號，該命名空間所有既有快取立即失效（O(1)），回傳新編號"""
+    if namespace not in CACHE_NAMESPACES:
+        raise ValueError(f"未知的快取命名空間: {namespace}")
+    return _bump_generation('namespaces', namespace)
+
+
+def invalidate_namespace(namespace: str, purge: bool = False) -> int:
+    """
+    使整個命名空間的快取失效。
+
+    :param purge: 是否同時立即刪除該命名空間的檔案（O(n)）；
+                  否則留給背景清理器回收
+    :return: 新的命名空間世代編號
+    """
+    generation = bump_namespace_generation(namespace)
+    if purge:
+        for path, _ in list(_iter_cache_files()):
+            if _namespace_of_path(path) == namespace:
+                _remove_file(path)
+    print(f"♻️ 快取命名空間已失效: {namespace}（世代 {generation}）")
+    return generation
+
+
+def invalidate_symbol(symbol: str) -> int:
+    """
+    使某股票在所有 per_symbol 命名空間（stock_basic / chart / analysis ...）的快取失效，
+    並清除其負向快取。只遞增一個編號（O(1)），回傳新的股票世代編號。
+    """
+    generation = _bump_generation('symbols', symbol)
+    clear_negative_cache(f"stock_basic_{symbol}")
+    print(f"♻️ 股票快取已失效: {symbol}（世代 {generation}）")
+    return generation
+
+
+# ── 讀寫 ────────────────────────────────────────────────────
+
+def _shard_dir(key: str) -> str:
+    """依 key 的雜湊值決定分片子目錄（256 個）"""
+    digest = hashlib.md5(key.encode('utf-8')).hexdigest()
+    return os.path.join(CACHE_DIR, digest[:2])
+
+
+def _cache_path(key: str) -> str:
+    return os.path.join(_shard_dir(key), f"{key}.json")
+
+
+def _legacy_path(key: str) -> str:
+    """分片前的舊路徑（cache/<key>.json），僅供讀取相容"""
+    return os.path.join(CACHE_DIR, f"{key}.json")
+
+
+def _entry_state(key: str, namespace: str, created: float, ttl: int, generation,
+                 max_age: int | None = None) -> str:
+    """
+    判斷快取項目狀態：
+    fresh（有效）/ stale（過期但在 stale 期間內）/ expired / invalidated（世代不符）
+    """
+    if list(generation or (0, 0)) != _entry_generation(key, namespace):
+        return 'invalidated'
+    age = time.time() - created
+    limit = max_age if max_age is not None else ttl
+    if age < limit:
+        return 'fresh'
+    if age < limit + CACHE_NAMESPACES[namespace]['stale_ttl']:
+        return 'stale'
+    return 'expired'
+
+
+def _file_entry_state(key: str, namespace: str, cache_data: dict,
+                      max_age: int | None = None) -> str:
+    created = datetime.fromisoformat(cache_data['timestamp']).timestamp()
+    ttl = cache_data.get('ttl', CACHE_NAMESPACES[namespace]['ttl'])
+    return _entry_state(key, namespace, created, ttl, cache_data.get('gen'), max_age)
+
+
+def _memory_get(key: str, namespace: str, max_age: int | None):
+    """從記憶體層讀取；過期或世代不符則移除並回傳 None"""
+    with _memory_lock:
+        entry = _memory.get(key)
+        if entry is None:
+            return None
+        created, ttl, raw, generation = entry
+    state = _entry_state(key, namespace, created, ttl, generation, max_age)
+    if state != 'fresh':
+        if max_age is None or state == 'invalidated':
+            _memory_pop(key)
+        return None
+    with _memory_lock:
+        if key in _memory:
+            _memory.move_to_end(key)
+    return json.loads(raw)
+
+
+def _memory_put(key: str, cache_data: dict) -> None:
+    namespace = namespace_of(key)
+    if not CACHE_NAMESPACES[namespace]['memory']:
+        return
+    created = datetime.fromisoformat(cache_data['timestamp']).timestamp()
+    ttl = cache_data.get('ttl', CACHE_NAMESPACES[namespace]['ttl'])
+    raw = json.dumps(cache_data['data'], ensure_ascii=False)
+    evicted = []
+    with _memory_lock:
+        _memory[key] = (created, ttl, raw, cache_data.get('gen'))
+        _memory.move_to_end(key)
+        while len(_memory) > CACHE_MEMORY_MAX_ENTRIES:
+            evicted.append(_memory.popitem(last=False)[0])
+    for evicted_key in evicted:
+        cache_stats.record(namespace_of(evicted_key), 'memory_evictions')
+
+
+def _memory_pop(key: str) -> None:
+    with _memory_lock:
+        _memory.pop(key, None)
 
 
-def get_cache(key: str):
+def _read_file_entry(key: str):
+    """讀取檔案層的原始快取內容（不檢查是否過期），回傳 (路徑, 內容)"""
+    for cache_file in (_cache_path(key), _legacy_path(key)):
+        try:
+            with open(cache_file, 'r', encoding='utf-8') as f:
+                raw = f.read()
+        except FileNotFoundError:
+            continue
+        cache_stats.record(namespace_of(key), 'bytes_read', len(raw.encode('utf-8')))
+        return cache_file, json.loads(raw)
+    return None, None
+
+
+def get_cache(key: str, max_age: int | None = None):
     """
     讀取快取資料。
-    若快取不存在或已過期則回傳 None。
+    若快取不存在、已過期或已被世代編號失效則回傳 None。
+
+    :param max_age: 覆寫有效秒數；未指定時使用寫入時記錄的 ttl，
+                    再無則使用命名空間的 ttl。
     """
-    cache_file = os.path.join(CACHE_DIR, f"{key}.json")
-    if not os.path.exists(cache_file):
+    namespace = namespace_of(key)
+    started = time.perf_counter()
+    try:
+        data = _memory_get(key, namespace, max_age)
+        if data is not None:
+            cache_stats.record(namespace, 'hits')
+            cache_stats.record(namespace, 'memory_hits')
+            return data
+
+        try:
+            cache_file, cache_data = _read_file_entry(key)
+            if cache_data is None:
+                cache_stats.record(namespace, 'misses')
+                return None
+            state = _file_entry_state(key, namespace, cache_data, max_age)
+            if state == 'fresh':
+                # 更新 mtime 作為最近存取時間，供 LRU 淘汰使用
+                try:
+                    os.utime(cache_file)
+                except OSError:
+                    pass
+                cache_stats.record(namespace, 'hits')
+                _memory_put(key, cache_data)
+                return cache_data['data']
+            if state in ('stale', 'expired'):
+                cache_stats.record(namespace, 'expirations')
+        except Exception as e:
+            print(f"❌ 讀取快取失敗 [{key}]: {e}")
+        cache_stats.record(namespace, 'misses')
         return None
+    finally:
+        cache_stats.record_timing(namespace, 'get', time.perf_counter() - started)
+
+
+def get_stale_cache(key: str):
+    """
+    讀取快取資料，允許回傳已過期但仍在命名空間 stale_ttl 期間內的資料。
+    供上游全部失敗時作為備援；世代編號失效的資料不會回傳。
+    呼叫端在此之前已以 get_cache() 查詢過（已記錄一次 miss），這裡直接讀取，
+    只記錄 stale_hits，不重複計入 hits / misses。
+    """
+    namespace = namespace_of(key)
+    data = _memory_get(key, namespace, None)
+    if data is not None:
+        return data
     try:
-        with open(cache_file, 'r', encoding='utf-8') as f:
-            cache_data = json.load(f)
-        cache_time = datetime.fromisoformat(cache_data['timestamp'])
-        if datetime.now() - cache_time < timedelta(seconds=CACHE_DURATION):
+        _, cache_data = _read_file_entry(key)
+        if cache_data is None:
+            return None
+        state = _file_entry_state(key, namespace, cache_data)
+        if state == 'fresh':
+            # 查詢後其他執行緒 / worker 剛寫入
+            return cache_data['data']
+        if state == 'stale':
+            cache_stats.record(namespace, 'stale_hits')
             return cache_data['data']
     except Exception as e:
-        print(f"❌ 讀取快取失敗 [{key}]: {e}")
+        print(f"❌ 讀取過期快取失敗 [{key}]: {e}")
     return None
 
 
-def save_cache(key: str, data) -> None:
+def has_fresh_cache(key: str) -> bool:
+    """
+    檢查是否有有效快取（不讀取內容、不計入統計）。
+    供呼叫端判斷是否即將向上游發出請求，例如套用速率限制。
+    """
+    namespace = namespace_of(key)
+    with _memory_lock:
+        entry = _memory.get(key)
+    if entry is not None:
+        created, ttl, _, generation = entry
+        if _entry_state(key, namespace, created, ttl, generation) == 'fresh':
+            return True
+    try:
+        for cache_file in (_cache_path(key), _legacy_path(key)):
+            if not os.path.exists(cache_file):
+                continue
+            with open(cache_file, 'r', encoding='utf-8') as f:
+                cache_data = json.load(f)
+            return _file_entry_state(key, namespace, cache_data) == 'fresh'
+    except Exception:
+        pass
+    return False
+
+
+def save_cache(key: str, data, ttl: int | None = None) -> None:
     """
     儲存資料至快取。
-    快取格式：{'timestamp': ISO格式時間, 'data': 實際資料}
+    快取格式：{'timestamp': ISO格式時間, 'data': 實際資料, 'ttl': 有效秒數,
+              'gen': [命名空間世代, 股票世代]}
+
+    先寫入暫存檔再以 os.replace 置換，避免其他 worker 讀到寫一半的檔案。
+
+    :param ttl: 有效秒數，預設使用命名空間的 ttl
     """
-    cache_file = os.path.join(CACHE_DIR, f"{key}.json")
+    namespace = namespace_of(key)
+    started = time.perf_counter()
+    cache_file = _cache_path(key)
     try:
+        os.makedirs(os.path.dirname(cache_file), exist_ok=True)
         cache_data = {
             'timestamp': datetime.now().isoformat(),
-            'data': data
+            'data': data,
+            'ttl': ttl if ttl is not None else CACHE_NAMESPACES[namespace]['ttl'],
+            'gen': _entry_generation(key, namespace),
         }
-        with open(cache_file, 'w', encoding='utf-8') as f:
-            json.dump(cache_data, f, ensure_ascii=False, indent=2)
+        raw = json.dumps(cache_data, ensure_ascii=False, indent=2)
+        tmp_file = f"{cache_file}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            f.write(raw)
+        os.replace(tmp_file, cache_file)
+        _memory_put(key, cache_data)
+        cache_stats.record(namespace, 'bytes_written', len(raw.encode('utf-8')))
     except Exception as e:
         print(f"❌ 儲存快取失敗 [{key}]: {e}")
+    finally:
+        cache_stats.record_timing(namespace, 'set', time.perf_counter() - started)
+
+
+def content_version(data) -> str:
+    """
+    計算資料內容的版本（雜湊值）。
+    衍生快取（例如技術分析）記錄輸入資料的版本，輸入未變動即可直接沿用。
+    """
+    raw = json.dumps(data, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()[:16]
 
 
 def clear_cache(key: str) -> bool:
-    """清除指定快取"""
-    cache_file = os.path.join(CACHE_DIR, f"{key}.json")
+    """清除指定快取（本行程的記憶體層與檔案）"""
+    _memory_pop(key)
+    removed = False
+    for cache_file in (_cache_path(key), _legacy_path(key)):
+        try:
+            if os.path.exists(cache_file):
+                os.remove(cache_file)
+                removed = True
+        except Exception as e:
+            print(f"❌ 清除快取失敗 [{key}]: {e}")
+    return removed
+
+
+# ── 負向快取（查無資料） ─────────────────────────────────
+
+def _negative_key(key: str) -> str:
+    return f"negative_{key}"
+
+
+def get_negative_cache(key: str):
+    """
+    讀取負向快取。
+    若 key 近期被記錄為查無資料，回傳當時儲存的資料（例如錯誤訊息 dict），否則回傳 None。
+    """
+    entry = get_cache(_negative_key(key))
+    if entry is None:
+        return None
+    return entry.get('data')
+
+
+def save_negative_cache(key: str, data=None, extend: bool = True) -> int:
+    """
+    記錄 key 查無資料，並回傳本次負向快取的有效秒數。
+
+    有效時間從 NEGATIVE_CACHE_TTL 開始，連續查無資料時每次加倍，
+    上限為 NEGATIVE_CACHE_MAX_TTL；若距上次記錄已超過「上次有效時間 +
+    NEGATIVE_CACHE_MAX_TTL」，視為新的一輪重新計算。
+
+    :param extend: False 時沿用目前的查無次數，不加倍有效時間（查無結果不夠確定時使用）
+    """
+    neg_key = _negative_key(key)
+    misses = 1
     try:
-        if os.path.exists(cache_file):
-            os.remove(cache_file)
-            return True
+        _, previous = _read_file_entry(neg_key)
+        if previous:
+            prev_time = datetime.fromisoformat(previous['timestamp'])
+            prev_ttl = previous.get('ttl', NEGATIVE_CACHE_TTL)
+            if datetime.now() - prev_time < timedelta(seconds=prev_ttl + NEGATIVE_CACHE_MAX_TTL):
+                misses = max(1, int(previous['data'].get('misses', 0)) + (1 if extend else 0))
+    except Exception:
+        misses = 1
+
+    ttl = min(NEGATIVE_CACHE_TTL * (2 ** (misses - 1)), NEGATIVE_CACHE_MAX_TTL)
+    save_cache(neg_key, {'misses': misses, 'data': data}, ttl=ttl)
+    return ttl
+
+
+def clear_negative_cache(key: str) -> bool:
+    """清除負向快取（例如資料來源恢復後）"""
+    return clear_cache(_negative_key(key))
+
+
+# ── 容量控管與背景清理 ─────────────────────────────────────
+
+def _iter_cache_files():
+    """列出根目錄（舊格式）與各分片子目錄中的快取檔案"""
+    try:
+        top_entries = list(os.scandir(CACHE_DIR))
+    except FileNotFoundError:
+        return
+    for entry in top_entries:
+        if entry.is_file() and entry.name.endswith('.json'):
+            yield entry.path, True
+        elif entry.is_dir() and len(entry.name) == 2:
+            try:
+                for sub in os.scandir(entry.path):
+                    if sub.is_file() and sub.name.endswith('.json'):
+                        yield sub.path, False
+            except FileNotFoundError:
+                continue
+
+
+def _key_of_path(path: str) -> str:
+    return os.path.basename(path)[:-len('.json')]
+
+
+def _namespace_of_path(path: str) -> str:
+    return namespace_of(_key_of_path(path))
+
+
+def _remove_file(path: str) -> int:
+    """刪除檔案並回傳釋放的位元組數（檔案已被其他 worker 刪除時回傳 0）"""
+    try:
+        size = os.path.getsize(path)
+        os.remove(path)
+        return size
+    except FileNotFoundError:
+        return 0
+
+
+def sweep_cache(max_entries: int | None = None, max_bytes: int | None = None) -> dict:
+    """
+    清理快取目錄並回報回收結果。
+
+    1. 將舊格式（根目錄）的快取檔搬移至分片子目錄
+    2. 移除已超過 stale 期間、世代編號失效或毀損的檔案（優先回收）
+    3. 各命名空間超過自身 max_entries 時，依最近存取時間（mtime）由舊到新淘汰
+    4. 若整體仍超過數量或容量上限，再依最近存取時間淘汰
+
+    :return: dict，包含 scanned / migrated / expired / invalidated / corrupt /
+             evicted / bytes_reclaimed / entries / bytes / namespaces / duration_ms
+    """
+    max_entries = CACHE_MAX_ENTRIES if max_entries is None else max_entries
+    max_bytes = CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    started = time.perf_counter()
+
+    report = {
+        'scanned': 0, 'migrated': 0, 'expired': 0, 'invalidated': 0, 'corrupt': 0,
+        'evicted': 0, 'bytes_reclaimed': 0, 'entries': 0, 'bytes': 0,
+    }
+    alive = {}  # namespace -> [(mtime, size, path)]
+
+    for path, is_legacy in list(_iter_cache_files()):
+        report['scanned'] += 1
+        key = _key_of_path(path)
+        namespace = namespace_of(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                cache_data = json.load(f)
+            state = _file_entry_state(key, namespace, cache_data)
+        except FileNotFoundError:
+            continue
+        except Exception:
+            report['corrupt'] += 1
+            report['bytes_reclaimed'] += _remove_file(path)
+            continue
+
+        if state in ('expired', 'invalidated'):
+            report[state] += 1
+            report['bytes_reclaimed'] += _remove_file(path)
+            if state == 'expired':
+                cache_stats.record(namespace, 'expirations')
+            continue
+
+        if is_legacy:
+            target = _cache_path(key)
+            try:
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                if os.path.exists(target):
+                    report['bytes_reclaimed'] += _remove_file(path)
+                    continue
+                os.replace(path, target)
+                path = target
+                report['migrated'] += 1
+            except OSError:
+                continue
+
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            continue
+        alive.setdefault(namespace, []).append((stat.st_mtime, stat.st_size, path))
+
+    def _evict(path, namespace):
+        report['evicted'] += 1
+        report['bytes_reclaimed'] += _remove_file(path)
+        cache_stats.record(namespace, 'evictions')
+
+    # 各命名空間的數量上限
+    survivors = []
+    for namespace, files in alive.items():
+        files.sort()
+        excess = len(files) - CACHE_NAMESPACES[namespace]['max_entries']
+        for _, _, path in files[:max(0, excess)]:
+            _evict(path, namespace)
+        survivors.extend((mtime, size, path, namespace)
+                         for mtime, size, path in files[max(0, excess):])
+
+    # 整體數量與容量上限
+    total_bytes = sum(item[1] for item in survivors)
+    total_entries = len(survivors)
+    survivors.sort()
+    remaining = {}
+    for mtime, size, path, namespace in survivors:
+        if total_entries > max_entries or total_bytes > max_bytes:
+            _evict(path, namespace)
+            total_entries -= 1
+            total_bytes -= size
+            continue
+        remaining[namespace] = remaining.get(namespace, 0) + 1
+
+    report['entries'] = total_entries
+    report['bytes'] = total_bytes
+    report['namespaces'] = remaining
+    report['duration_ms'] = round((time.perf_counter() - started) * 1000, 1)
+    cache_stats.flush()
+
+    print(
+        f"🧹 快取清理完成: 掃描 {report['scanned']}，過期 {report['expired']}，"
+        f"失效 {report['invalidated']}，毀損 {report['corrupt']}，淘汰 {report['evicted']}，"
+        f"回收 {report['bytes_reclaimed']:,} bytes，剩餘 {report['entries']} 筆"
+    )
+    return report
+
+
+def start_cache_sweeper(interval: int | None = None,
+                        max_entries: int | None = None,
+                        max_bytes: int | None = None) -> threading.Thread:
+    """
+    啟動背景快取清理執行緒（每個行程只會啟動一次）。
+
+    :param interval: 清理間隔秒數，預設 CACHE_SWEEP_INTERVAL
+    :param max_entries: 快取檔案數量上限，預設 CACHE_MAX_ENTRIES
+    :param max_bytes: 快取總容量上限，預設 CACHE_MAX_BYTES
+    """
+    global _sweeper_thread, _sweeper_args
+    interval = CACHE_SWEEP_INTERVAL if interval is None else interval
+
+    with _sweeper_lock:
+        _sweeper_args = (interval, max_entries, max_bytes)
+        if _sweeper_thread is not None and _sweeper_thread.is_alive():
+            return _sweeper_thread
+
+        def _run():
+            while True:
+                time.sleep(interval)
+                try:
+                    sweep_cache(max_entries, max_bytes)
+                except Exception as e:
+                    print(f"❌ 背景快取清理失敗: {e}")
+
+        _sweeper_thread = threading.Thread(target=_run, name='cache-sweeper', daemon=True)
+        _sweeper_thread.start()
+        return _sweeper_thread
+
+
+# ── 快照與啟動預熱 ─────────────────────────────────────────
+
+def _snapshot_path() -> str:
+    return os.path.join(CACHE_DIR, '_snapshot', 'snapshot.json')
+
+
+def _load_snapshot_entries() -> dict:
+    try:
+        with open(_snapshot_path(), 'r', encoding='utf-8') as f:
+            return json.load(f).get('entries', {})
+    except FileNotFoundError:
+        return {}
     except Exception as e:
-        print(f"❌ 清除快取失敗 [{key}]: {e}")
-    return False
+        print(f"❌ 讀取快取快照失敗: {e}")
+        return {}
+
+
+def _snapshot_entry_valid(key: str, entry: dict) -> bool:
+    return _entry_state(key, namespace_of(key), entry['created'], entry['ttl'],
+                        entry.get('gen')) == 'fresh'
+
+
+def write_snapshot() -> int:
+    """
+    將記憶體層中熱門命名空間的有效資料寫入快照，回傳寫入筆數。
+
+    多個 worker 共用同一份快照：寫入前先合併既有快照，
+    同一 key 保留時間較新的版本，並丟棄已過期或已失效的項目。
+    """
+    entries = {}
+    for key, entry in _load_snapshot_entries().items():
+        try:
+            if _snapshot_entry_valid(key, entry):
+                entries[key] = entry
+        except Exception:
+            continue
+
+    with _memory_lock:
+        memory_items = list(_memory.items())
+    for key, (created, ttl, raw, generation) in memory_items:
+        if namespace_of(key) not in SNAPSHOT_NAMESPACES:
+            continue
+        entry = {'created': created, 'ttl': ttl, 'gen': generation}
+        if not _snapshot_entry_valid(key, entry):
+            continue
+        existing = entries.get(key)
+        if existing is None or existing['created'] < created:
+            entry['data'] = json.loads(raw)
+            entries[key] = entry
+
+    snapshot_file = _snapshot_path()
+    try:
+        os.makedirs(os.path.dirname(snapshot_file), exist_ok=True)
+        tmp_file = f"{snapshot_file}.{os.getpid()}.tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump({'written_at': time.time(), 'entries': entries}, f, ensure_ascii=False)
+        os.replace(tmp_file, snapshot_file)
+    except Exception as e:
+        print(f"❌ 寫入快取快照失敗: {e}")
+        return 0
+    return len(entries)
+
+
+def restore_snapshot() -> int:
+    """將快照中仍在有效期內的項目載入記憶體層，回傳還原筆數"""
+    restored = 0
+    for key, entry in _load_snapshot_entries().items():
+        try:
+            if not _snapshot_entry_valid(key, entry):
+                continue
+            _memory_put(key, {
+                'timestamp': datetime.fromtimestamp(entry['created']).isoformat(),
+                'ttl': entry['ttl'],
+                'gen': entry.get('gen'),
+                'data': entry['data'],
+            })
+            restored += 1
+        except Exception:
+            continue
+    if restored:
+        print(f"♨️ 已從快照預熱 {restored} 筆快取")
+    return restored
+
+
+def start_snapshot_writer(interval: int | None = None) -> threading.Thread:
+    """
+    啟動定期寫入快照的背景執行緒（每個行程只會啟動一次），
+    並在行程結束時再寫一次快照。
+
+    :param interval: 寫入間隔秒數，預設 CACHE_SNAPSHOT_INTERVAL
+    """
+    global _snapshot_thread, _snapshot_interval
+    interval = CACHE_SNAPSHOT_INTERVAL if interval is None else interval
+
+    with _snapshot_lock:
+        first_start = _snapshot_interval is None
+        _snapshot_interval = interval
+        if _snapshot_thread is not None and _snapshot_thread.is_alive():
+            return _snapshot_thread
+
+        def _run():
+            while True:
+                time.sleep(interval)
+                try:
+                    write_snapshot()
+                except Exception as e:
+                    print(f"❌ 定期寫入快取快照失敗: {e}")
+
+        _snapshot_thread = threading.Thread(target=_run, name='cache-snapshot', daemon=True)
+        _snapshot_thread.start()
+        if first_start:
+            atexit.register(write_snapshot)
+        return _snapshot_thread
+
+
+def _reset_after_fork() -> None:
+    """
+    fork 後子行程不會繼承執行緒；重建鎖並清除執行緒參照。
+    不在此重新啟動背景工作：ProcessPoolExecutor 的子行程（指標、回測、最佳化）也會經過這裡，
+    只有伺服器 worker 需要，由 restart_background_threads() 明確啟動。
+    """
+    global _sweeper_thread, _snapshot_thread
+    global _sweeper_lock, _snapshot_lock, _memory_lock, _generations_lock
+    # fork 當下若有其他執行緒持有鎖，子行程中會永遠無法取得，一律重建
+    _sweeper_lock = threading.Lock()
+    _snapshot_lock = threading.Lock()
+    _memory_lock = threading.Lock()
+    _generations_lock = threading.Lock()
+    _sweeper_thread = None
+    _snapshot_thread = None
+
+
+def restart_background_threads() -> None:
+    """
+    在 fork 出的伺服器 worker 中重新啟動父行程已設定的背景清理與快照寫入
+    （gunicorn --preload 時由 gunicorn.conf.py 的 post_fork 呼叫）
+    """
+    if _sweeper_args is not None:
+        start_cache_sweeper(*_sweeper_args)
+    if _snapshot_interval is not None:
+        start_snapshot_writer(_snapshot_interval)
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
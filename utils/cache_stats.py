@@ -0,0 +1,229 @@
+"""
+快取統計模組
+記錄 utils/cache.py 各命名空間（見 cache.CACHE_NAMESPACES）的命中率、容量與延遲
+
+每個行程（gunicorn worker）在記憶體中累計計數，定期寫入
+cache/_stats/<pid>.json；aggregate_stats() 會合併所有 worker 的檔案，
+並移除已結束的行程或超過 CACHE_STATS_MAX_AGE 秒未更新的檔案。
+"""
+
+import os
+import json
+import time
+import atexit
+import tempfile
+import threading
+
+STATS_FLUSH_INTERVAL = int(os.environ.get('CACHE_STATS_FLUSH_INTERVAL', 10))  # 秒
+STATS_MAX_AGE = int(os.environ.get('CACHE_STATS_MAX_AGE', 86400))  # 秒
+
+COUNTER_FIELDS = (
+    'hits', 'memory_hits', 'misses', 'stale_hits', 'expirations',
+    'evictions', 'memory_evictions', 'bytes_read', 'bytes_written',
+)
+TIMING_OPS = ('get', 'set')
+
+_lock = threading.Lock()
+_stats: dict = {}
+_last_flush = 0.0
+_reset_seen = time.time()
+_stats_dir = None
+
+
+def _empty_namespace() -> dict:
+    entry = {field: 0 for field in COUNTER_FIELDS}
+    for op in TIMING_OPS:
+        entry[f'{op}_count'] = 0
+        entry[f'{op}_total_ms'] = 0.0
+        entry[f'{op}_max_ms'] = 0.0
+    return entry
+
+
+def configure(cache_dir: str) -> None:
+    """設定統計檔案目錄（cache/_stats）"""
+    global _stats_dir
+    _stats_dir = os.path.join(cache_dir, '_stats')
+
+
+def record(namespace: str, field: str, amount: int = 1) -> None:
+    """累加計數器"""
+    with _lock:
+        entry = _stats.setdefault(namespace, _empty_namespace())
+        entry[field] += amount
+    _maybe_flush()
+
+
+def record_timing(namespace: str, op: str, seconds: float) -> None:
+    """記錄 get / set 耗時"""
+    elapsed_ms = seconds * 1000
+    with _lock:
+        entry = _stats.setdefault(namespace, _empty_namespace())
+        entry[f'{op}_count'] += 1
+        entry[f'{op}_total_ms'] += elapsed_ms
+        if elapsed_ms > entry[f'{op}_max_ms']:
+            entry[f'{op}_max_ms'] = elapsed_ms
+    _maybe_flush()
+
+
+def _maybe_flush() -> None:
+    if time.monotonic() - _last_flush >= STATS_FLUSH_INTERVAL:
+        flush()
+
+
+def flush() -> None:
+    """將本行程的計數寫入 _stats/<pid>.json"""
+    global _last_flush, _reset_seen
+    if _stats_dir is None:
+        return
+    try:
+        reset_at = os.path.getmtime(os.path.join(_stats_dir, '_reset'))
+    except OSError:
+        reset_at = 0.0
+    with _lock:
+        _last_flush = time.monotonic()
+        if reset_at > _reset_seen:
+            # 其他 worker 執行過 reset_stats()，本行程計數一併歸零
+            _stats.clear()
+            _reset_seen = reset_at
+        snapshot = {ns: dict(entry) for ns, entry in _stats.items()}
+    try:
+        os.makedirs(_stats_dir, exist_ok=True)
+        stats_file = os.path.join(_stats_dir, f"{os.getpid()}.json")
+        # 每次寫入使用獨立的暫存檔，避免同一行程的多個執行緒同時寫入同一個檔案
+        fd, tmp_file = tempfile.mkstemp(dir=_stats_dir, prefix=f".{os.getpid()}.", suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump({'pid': os.getpid(), 'updated': time.time(), 'namespaces': snapshot}, f)
+            os.replace(tmp_file, stats_file)
+        except Exception:
+            try:
+                os.remove(tmp_file)
+            except OSError:
+                pass
+            raise
+    except Exception as e:
+        print(f"❌ 寫入快取統計失敗: {e}")
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True  # 行程存在但屬於其他使用者
+    except (OSError, ValueError):
+        return False
+    return True
+
+
+def _is_stale(path: str, data: dict) -> bool:
+    """統計檔所屬行程已結束，或超過 STATS_MAX_AGE 秒未更新"""
+    pid = data.get('pid')
+    if pid == os.getpid():
+        return False
+    if not isinstance(pid, int) or not _pid_alive(pid):
+        return True
+    try:
+        return time.time() - os.path.getmtime(path) > STATS_MAX_AGE
+    except OSError:
+        return True
+
+
+def _derive(entry: dict) -> dict:
+    """計算命中率與平均延遲"""
+    lookups = entry['hits'] + entry['misses'] + entry['stale_hits']
+    entry['hit_ratio'] = round((entry['hits'] + entry['stale_hits']) / lookups, 4) if lookups else None
+    for op in TIMING_OPS:
+        count = entry[f'{op}_count']
+        entry[f'{op}_avg_ms'] = round(entry[f'{op}_total_ms'] / count, 3) if count else None
+        entry[f'{op}_total_ms'] = round(entry[f'{op}_total_ms'], 3)
+        entry[f'{op}_max_ms'] = round(entry[f'{op}_max_ms'], 3)
+    return entry
+
+
+def aggregate_stats() -> dict:
+    """
+    合併所有 worker 的統計檔案。
+
+    :return: {'workers': worker 數, 'namespaces': {ns: 計數...}, 'total': 全部加總}
+    """
+    flush()
+    merged: dict = {}
+    workers = 0
+    if _stats_dir and os.path.isdir(_stats_dir):
+        for name in os.listdir(_stats_dir):
+            if not name.endswith('.json'):
+                continue
+            path = os.path.join(_stats_dir, name)
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+            except Exception:
+                continue
+            if _is_stale(path, data):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+                continue
+            workers += 1
+            for ns, entry in data.get('namespaces', {}).items():
+                target = merged.setdefault(ns, _empty_namespace())
+                for field, value in entry.items():
+                    if field.endswith('_max_ms'):
+                        target[field] = max(target.get(field, 0.0), value)
+                    elif field in target:
+                        target[field] += value
+
+    total = _empty_namespace()
+    for entry in merged.values():
+        for field, value in entry.items():
+            if field.endswith('_max_ms'):
+                total[field] = max(total[field], value)
+            else:
+                total[field] += value
+
+    return {
+        'workers': workers,
+        'namespaces': {ns: _derive(entry) for ns, entry in sorted(merged.items())},
+        'total': _derive(total),
+    }
+
+
+def reset_stats() -> None:
+    """
+    清空所有 worker 的統計。
+    刪除現有統計檔並更新 _reset 標記，其他 worker 下次寫入前會自行歸零。
+    """
+    global _reset_seen
+    with _lock:
+        _stats.clear()
+        _reset_seen = time.time()
+    if _stats_dir is None:
+        return
+    os.makedirs(_stats_dir, exist_ok=True)
+    for name in os.listdir(_stats_dir):
+        if name.endswith('.json'):
+            try:
+                os.remove(os.path.join(_stats_dir, name))
+            except OSError:
+                continue
+    marker = os.path.join(_stats_dir, '_reset')
+    with open(marker, 'w', encoding='utf-8') as f:
+        f.write(str(_reset_seen))
+    _reset_seen = os.path.getmtime(marker)
+
+
+atexit.register(flush)
+
+
+def _reset_after_fork() -> None:
+    """子行程重建鎖並清空繼承自父行程的計數，避免重複統計"""
+    global _lock
+    _lock = threading.Lock()
+    _stats.clear()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
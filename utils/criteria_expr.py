@@ -0,0 +1,358 @@
+"""
+選股條件運算式
+將條件字串（例如 `rsi < 30 and close > ma20 and volume > 1000`）以遞迴下降法解析、
+驗證一次後編譯為向量化函式，對欄位式分析表（每個欄位一個 NumPy 陣列）一次算出
+布林遮罩；不執行任何 Python 程式碼。排序以 top_k（argpartition）只挑出前 k 名。
+
+語法：
+    運算式   or / and / not、比較（< <= > >= == !=）、+ - * /、括號、數字
+    欄位     FIELDS 中的名稱（close 為現價）
+    函式     abs(x)、min(a, b)、max(a, b)
+    自訂指標 {名稱: 數值運算式}，可引用欄位與先前定義的自訂指標（VIP 功能）
+資料缺值（NaN）時比較結果為 False。
+"""
+
+import re
+from functools import lru_cache
+
+import numpy as np
+
+# 運算式欄位名稱 → 分析結果欄位
+FIELDS = {
+    'close': 'current_price',
+    'rsi': 'rsi',
+    'macd': 'macd',
+    'signal': 'signal',
+    'histogram': 'histogram',
+    'ma5': 'ma5',
+    'ma10': 'ma10',
+    'ma20': 'ma20',
+    'ma60': 'ma60',
+    'bb_upper': 'bb_upper',
+    'bb_middle': 'bb_middle',
+    'bb_lower': 'bb_lower',
+    'volume': 'volume',
+    'score': 'score',
+    'price_change_1d': 'price_change_1d',
+    'price_change_5d': 'price_change_5d',
+    'price_change_20d': 'price_change_20d',
+}
+
+FUNCTIONS = {
+    'abs': (1, np.abs),
+    'min': (2, np.fmin),
+    'max': (2, np.fmax),
+}
+
+KEYWORDS = ('and', 'or', 'not')
+MAX_LENGTH = 500
+MAX_DEPTH = 32  # 括號、函式、not 與負號的巢狀層數上限，避免遞迴過深
+MAX_CUSTOM_INDICATORS = 10
+
+_TOKEN_RE = re.compile(r'''
+    \s*(?:
+        (?P<number>(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)
+      | (?P<name>[A-Za-z_][A-Za-z0-9_]*)
+      | (?P<op><=|>=|==|!=|[<>+\-*/(),])
+    )''', re.VERBOSE)
+
+_COMPARE = {
+    '<': np.less, '<=': np.less_equal, '>': np.greater,
+    '>=': np.greater_equal, '==': np.equal, '!=': np.not_equal,
+}
+_ARITHMETIC = {'+': np.add, '-': np.subtract, '*': np.multiply, '/': np.divide}
+
+
+def _tokenize(source: str) -> list:
+    tokens = []
+    position = 0
+    source = source.rstrip()
+    while position < len(source):
+        match = _TOKEN_RE.match(source, position)
+        if not match or match.end() == position:
+            raise ValueError(f'運算式第 {position + 1} 個字元無法解析: {source[position:position + 10]!r}')
+        kind = match.lastgroup
+        tokens.append((kind, match.group(kind), match.start(kind)))
+        position = match.end()
+    tokens.append(('end', '', len(source)))
+    return tokens
+
+
+class _Parser:
+    """
+    遞迴下降解析器，產生 (節點, 型別) ；型別為 'num' 或 'bool'
+        or_expr    := and_expr ('or' and_expr)*
+        and_expr   := not_expr ('and' not_expr)*
+        not_expr   := 'not' not_expr | comparison
+        comparison := sum (比較運算子 sum)?
+        sum        := term (('+' | '-') term)*
+        term       := unary (('*' | '/') unary)*
+        unary      := '-' unary | atom
+        atom       := 數字 | 名稱 | 函式 '(' 參數 ')' | '(' or_expr ')'
+    """
+
+    def __init__(self, source: str, names: dict):
+        self.source = source
+        self.tokens = _tokenize(source)
+        self.index = 0
+        self.depth = 0
+        self.names = names  # 可用名稱 → 節點（欄位或自訂指標）
+
+    def parse(self, expected: str):
+        node, kind = self._or()
+        token = self._peek()
+        if token[0] != 'end':
+            self._error(f'多餘的內容 {token[1]!r}', token)
+        if kind != expected:
+            raise ValueError('條件運算式必須為比較或邏輯判斷' if expected == 'bool'
+                             else '自訂指標必須為數值運算式')
+        return node
+
+    def _peek(self):
+        return self.tokens[self.index]
+
+    def _next(self):
+        token = self.tokens[self.index]
+        self.index += 1
+        return token
+
+    def _accept(self, value: str) -> bool:
+        token = self._peek()
+        if token[0] in ('op', 'name') and token[1] == value:
+            self.index += 1
+            return True
+        return False
+
+    def _expect(self, value: str) -> None:
+        if not self._accept(value):
+            self._error(f'預期 {value!r}', self._peek())
+
+    def _error(self, message: str, token) -> None:
+        raise ValueError(f'{message}（第 {token[2] + 1} 個字元）')
+
+    def _descend(self, token) -> None:
+        self.depth += 1
+        if self.depth > MAX_DEPTH:
+            self._error(f'巢狀層數不可超過 {MAX_DEPTH} 層', token)
+
+    def _require(self, kind: str, expected: str, token) -> None:
+        if kind != expected:
+            self._error('此處需要數值' if expected == 'num' else '此處需要比較或邏輯判斷', token)
+
+    def _binary(self, operand, operators: tuple, node_type: str, operand_kind: str, result_kind: str):
+        token = self._peek()
+        left, kind = operand()
+        while self._peek()[0] in ('op', 'name') and self._peek()[1] in operators:
+            operator = self._next()[1]
+            self._require(kind, operand_kind, token)
+            token = self._peek()
+            right, right_kind = operand()
+            self._require(right_kind, operand_kind, token)
+            left, kind = (node_type, operator, left, right), result_kind
+        return left, kind
+
+    def _or(self):
+        return self._binary(self._and, ('or',), 'logic', 'bool', 'bool')
+
+    def _and(self):
+        return self._binary(self._not, ('and',), 'logic', 'bool', 'bool')
+
+    def _not(self):
+        if self._accept('not'):
+            token = self._peek()
+            self._descend(token)
+            operand, kind = self._not()
+            self.depth -= 1
+            self._require(kind, 'bool', token)
+            return ('not', operand), 'bool'
+        return self._comparison()
+
+    def _comparison(self):
+        token = self._peek()
+        left, kind = self._sum()
+        if self._peek()[0] == 'op' and self._peek()[1] in _COMPARE:
+            operator = self._next()[1]
+            self._require(kind, 'num', token)
+            token = self._peek()
+            right, right_kind = self._sum()
+            self._require(right_kind, 'num', token)
+            if self._peek()[0] == 'op' and self._peek()[1] in _COMPARE:
+                self._error('比較運算不可連用，請以 and 連接', self._peek())
+            return ('compare', operator, left, right), 'bool'
+        return left, kind
+
+    def _sum(self):
+        return self._binary(self._term, ('+', '-'), 'arith', 'num', 'num')
+
+    def _term(self):
+        return self._binary(self._unary, ('*', '/'), 'arith', 'num', 'num')
+
+    def _unary(self):
+        if self._accept('-'):
+            token = self._peek()
+            self._descend(token)
+            operand, kind = self._unary()
+            self.depth -= 1
+            self._require(kind, 'num', token)
+            return ('neg', operand), 'num'
+        return self._atom()
+
+    def _atom(self):
+        token = self._next()
+        kind, value = token[0], token[1]
+        if kind == 'number':
+            return ('const', float(value)), 'num'
+        if kind == 'op' and value == '(':
+            self._descend(token)
+            node = self._or()
+            self._expect(')')
+            self.depth -= 1
+            return node
+        if kind == 'name' and value not in KEYWORDS:
+            if value in FUNCTIONS:
+                arity, _ = FUNCTIONS[value]
+                self._expect('(')
+                self._descend(token)
+                args = []
+                while True:
+                    arg_token = self._peek()
+                    arg, arg_kind = self._sum()
+                    self._require(arg_kind, 'num', arg_token)
+                    args.append(arg)
+                    if not self._accept(','):
+                        break
+                self._expect(')')
+                self.depth -= 1
+                if len(args) != arity:
+                    self._error(f'{value}() 需要 {arity} 個參數', token)
+                return ('call', value, args), 'num'
+            if value in self.names:
+                return self.names[value], 'num'
+            self._error(f'未知的欄位: {value}', token)
+        self._error(f'無法解析 {value!r}' if value else '運算式不完整', token)
+
+
+def _evaluate(node, columns: dict):
+    kind = node[0]
+    if kind == 'const':
+        return node[1]
+    if kind == 'field':
+        return columns[node[1]]
+    if kind == 'neg':
+        return np.negative(_evaluate(node[1], columns))
+    if kind == 'arith':
+        return _ARITHMETIC[node[1]](_evaluate(node[2], columns), _evaluate(node[3], columns))
+    if kind == 'call':
+        return FUNCTIONS[node[1]][1](*(_evaluate(arg, columns) for arg in node[2]))
+    if kind == 'compare':
+        return _COMPARE[node[1]](_evaluate(node[2], columns), _evaluate(node[3], columns))
+    if kind == 'not':
+        return np.logical_not(_evaluate(node[1], columns))
+    if kind == 'logic':
+        operator = np.logical_and if node[1] == 'and' else np.logical_or
+        return operator(_evaluate(node[2], columns), _evaluate(node[3], columns))
+    raise ValueError(f'未知的節點: {kind}')
+
+
+def _collect_fields(node, fields: set) -> set:
+    if node[0] == 'field':
+        fields.add(node[1])
+    for child in node[1:]:
+        if isinstance(child, tuple):
+            _collect_fields(child, fields)
+        elif isinstance(child, list):
+            for item in child:
+                _collect_fields(item, fields)
+    return fields
+
+
+class CriteriaExpression:
+    """已解析、驗證的條件運算式"""
+
+    def __init__(self, source: str, custom_trees: dict, tree):
+        self.source = source
+        self._custom_trees = custom_trees
+        self._tree = tree
+        fields = _collect_fields(tree, set())
+        for custom_tree in custom_trees.values():
+            _collect_fields(custom_tree, fields)
+        self.fields = sorted(fields)  # 需要的分析結果欄位
+
+    def mask(self, columns: dict, size: int = 0) -> np.ndarray:
+        """
+        對欄位式分析表計算布林遮罩（欄位可為 1-D 或 股票 × 時間 矩陣）
+        :param size: 運算式不引用任何欄位（columns 為空）時的遮罩長度
+        """
+        shape = np.shape(next(iter(columns.values()))) if columns else (size,)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            result = _evaluate(self._tree, columns)
+        return np.broadcast_to(np.asarray(result, dtype=bool), shape)
+
+    def custom_values(self, columns: dict) -> dict:
+        """各自訂指標的值 {名稱: 陣列}"""
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return {name: np.asarray(_evaluate(tree, columns), dtype=float)
+                    for name, tree in self._custom_trees.items()}
+
+    def matches(self, analysis: dict) -> bool:
+        """單一分析結果是否符合條件"""
+        return bool(self.mask(columns_from_analyses([analysis], self.fields), 1)[0])
+
+
+@lru_cache(maxsize=256)
+def _compile(source: str, custom_indicators: tuple) -> CriteriaExpression:
+    names = {name: ('field', key) for name, key in FIELDS.items()}
+    custom_trees = {}
+    for name, expression in custom_indicators:
+        if not re.fullmatch(r'[A-Za-z_][A-Za-z0-9_]*', name) or name in KEYWORDS \
+                or name in FUNCTIONS or name in FIELDS:
+            raise ValueError(f'自訂指標名稱不合法: {name}')
+        try:
+            names[name] = custom_trees[name] = _Parser(expression, names).parse('num')
+        except ValueError as e:
+            raise ValueError(f'自訂指標 {name}: {e}') from None
+    return CriteriaExpression(source, custom_trees, _Parser(source, names).parse('bool'))
+
+
+def compile_expression(source: str, custom_indicators: dict | None = None) -> CriteriaExpression:
+    """
+    解析並驗證條件運算式（相同輸入只解析一次）
+    :param custom_indicators: {名稱: 數值運算式}，依序定義
+    :raises ValueError: 語法錯誤、未知欄位、型別不符或巢狀過深
+    """
+    if not isinstance(source, str) or not source.strip():
+        raise ValueError('條件運算式不可為空')
+    custom_indicators = custom_indicators or {}
+    if not isinstance(custom_indicators, dict):
+        raise ValueError('custom_indicators 必須為 {名稱: 運算式}')
+    if len(custom_indicators) > MAX_CUSTOM_INDICATORS:
+        raise ValueError(f'自訂指標最多 {MAX_CUSTOM_INDICATORS} 個')
+    for expression in [source, *custom_indicators.values()]:
+        if len(str(expression)) > MAX_LENGTH:
+            raise ValueError(f'運算式長度不可超過 {MAX_LENGTH} 個字元')
+    return _compile(source.strip(), tuple((str(name), str(expression))
+                                          for name, expression in custom_indicators.items()))
+
+
+def columns_from_analyses(analyses: list, fields=None) -> dict:
+    """分析結果列表轉為欄位式分析表 {欄位: float 陣列}，缺值為 NaN"""
+    fields = fields if fields is not None else sorted(set(FIELDS.values()))
+    columns = {}
+    for field in fields:
+        values = [analysis.get(field) for analysis in analyses]
+        columns[field] = np.array([np.nan if value is None else value for value in values], dtype=float)
+    return columns
+
+
+def top_k(values, mask, k: int) -> np.ndarray:
+    """
+    遮罩內值最大的 k 個位置（由大到小）；以 argpartition 選出後只排序這 k 個
+    """
+    candidates = np.flatnonzero(mask)
+    if k <= 0 or not len(candidates):
+        return candidates[:0]
+    scores = np.asarray(values, dtype=float)[candidates]
+    if len(candidates) > k:
+        chosen = np.argpartition(-scores, k - 1)[:k]
+        candidates, scores = candidates[chosen], scores[chosen]
+    return candidates[np.argsort(-scores, kind='stable')]
@@ -0,0 +1,166 @@
+"""
+技術指標服務
+以 utils/indicators.py 計算完整指標序列並打包成欄位式（columnar）格式，
+依 (股票, 區間, 參數) 快取；/api/stock/<code>/indicators 與 StockScreener
+讀寫同一份快取，相同輸入只計算一次。
+"""
+
+import math
+
+import numpy as np
+
+from utils import cache
+from utils import parallel_indicators
+from utils.twse import get_stock_chart_data
+
+# 指標群組與對應的輸出欄位（ma 欄位依 ma_windows 決定）
+INDICATOR_GROUPS = ('rsi', 'macd', 'bb', 'ma')
+
+DEFAULT_PARAMS = {
+    'rsi_period': 14,
+    'macd_fast': 12,
+    'macd_slow': 26,
+    'macd_signal': 9,
+    'bb_window': 20,
+    'bb_std': 2.0,
+    'ma_windows': [5, 10, 20, 60],
+}
+
+MAX_WINDOW = 250
+
+
+def normalize_params(params: dict | None = None) -> dict:
+    """
+    合併預設參數並檢查範圍。
+    :raises ValueError: 參數不合法
+    """
+    merged = dict(DEFAULT_PARAMS)
+    for name, value in (params or {}).items():
+        if name not in DEFAULT_PARAMS:
+            raise ValueError(f'未知的指標參數: {name}')
+        if value is not None:
+            merged[name] = value
+
+    for name in ('rsi_period', 'macd_fast', 'macd_slow', 'macd_signal', 'bb_window'):
+        merged[name] = int(merged[name])
+        if not 2 <= merged[name] <= MAX_WINDOW:
+            raise ValueError(f'{name} 必須介於 2 到 {MAX_WINDOW}')
+    if merged['macd_fast'] >= merged['macd_slow']:
+        raise ValueError('macd_fast 必須小於 macd_slow')
+    merged['bb_std'] = float(merged['bb_std'])
+    if not 0 < merged['bb_std'] <= 5:
+        raise ValueError('bb_std 必須介於 0 到 5')
+    merged['ma_windows'] = sorted({int(window) for window in merged['ma_windows']})
+    if not merged['ma_windows'] or not all(2 <= w <= MAX_WINDOW for w in merged['ma_windows']):
+        raise ValueError(f'ma_windows 必須介於 2 到 {MAX_WINDOW}')
+    return merged
+
+
+def group_columns(group: str, params: dict) -> list:
+    """指標群組對應的輸出欄位名稱"""
+    if group == 'rsi':
+        return ['rsi']
+    if group == 'macd':
+        return ['macd', 'signal', 'histogram']
+    if group == 'bb':
+        return ['bb_upper', 'bb_middle', 'bb_lower']
+    if group == 'ma':
+        return [f'ma{window}' for window in params['ma_windows']]
+    raise ValueError(f'未知的指標: {group}')
+
+
+def series_cache_key(stock_code: str, days: int, params: dict) -> str:
+    """快取 key：indicators_<代號>_<天數>_<參數版本>（天數決定 K 棒間隔）"""
+    return f"indicators_{stock_code}_{days}_{cache.content_version(params)}"
+
+
+def compute_columns(matrix, params: dict) -> dict:
+    """
+    以向量化引擎計算整個價格矩陣的所有指標，回傳 {欄位: 矩陣}
+    大型股票池（INDICATOR_PARALLEL_MIN_SYMBOLS 支以上）會分塊交給行程池平行計算
+    """
+    return parallel_indicators.compute_all(
+        matrix,
+        rsi_period=params['rsi_period'],
+        macd_fast=params['macd_fast'],
+        macd_slow=params['macd_slow'],
+        macd_signal=params['macd_signal'],
+        ma_windows=tuple(params['ma_windows']),
+        bb_window=params['bb_window'],
+        bb_std=params['bb_std'],
+    )
+
+
+def _column_list(values) -> list:
+    """NumPy 序列轉為 JSON 清單，NaN 以 None 表示"""
+    return [None if math.isnan(value) else round(value, 4) for value in values.tolist()]
+
+
+def pack_series(stock_code: str, days: int, params: dict, times: list, prices: list,
+                columns: dict, row: int = 0) -> dict:
+    """將矩陣中某一列的指標打包為欄位式結果"""
+    return {
+        'stock_code': stock_code,
+        'days': days,
+        'params': params,
+        'input_version': cache.content_version(prices),
+        'time': list(times),
+        'close': list(prices),
+        'indicators': {name: _column_list(values[row]) for name, values in columns.items()},
+    }
+
+
+def get_cached_series(stock_code: str, days: int, params: dict, prices: list | None = None):
+    """
+    讀取快取的指標序列；提供 prices 時，輸入資料不同的快取視為未命中
+    """
+    series = cache.get_cache(series_cache_key(stock_code, days, params))
+    if series and prices is not None and series.get('input_version') != cache.content_version(prices):
+        return None
+    return series
+
+
+def save_series(series: dict) -> None:
+    cache.save_cache(series_cache_key(series['stock_code'], series['days'], series['params']), series)
+
+
+def latest_values(series: dict) -> dict:
+    """各指標最後一個值（資料不足者為 None）"""
+    return {name: values[-1] if values else None for name, values in series['indicators'].items()}
+
+
+def select_groups(series: dict, groups: list) -> dict:
+    """只保留指定指標群組的欄位"""
+    wanted = [column for group in groups for column in group_columns(group, series['params'])]
+    selected = dict(series)
+    selected['indicators'] = {name: series['indicators'][name] for name in wanted}
+    return selected
+
+
+def get_indicator_series(stock_code: str, days: int = 90, groups: list | None = None,
+                         params: dict | None = None):
+    """
+    取得股票的完整指標序列（欄位式）。
+
+    :param days: 圖表資料天數，同時決定 K 棒間隔（見 get_stock_chart_data）
+    :param groups: 指標群組子集合，預設全部
+    :return: 指標序列；無法取得圖表資料時回傳 None
+    :raises ValueError: 參數或指標名稱不合法
+    """
+    params = normalize_params(params)
+    groups = list(groups or INDICATOR_GROUPS)
+    for group in groups:
+        group_columns(group, params)
+
+    chart = get_stock_chart_data(stock_code, days)
+    if not chart or not chart.get('success') or not chart.get('data'):
+        return None
+    times = [item['time'] for item in chart['data']]
+    prices = [float(item['price']) for item in chart['data']]
+
+    series = get_cached_series(stock_code, days, params, prices)
+    if series is None:
+        columns = compute_columns(np.array(prices, dtype=float), params)
+        series = pack_series(stock_code, days, params, times, prices, columns)
+        save_series(series)
+    return select_groups(series, groups)
@@ -0,0 +1,141 @@
+"""
+向量化技術指標引擎
+輸入為 2-D 價格矩陣（股票 × 時間，時間由舊到新），以 NumPy 一次計算所有股票的
+RSI、EMA / MACD、SMA 與布林通道；輸出與輸入同形狀，資料不足的位置為 NaN。
+視窗類指標以累積和計算，遞迴類指標（EMA、Wilder RSI）在時間軸上逐步
+推進、每一步同時更新所有股票。
+"""
+
+import numpy as np
+
+
+def as_matrix(prices) -> np.ndarray:
+    """轉為 float 2-D 矩陣；1-D 序列視為單一股票"""
+    matrix = np.asarray(prices, dtype=float)
+    if matrix.ndim == 1:
+        matrix = matrix[np.newaxis, :]
+    if matrix.ndim != 2:
+        raise ValueError('價格資料必須為 2-D 矩陣（股票 × 時間）')
+    return matrix
+
+
+def _window_sums(matrix: np.ndarray, window: int) -> tuple:
+    """以累積和計算每個時間點往前 window 筆（不足則為現有筆數）的總和與筆數"""
+    length = matrix.shape[1]
+    cumsum = np.zeros((matrix.shape[0], length + 1))
+    np.cumsum(matrix, axis=1, out=cumsum[:, 1:])
+    end = np.arange(1, length + 1)
+    start = np.maximum(end - window, 0)
+    return cumsum[:, end] - cumsum[:, start], end - start
+
+
+def sma(prices, window: int, adaptive: bool = False) -> np.ndarray:
+    """
+    簡單移動平均（以累積和計算，每個時間點 O(1)）。
+
+    :param adaptive: True 時前段資料不足 window 的位置以現有資料長度為窗格，
+                     否則為 NaN
+    """
+    matrix = as_matrix(prices)
+    total, count = _window_sums(matrix, window)
+    result = total / count
+    if not adaptive:
+        result[:, :window - 1] = np.nan
+    return result
+
+
+def rolling_std(prices, window: int, adaptive: bool = False) -> np.ndarray:
+    """
+    滾動母體標準差，以一次與二次累積和計算 E[x²] - E[x]²。
+    先減去各股票首日價格再累加，避免大數相減的精度損失。
+    """
+    matrix = as_matrix(prices)
+    centered = matrix - matrix[:, :1]
+    total, count = _window_sums(centered, window)
+    total_sq, _ = _window_sums(centered * centered, window)
+    mean = total / count
+    result = np.sqrt(np.clip(total_sq / count - mean * mean, 0, None))
+    if not adaptive:
+        result[:, :window - 1] = np.nan
+    return result
+
+
+def bollinger_bands(prices, window: int = 20, num_std: float = 2.0,
+                    adaptive: bool = False) -> tuple:
+    """布林通道，回傳 (upper, middle, lower)"""
+    middle = sma(prices, window, adaptive)
+    deviation = rolling_std(prices, window, adaptive) * num_std
+    return middle + deviation, middle, middle - deviation
+
+
+def ema(prices, span: int) -> np.ndarray:
+    """
+    指數移動平均，以第一筆價格為初始值。
+    時間軸為遞迴計算，每一步同時更新所有股票；NaN 之後的第一筆有效價格重新起算。
+    """
+    matrix = as_matrix(prices)
+    alpha = 2 / (span + 1)
+    result = np.empty_like(matrix)
+    result[:, 0] = matrix[:, 0]
+    for t in range(1, matrix.shape[1]):
+        previous = result[:, t - 1]
+        current = matrix[:, t]
+        result[:, t] = np.where(np.isnan(previous), current,
+                                alpha * current + (1 - alpha) * previous)
+    return result
+
+
+def macd(prices, fast: int = 12, slow: int = 26, signal: int = 9) -> tuple:
+    """MACD，回傳 (macd_line, signal_line, histogram)；signal_line 為 macd_line 的 EMA"""
+    macd_line = ema(prices, fast) - ema(prices, slow)
+    signal_line = ema(macd_line, signal)
+    return macd_line, signal_line, macd_line - signal_line
+
+
+def rsi(prices, period: int = 14) -> np.ndarray:
+    """
+    Wilder RSI。前 period 筆漲跌幅取平均作為初始值，之後以 Wilder 平滑遞推；
+    平均跌幅為 0 時回傳 100。前 period 個時間點為 NaN。
+    """
+    matrix = as_matrix(prices)
+    result = np.full(matrix.shape, np.nan)
+    if matrix.shape[1] <= period:
+        return result
+
+    deltas = np.diff(matrix, axis=1)
+    gains = np.clip(deltas, 0, None)
+    losses = np.clip(-deltas, 0, None)
+    avg_gain = gains[:, :period].mean(axis=1)
+    avg_loss = losses[:, :period].mean(axis=1)
+    result[:, period] = _rsi_from_averages(avg_gain, avg_loss)
+    for t in range(period + 1, matrix.shape[1]):
+        avg_gain = (avg_gain * (period - 1) + gains[:, t - 1]) / period
+        avg_loss = (avg_loss * (period - 1) + losses[:, t - 1]) / period
+        result[:, t] = _rsi_from_averages(avg_gain, avg_loss)
+    return result
+
+
+def _rsi_from_averages(avg_gain: np.ndarray, avg_loss: np.ndarray) -> np.ndarray:
+    with np.errstate(divide='ignore', invalid='ignore'):
+        value = 100 - 100 / (1 + avg_gain / avg_loss)
+    return np.where(avg_loss == 0, 100.0, value)
+
+
+def compute_all(prices, rsi_period: int = 14, macd_fast: int = 12, macd_slow: int = 26,
+                macd_signal: int = 9, ma_windows: tuple = (5, 10, 20, 60),
+                bb_window: int = 20, bb_std: float = 2.0) -> dict:
+    """
+    一次計算全部指標的完整序列。
+
+    :return: {'rsi', 'macd', 'signal', 'histogram', 'ma<n>'...,
+              'bb_upper', 'bb_middle', 'bb_lower'}，每項皆為與輸入同形狀的矩陣
+    """
+    matrix = as_matrix(prices)
+    result = {'rsi': rsi(matrix, rsi_period)}
+    result['macd'], result['signal'], result['histogram'] = macd(
+        matrix, macd_fast, macd_slow, macd_signal)
+    for window in ma_windows:
+        result[f'ma{window}'] = sma(matrix, window)
+    result['bb_upper'], result['bb_middle'], result['bb_lower'] = bollinger_bands(
+        matrix, bb_window, bb_std)
+    return result
@@ -0,0 +1,275 @@
+"""
+即時選股
+登記一組選股條件後，背景報價輪詢（QuotePoller）每一輪只把價格有變動的股票
+交給 StockScreener.update_live_indicators 增量更新指標與評分（每筆報價常數時間，
+同一支股票的分析由所有即時選股共用），再逐一套用到包含該股票的即時選股：
+  - 符合條件與否改變時產生 entered / left 事件
+  - 排名以 bisect 維護的排序清單 (-評分, 代號) 增量更新，不重新排序整個結果
+相同條件與範圍的登記共用同一個即時選股；超過 LIVE_SCREEN_IDLE_TTL 秒沒有被讀取的即時選股自動移除。
+"""
+
+import os
+import time
+import bisect
+import threading
+from collections import deque
+from datetime import datetime
+
+from utils import cache, universe
+from utils.twse import get_stocks_basic_info
+
+QUOTE_INTERVAL = int(os.environ.get('LIVE_QUOTE_INTERVAL', 15))  # 輪詢間隔秒數
+QUOTE_WORKERS = int(os.environ.get('LIVE_QUOTE_WORKERS', 8))  # 批次報價查無的股票逐檔查詢的並行數
+MAX_SCREENS = int(os.environ.get('LIVE_SCREEN_MAX', 50))
+IDLE_TTL = int(os.environ.get('LIVE_SCREEN_IDLE_TTL', 1800))
+EVENT_BUFFER = 1000  # 每個即時選股保留的事件數
+
+
+def _quote_price(basic_info: dict):
+    """報價中的即時股價（無成交時為收盤價）；無法取得時回傳 None"""
+    for field in ('即時股價', '收盤價'):
+        try:
+            price = float(str(basic_info.get(field, '')).replace(',', ''))
+        except ValueError:
+            continue
+        if price > 0:
+            return price
+    return None
+
+
+class LiveScreen:
+    """單一即時選股：目前符合條件的股票、依評分排序的排名與事件序列"""
+
+    def __init__(self, screen_id: str, criteria: dict, stock_codes: list):
+        self.id = screen_id
+        self.criteria = criteria
+        self.codes = set(stock_codes)
+        self.members = {}
+        self._ranking = []  # 排序清單 [(-評分, 代號)]
+        self._events = deque(maxlen=EVENT_BUFFER)
+        self._seq = 0
+        self._condition = threading.Condition()
+        self.created_at = datetime.now()
+        self.touched = time.monotonic()
+
+    def touch(self) -> None:
+        self.touched = time.monotonic()
+
+    def _emit(self, event: dict) -> None:
+        self._seq += 1
+        event['seq'] = self._seq
+        self._events.append(event)
+
+    def apply(self, stock_code: str, analysis: dict, passed: bool) -> None:
+        """套用一支股票的最新分析：更新成員與排名，成員變動時產生事件"""
+        with self._condition:
+            previous = self.members.get(stock_code)
+            if previous is not None:
+                index = bisect.bisect_left(self._ranking, (-previous['score'], stock_code))
+                del self._ranking[index]
+            if passed:
+                self.members[stock_code] = analysis
+                bisect.insort(self._ranking, (-analysis['score'], stock_code))
+                if previous is None:
+                    self._emit({'type': 'entered', 'stock_code': stock_code, 'data': analysis,
+                                'rank': self._rank_of(analysis['score'], stock_code)})
+            elif previous is not None:
+                del self.members[stock_code]
+                self._emit({'type': 'left', 'stock_code': stock_code, 'data': analysis})
+            self._condition.notify_all()
+
+    def _rank_of(self, score, stock_code: str) -> int:
+        return bisect.bisect_left(self._ranking, (-score, stock_code)) + 1
+
+    def ranking(self, limit: int | None = None) -> list:
+        """依評分由高到低的目前成員"""
+        with self._condition:
+            keys = self._ranking if limit is None else self._ranking[:limit]
+            return [self.members[code] for _, code in keys]
+
+    def iter_events(self, heartbeat: float = 15.0, cancel_event: threading.Event | None = None):
+        """
+        產生登記後的新事件；先送出目前排名（snapshot），沒有新事件時每 heartbeat 秒送出 heartbeat
+        :param cancel_event: 設定後結束
+        """
+        with self._condition:
+            seq = self._seq
+            snapshot = {'type': 'snapshot', 'screen_id': self.id, 'seq': seq,
+                        'results': [self.members[code] for _, code in self._ranking]}
+        yield snapshot
+        while cancel_event is None or not cancel_event.is_set():
+            with self._condition:
+                ready = self._condition.wait_for(lambda: self._seq > seq, heartbeat)
+                pending = [event for event in self._events if event['seq'] > seq] if ready else []
+                if ready:
+                    seq = self._seq
+            self.touch()
+            if pending:
+                yield from pending
+            else:
+                yield {'type': 'heartbeat', 'seq': seq}
+
+    def to_dict(self, limit: int | None = None) -> dict:
+        return {
+            'screen_id': self.id,
+            'criteria': self.criteria,
+            'symbols': len(self.codes),
+            'members': len(self.members),
+            'results': self.ranking(limit),
+            'seq': self._seq,
+            'created_at': self.created_at.isoformat(),
+        }
+
+
+class LiveScreenRegistry:
+    """即時選股登記表：共用每支股票的最新分析，報價更新時只重算受影響的股票"""
+
+    def __init__(self, screener_factory=None, max_screens: int = MAX_SCREENS, idle_ttl: int = IDLE_TTL):
+        if screener_factory is None:
+            from utils.stock_screener import StockScreener
+            screener_factory = StockScreener
+        self.screener = screener_factory()
+        self.max_screens = max_screens
+        self.idle_ttl = idle_ttl
+        self._screens = {}
+        self._latest = {}  # 股票代號 -> 最新分析
+        self._lock = threading.Lock()
+
+    def register(self, criteria: dict | None) -> tuple:
+        """
+        登記即時選股
+        :return: (screen, created)；created 為 False 表示共用既有的即時選股
+        :raises ValueError: 條件或選股範圍不合法、即時選股數已達上限
+        """
+        normalized = self.screener.validate_criteria(criteria or {})
+        stock_codes = universe.resolve_universe(normalized.get('universe'), self.screener.stock_pool,
+                                                normalized.get('watchlist'))
+        screen_id = cache.content_version({'criteria': normalized, 'codes': stock_codes})
+        with self._lock:
+            self._purge()
+            screen = self._screens.get(screen_id)
+            if screen is not None:
+                screen.touch()
+                return screen, False
+            if len(self._screens) >= self.max_screens:
+                raise ValueError(f'即時選股數已達上限（{self.max_screens}）')
+            screen = LiveScreen(screen_id, normalized, stock_codes)
+            self._screens[screen_id] = screen
+            latest = {code: self._latest[code] for code in screen.codes if code in self._latest}
+        # 以已知的最新分析建立初始成員
+        for stock_code, analysis in latest.items():
+            screen.apply(stock_code, analysis, self.screener.meets_criteria(analysis, normalized))
+        print(f"📡 新增即時選股 {screen_id}（{len(stock_codes)} 支股票）")
+        return screen, True
+
+    def unregister(self, screen_id: str) -> bool:
+        with self._lock:
+            return self._screens.pop(screen_id, None) is not None
+
+    def get(self, screen_id: str):
+        with self._lock:
+            screen = self._screens.get(screen_id)
+        if screen is not None:
+            screen.touch()
+        return screen
+
+    def _purge(self) -> None:
+        now = time.monotonic()
+        for screen_id in [screen_id for screen_id, screen in self._screens.items()
+                          if now - screen.touched > self.idle_ttl]:
+            del self._screens[screen_id]
+            print(f"🧹 移除閒置的即時選股 {screen_id}")
+
+    def symbols(self) -> set:
+        """所有即時選股範圍內的股票（輪詢對象）"""
+        with self._lock:
+            self._purge()
+            return set().union(*(screen.codes for screen in self._screens.values()))
+
+    def on_quote(self, stock_code: str, price: float, quote: dict | None = None):
+        """
+        套用一筆報價：增量更新該股票的分析，再套用到範圍內包含該股票的即時選股
+        :param quote: 原始報價（取得股票名稱與成交量）
+        :return: 更新後的分析；無法建立指標時回傳 None
+        """
+        analysis = self.screener.update_live_indicators(stock_code, price)
+        if analysis is None:
+            return None
+        if quote:
+            analysis['stock_name'] = quote.get('股票名稱', stock_code)
+            analysis['volume'] = self.screener.parse_volume(quote.get('成交量', '0'))
+        with self._lock:
+            self._latest[stock_code] = analysis
+            screens = [screen for screen in self._screens.values() if stock_code in screen.codes]
+        for screen in screens:
+            screen.apply(stock_code, analysis, self.screener.meets_criteria(analysis, screen.criteria))
+        return analysis
+
+
+class QuotePoller:
+    """
+    背景報價輪詢：每輪以批次報價（get_stocks_basic_info）抓取所有即時選股範圍內的報價，
+    只把價格變動的股票交給登記表
+    """
+
+    def __init__(self, registry: LiveScreenRegistry, interval: int = QUOTE_INTERVAL,
+                 workers: int = QUOTE_WORKERS):
+        self.registry = registry
+        self.interval = interval
+        self.workers = workers
+        self._prices = {}
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def poll_once(self) -> int:
+        """輪詢一次，回傳價格有變動的股票數"""
+        symbols = sorted(self.registry.symbols())
+        if not symbols:
+            return 0
+        quotes, _ = get_stocks_basic_info(symbols, max_workers=self.workers)
+        changed = 0
+        for stock_code, quote in quotes.items():
+            price = _quote_price(quote)
+            if price is None or self._prices.get(stock_code) == price:
+                continue
+            self._prices[stock_code] = price
+            if self.registry.on_quote(stock_code, price, quote) is not None:
+                changed += 1
+        return changed
+
+    def start(self) -> threading.Thread:
+        """啟動背景輪詢執行緒（只會啟動一次）"""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return self._thread
+
+            def _run():
+                while True:
+                    started = time.monotonic()
+                    try:
+                        changed = self.poll_once()
+                        if changed:
+                            print(f"📡 即時選股報價更新：{changed} 支股票")
+                    except Exception as e:
+                        print(f"❌ 即時選股報價輪詢失敗: {e}")
+                    time.sleep(max(0.0, self.interval - (time.monotonic() - started)))
+
+            self._thread = threading.Thread(target=_run, name='live-quote-poller', daemon=True)
+            self._thread.start()
+            return self._thread
+
+
+_registry = None
+_poller = None
+_registry_lock = threading.Lock()
+
+
+def get_registry() -> LiveScreenRegistry:
+    """行程內共用的即時選股登記表；第一次使用時啟動報價輪詢"""
+    global _registry, _poller
+    with _registry_lock:
+        if _registry is None:
+            _registry = LiveScreenRegistry()
+            _poller = QuotePoller(_registry)
+            _poller.start()
+        return _registry
@@ -0,0 +1,280 @@
+"""
+策略參數最佳化
+以網格或隨機搜尋評估多組回測參數（utils/backtest.py），交給行程池平行執行。
+價格矩陣與指標欄位只在主行程計算一次，放進共享記憶體由各 worker 直接掛載，
+不會為每個工作 pickle 整個矩陣。結果依指定指標排序並寫成 CSV 結果表。
+
+參數範圍寫法（--param，可重複）：
+    rsi_oversold=20,25,30        列舉值
+    min_score=40:70:5            起:迄:間距（網格含迄值；隨機搜尋在區間內取樣）
+    weight_macd=0.5:1.5          隨機搜尋用的連續區間
+
+用法：python -m utils.optimizer --strategy momentum --param rsi_oversold=20,25,30 \\
+          --param hold_days=5:20:5 [--search random --samples 200] [--metric sharpe]
+"""
+
+import os
+import csv
+import time
+import random
+import argparse
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import numpy as np
+
+from utils import backtest
+from utils.shared_arrays import SharedArrays
+
+OUTPUT_DIR = os.environ.get('OPTIMIZER_OUTPUT_DIR', os.path.join('data', 'optimizer'))
+
+# 排序指標：皆為越大越好（max_drawdown 為負值）
+METRICS = ('sharpe', 'total_return', 'annual_return', 'hit_rate', 'avg_trade_return', 'max_drawdown')
+
+
+def _parse_value(text: str):
+    text = text.strip()
+    lowered = text.lower()
+    if lowered in ('none', 'null'):
+        return None
+    if lowered in ('true', 'false'):
+        return lowered == 'true'
+    for cast in (int, float):
+        try:
+            return cast(text)
+        except ValueError:
+            pass
+    return text
+
+
+def parse_space(specs: list) -> dict:
+    """
+    解析參數範圍
+    :return: {參數: ('values', [...]) 或 ('range', (起, 迄, 間距或 None))}
+    :raises ValueError: 格式錯誤或參數不存在
+    """
+    space = {}
+    for spec in specs:
+        name, separator, text = spec.partition('=')
+        name = name.strip()
+        if not separator or not text.strip():
+            raise ValueError(f'參數範圍格式錯誤: {spec}（例如 rsi_oversold=20,25,30 或 min_score=40:70:5）')
+        if name not in backtest.DEFAULT_PARAMS:
+            raise ValueError(f'未知的回測參數: {name}')
+        if ':' in text:
+            parts = [_parse_value(part) for part in text.split(':')]
+            if len(parts) not in (2, 3) or not all(isinstance(part, (int, float)) for part in parts):
+                raise ValueError(f'區間格式錯誤: {spec}')
+            low, high, step = parts[0], parts[1], parts[2] if len(parts) == 3 else None
+            if high < low or (step is not None and step <= 0):
+                raise ValueError(f'區間格式錯誤: {spec}')
+            space[name] = ('range', (low, high, step))
+        else:
+            space[name] = ('values', [_parse_value(part) for part in text.split(',')])
+    return space
+
+
+def _range_values(name: str, low, high, step) -> list:
+    if step is None:
+        raise ValueError(f'網格搜尋的區間需要間距: {name}=起:迄:間距')
+    values = np.arange(low, high + step / 2, step)
+    integral = all(isinstance(value, int) for value in (low, high, step))
+    return [int(value) if integral else round(float(value), 6) for value in values]
+
+
+def grid_candidates(space: dict) -> list:
+    """所有參數組合"""
+    axes = []
+    for name, (kind, spec) in space.items():
+        axes.append([(name, value) for value in (spec if kind == 'values' else _range_values(name, *spec))])
+    return [dict(combination) for combination in itertools.product(*axes)]
+
+
+def random_candidates(space: dict, samples: int, seed: int | None = None) -> list:
+    """隨機取樣 samples 組參數（不重複）"""
+    rng = random.Random(seed)
+    candidates = {}
+    for _ in range(samples * 20):
+        if len(candidates) >= samples:
+            break
+        params = {}
+        for name, (kind, spec) in space.items():
+            if kind == 'values':
+                params[name] = rng.choice(spec)
+                continue
+            low, high, step = spec
+            if step is not None:
+                params[name] = rng.choice(_range_values(name, low, high, step))
+            elif isinstance(low, int) and isinstance(high, int):
+                params[name] = rng.randint(low, high)
+            else:
+                params[name] = round(rng.uniform(low, high), 4)
+        candidates[tuple(sorted(params.items(), key=lambda item: item[0]))] = params
+    return list(candidates.values())
+
+
+# ── 平行評估 ───────────────────────────────────────────
+
+_worker_data = None
+_worker_shared = None
+
+
+def _init_worker(shm_name, manifest, codes, dates, start, end):
+    """掛載主行程的共享記憶體（只讀），組成回測資料；不重新計算指標"""
+    global _worker_data, _worker_shared
+    _worker_shared = SharedArrays.attach(shm_name, manifest)
+    arrays = _worker_shared.arrays
+    columns = {key[len('column:'):]: value for key, value in arrays.items() if key.startswith('column:')}
+    _worker_data = backtest.BacktestData(codes, dates, arrays['close'], arrays['volume'],
+                                         start, end, columns=columns)
+
+
+def _evaluate(params):
+    try:
+        return backtest.run_backtest(_worker_data, params)
+    except ValueError as e:
+        return {'params': params, 'error': str(e)}
+
+
+def evaluate_candidates(data: backtest.BacktestData, param_sets: list, processes: int | None = None) -> list:
+    """
+    評估多組參數，結果順序與 param_sets 相同
+    :param processes: 子行程數，預設為 CPU 數；1 時在本行程執行
+    """
+    global _worker_data
+    processes = min(processes or os.cpu_count() or 1, len(param_sets))
+    if processes <= 1:
+        _worker_data = data
+        try:
+            return [_evaluate(params) for params in param_sets]
+        finally:
+            _worker_data = None
+
+    arrays = {'close': data.close, 'volume': data.volume}
+    arrays.update({f'column:{key}': value for key, value in data.columns.items()})
+    shared = SharedArrays.create(arrays)
+    try:
+        with ProcessPoolExecutor(max_workers=processes, initializer=_init_worker,
+                                 initargs=(shared.name, shared.manifest, data.codes, data.dates,
+                                           data.start, data.end)) as executor:
+            chunksize = max(1, len(param_sets) // (processes * 4))
+            return list(executor.map(_evaluate, param_sets, chunksize=chunksize))
+    finally:
+        shared.close()
+
+
+def rank_results(results: list, metric: str = 'sharpe', min_trades: int = 10) -> list:
+    """依指標由高到低排序；交易數不足或失敗的組合排在最後"""
+    if metric not in METRICS:
+        raise ValueError(f'未知的排序指標: {metric}（可用: {", ".join(METRICS)}）')
+
+    def key(result):
+        value = result.get(metric)
+        eligible = 'error' not in result and value is not None and result['trades'] >= min_trades
+        return (eligible, value if eligible else float('-inf'))
+
+    ranked = sorted(results, key=key, reverse=True)
+    for rank, result in enumerate(ranked, 1):
+        result['rank'] = rank
+    return ranked
+
+
+def write_results(ranked: list, varied: list, path: str) -> str:
+    """寫出排序後的結果表（CSV）"""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    fields = ['rank', *varied, *METRICS, 'volatility', 'trades', 'avg_holding_days', 'turnover', 'error']
+    tmp_file = f"{path}.tmp"
+    with open(tmp_file, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=fields, extrasaction='ignore')
+        writer.writeheader()
+        for result in ranked:
+            row = dict(result)
+            row.update({name: result['params'].get(name) for name in varied})
+            writer.writerow(row)
+    os.replace(tmp_file, path)
+    return path
+
+
+def optimize(base_params: dict, space: dict, search: str = 'grid', samples: int = 100,
+             metric: str = 'sharpe', min_trades: int = 10, path: str | None = None,
+             universe_spec=None, start: str | None = None, end: str | None = None,
+             processes: int | None = None, seed: int | None = None) -> list:
+    """
+    搜尋參數並回傳排序後的結果
+    :param base_params: 固定的回測參數（例如預設策略的條件）
+    :param space: parse_space 的結果
+    :raises ValueError: 參數或搜尋設定不合法
+    """
+    if search == 'grid':
+        candidates = grid_candidates(space)
+    elif search == 'random':
+        candidates = random_candidates(space, samples, seed)
+    else:
+        raise ValueError(f'未知的搜尋方式: {search}')
+
+    param_sets, skipped = [], 0
+    for candidate in candidates:
+        params = dict(base_params, **candidate)
+        try:
+            backtest.normalize_params(params)
+        except ValueError:
+            skipped += 1
+            continue
+        param_sets.append(params)
+    if not param_sets:
+        raise ValueError('沒有可評估的參數組合')
+    if skipped:
+        print(f"⚠️ 略過 {skipped} 組不合法的參數組合")
+
+    data = backtest.load_backtest_data(path, universe_spec, start, end)
+    started = time.perf_counter()
+    results = evaluate_candidates(data, param_sets, processes)
+    elapsed = time.perf_counter() - started
+    print(f"⚙️ 評估 {len(param_sets)} 組參數（{len(data.codes)} 支股票 × "
+          f"{data.end - data.start} 個交易日），耗時 {elapsed:.1f} 秒")
+    return rank_results(results, metric, min_trades)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='選股策略參數最佳化')
+    parser.add_argument('--strategy', default=None, help='以預設策略的條件為基礎參數')
+    parser.add_argument('--param', action='append', default=[], help='參數範圍，可重複')
+    parser.add_argument('--search', choices=('grid', 'random'), default='grid')
+    parser.add_argument('--samples', type=int, default=100, help='隨機搜尋的組數')
+    parser.add_argument('--metric', choices=METRICS, default='sharpe')
+    parser.add_argument('--min-trades', type=int, default=10)
+    parser.add_argument('--universe', default=None)
+    parser.add_argument('--history', default=None, help='價格歷史檔（預設 PRICE_HISTORY_FILE）')
+    parser.add_argument('--start', default=None, help='回測起日 YYYYMMDD')
+    parser.add_argument('--end', default=None, help='回測迄日 YYYYMMDD')
+    parser.add_argument('--processes', type=int, default=None)
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--output', default=None, help='結果表 CSV 路徑')
+    args = parser.parse_args()
+
+    if not args.param:
+        parser.error('至少需要一個 --param')
+    space = parse_space(args.param)
+    base_params = backtest.strategy_params(args.strategy) if args.strategy else {}
+    ranked = optimize(base_params, space, args.search, args.samples, args.metric, args.min_trades,
+                      args.history, args.universe, args.start, args.end, args.processes, args.seed)
+
+    output = args.output or os.path.join(
+        OUTPUT_DIR, f"{args.strategy or 'custom'}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv")
+    write_results(ranked, list(space), output)
+    print(f"📄 結果表: {output}")
+
+    varied = list(space)
+    print(f"{'排名':<6}{'參數':<44}{args.metric:>14}{'總報酬':>9}{'最大回撤':>9}{'交易數':>8}")
+    print("-" * 90)
+    for result in ranked[:10]:
+        if 'error' in result:
+            continue
+        params = ', '.join(f"{name}={result['params'][name]}" for name in varied)
+        print(f"{result['rank']:<6}{params:<44}{result[args.metric]!s:>14}{result['total_return']:>9.1%}"
+              f"{result['max_drawdown']:>9.1%}{result['trades']:>8}")
+
+
+if __name__ == '__main__':
+    main()
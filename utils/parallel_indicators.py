@@ -0,0 +1,91 @@
+"""
+多行程指標計算
+大型股票池的指標計算（utils/indicators.py）受 GIL 限制，只用執行緒無法分散到多核心。
+此模組將價格矩陣依股票切塊交給行程池：輸入矩陣與輸出欄位都放在共享記憶體，
+各 worker 直接讀寫自己負責的列，不 pickle 任何矩陣。股票數少於
+INDICATOR_PARALLEL_MIN_SYMBOLS 時直接在本行程計算（交換資料的成本高於收益）；
+交界點可用 benchmarks/bench_parallel_indicators.py 量測。
+"""
+
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from utils import indicators
+from utils.shared_arrays import SharedArrays
+
+PARALLEL_MIN_SYMBOLS = int(os.environ.get('INDICATOR_PARALLEL_MIN_SYMBOLS', 3000))
+PROCESSES = int(os.environ.get('INDICATOR_PROCESSES', 0)) or os.cpu_count() or 1
+
+_executor = None
+_executor_processes = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor(processes: int) -> ProcessPoolExecutor:
+    """行程內共用的行程池（第一次使用時建立，之後重複使用以免每次啟動子行程）"""
+    global _executor, _executor_processes
+    with _executor_lock:
+        if _executor is None or _executor_processes != processes:
+            if _executor is not None:
+                _executor.shutdown(wait=False)
+            _executor = ProcessPoolExecutor(max_workers=processes)
+            _executor_processes = processes
+        return _executor
+
+
+def shutdown() -> None:
+    """關閉共用的行程池"""
+    global _executor, _executor_processes
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown()
+        _executor = None
+        _executor_processes = None
+
+
+def _compute_chunk(task) -> None:
+    """子行程：計算 start:stop 列的全部指標並寫入共享輸出"""
+    input_name, input_manifest, output_name, output_manifest, start, stop, params = task
+    source = SharedArrays.attach(input_name, input_manifest)
+    target = SharedArrays.attach(output_name, output_manifest, writable=True)
+    try:
+        columns = indicators.compute_all(source.arrays['prices'][start:stop], **params)
+        for name, values in columns.items():
+            target.arrays[name][start:stop] = values
+        del columns
+    finally:
+        source.close()
+        target.close()
+
+
+def compute_all(prices, processes: int | None = None, min_symbols: int | None = None, **params) -> dict:
+    """
+    與 indicators.compute_all 相同的輸出；股票數達 min_symbols 且可用多個行程時分塊平行計算
+    :param processes: 行程數，預設 INDICATOR_PROCESSES（CPU 數）
+    :param min_symbols: 改用行程池的最少股票數，預設 INDICATOR_PARALLEL_MIN_SYMBOLS
+    """
+    matrix = indicators.as_matrix(prices)
+    processes = processes or PROCESSES
+    min_symbols = PARALLEL_MIN_SYMBOLS if min_symbols is None else min_symbols
+    symbols = matrix.shape[0]
+    if processes <= 1 or symbols < max(min_symbols, 2):
+        return indicators.compute_all(matrix, **params)
+
+    # 以單一股票試算取得輸出欄位名稱，與 compute_all 的參數一致
+    names = list(indicators.compute_all(matrix[:1, :min(matrix.shape[1], 2)], **params))
+    chunks = min(symbols, processes * 2)
+    bounds = np.linspace(0, symbols, chunks + 1, dtype=int)
+
+    source = SharedArrays.create({'prices': matrix})
+    target = SharedArrays.allocate({name: (matrix.shape, np.float64) for name in names})
+    try:
+        tasks = [(source.name, source.manifest, target.name, target.manifest, int(start), int(stop), params)
+                 for start, stop in zip(bounds[:-1], bounds[1:]) if stop > start]
+        list(_get_executor(processes).map(_compute_chunk, tasks))
+        return {name: values.copy() for name, values in target.arrays.items()}
+    finally:
+        source.close()
+        target.close()
@@ -0,0 +1,226 @@
+"""
+每日價格歷史庫
+以 TWSE / TPEx OpenAPI 的全市場日成交資料（各一次請求）逐日累積收盤價與成交量，
+存為 NumPy 矩陣檔 data/price_history.npz（股票 × 交易日，缺值為 NaN）。
+全市場選股直接讀取此檔，不需逐檔發出 HTTP 請求。
+"""
+
+import os
+import threading
+from datetime import datetime
+
+import numpy as np
+import requests
+
+from utils.twse import HEADERS, CONFIG, get_stock_chart_data
+from utils.rate_limit import RateLimiter
+
+PRICE_HISTORY_FILE = os.environ.get('PRICE_HISTORY_FILE', os.path.join('data', 'price_history.npz'))
+PRICE_HISTORY_DAYS = int(os.environ.get('PRICE_HISTORY_DAYS', 250))  # 保留的交易日數
+
+# 全市場當日收盤行情（各一次請求）
+TWSE_DAILY_URL = 'https://openapi.twse.com.tw/v1/exchangeReport/STOCK_DAY_ALL'
+TPEX_DAILY_URL = 'https://www.tpex.org.tw/openapi/v1/tpex_mainboard_daily_close_quotes'
+
+_lock = threading.Lock()
+_loaded = None
+_loaded_mtime = None
+
+
+class PriceHistory:
+    """價格歷史矩陣：codes 對應列、dates（YYYYMMDD）對應欄"""
+
+    def __init__(self, codes: list, dates: list, close: np.ndarray, volume: np.ndarray):
+        self.codes = list(codes)
+        self.dates = list(dates)
+        self.close = close
+        self.volume = volume
+        self._index = {code: row for row, code in enumerate(self.codes)}
+
+    @classmethod
+    def empty(cls) -> 'PriceHistory':
+        return cls([], [], np.empty((0, 0)), np.empty((0, 0)))
+
+    def row_of(self, code: str):
+        return self._index.get(code)
+
+    def series(self, code: str, days: int | None = None) -> list:
+        """單一股票的收盤價（舊到新，略過缺值）"""
+        row = self._index.get(code)
+        if row is None:
+            return []
+        values = self.close[row, -days:] if days else self.close[row]
+        return [float(value) for value in values if not np.isnan(value)]
+
+    def merge(self, date: str, values: dict, overwrite: bool = True) -> None:
+        """
+        併入單一交易日的資料，必要時一次新增缺少的列與欄（日期維持排序）
+        :param values: {代號: (收盤價, 成交量)}
+        :param overwrite: False 時只填入缺值（回補歷史時不覆蓋既有資料）
+        """
+        new_codes = [code for code in values if code not in self._index]
+        if new_codes:
+            shape = (len(self.codes), len(self.dates))
+            for code in new_codes:
+                self._index[code] = len(self.codes)
+                self.codes.append(code)
+            padding = np.full((len(new_codes), len(self.dates)), np.nan)
+            self.close = np.vstack([self.close.reshape(shape), padding])
+            self.volume = np.vstack([self.volume.reshape(shape), padding])
+        if date not in self.dates:
+            column = int(np.searchsorted(np.array(self.dates, dtype=str), date)) if self.dates else 0
+            self.dates.insert(column, date)
+            self.close = np.insert(self.close, column, np.nan, axis=1)
+            self.volume = np.insert(self.volume, column, np.nan, axis=1)
+        column = self.dates.index(date)
+        rows = np.array([self._index[code] for code in values], dtype=int)
+        closes = np.array([value[0] for value in values.values()], dtype=float)
+        volumes = np.array([value[1] for value in values.values()], dtype=float)
+        if not overwrite:
+            missing = np.isnan(self.close[rows, column])
+            rows, closes, volumes = rows[missing], closes[missing], volumes[missing]
+        self.close[rows, column] = closes
+        self.volume[rows, column] = volumes
+
+    def trim(self, days: int) -> None:
+        """只保留最近 days 個交易日"""
+        if len(self.dates) > days:
+            self.dates = self.dates[-days:]
+            self.close = self.close[:, -days:]
+            self.volume = self.volume[:, -days:]
+
+
+def load_price_history(path: str | None = None):
+    """讀取價格歷史（檔案變動時才重新讀取）；檔案不存在時回傳 None"""
+    global _loaded, _loaded_mtime
+    path = path or PRICE_HISTORY_FILE
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+    with _lock:
+        if _loaded_mtime != (path, mtime):
+            with np.load(path, allow_pickle=False) as data:
+                _loaded = PriceHistory(data['codes'].tolist(), data['dates'].tolist(),
+                                       data['close'], data['volume'])
+            _loaded_mtime = (path, mtime)
+        return _loaded
+
+
+def save_price_history(history: PriceHistory, path: str | None = None) -> None:
+    """原子寫入價格歷史檔"""
+    path = path or PRICE_HISTORY_FILE
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_file = f"{path}.tmp"
+    with open(tmp_file, 'wb') as f:
+        np.savez(f, codes=np.array(history.codes, dtype=str), dates=np.array(history.dates, dtype=str),
+                 close=history.close, volume=history.volume)
+    os.replace(tmp_file, path)
+
+
+def _to_float(value):
+    try:
+        return float(str(value).replace(',', ''))
+    except (TypeError, ValueError):
+        return None
+
+
+def _roc_to_date(value) -> str | None:
+    """民國日期（1131018）轉為 YYYYMMDD"""
+    value = str(value or '').replace('/', '')
+    if len(value) != 7 or not value.isdigit():
+        return None
+    return f"{int(value[:3]) + 1911}{value[3:]}"
+
+
+def fetch_market_snapshot() -> tuple:
+    """
+    取得全市場當日行情（上市、上櫃各一次請求）。
+    :return: (日期 YYYYMMDD, {代號: {'open', 'high', 'low', 'close', 'volume'(張), 'change'}})，
+             缺少的欄位為 NaN
+    """
+    snapshot = {}
+    dates = set()
+    sources = (
+        (TWSE_DAILY_URL, 'Code', ('OpeningPrice', 'HighestPrice', 'LowestPrice', 'ClosingPrice'),
+         'TradeVolume'),
+        (TPEX_DAILY_URL, 'SecuritiesCompanyCode', ('Open', 'High', 'Low', 'Close'), 'TradingShares'),
+    )
+    for url, code_field, price_fields, volume_field in sources:
+        try:
+            resp = requests.get(url, headers=HEADERS, timeout=CONFIG['timeout'])
+            resp.raise_for_status()
+            records = resp.json()
+        except Exception as e:
+            print(f"❌ 取得全市場行情失敗 [{url}]: {e}")
+            continue
+        for record in records:
+            code = str(record.get(code_field, '')).strip()
+            close = _to_float(record.get(price_fields[3]))
+            if not code or not close or close <= 0:
+                continue
+            shares = _to_float(record.get(volume_field))
+            row = {name: _to_float(record.get(field))
+                   for name, field in zip(('open', 'high', 'low'), price_fields[:3])}
+            row = {name: value if value else np.nan for name, value in row.items()}
+            change = _to_float(record.get('Change'))
+            row.update({'close': close, 'volume': shares / 1000 if shares is not None else np.nan,
+                        'change': change if change is not None else np.nan})
+            snapshot[code] = row
+            date = _roc_to_date(record.get('Date'))
+            if date:
+                dates.add(date)
+    trade_date = max(dates) if dates else datetime.now().strftime('%Y%m%d')
+    return trade_date, snapshot
+
+
+def fetch_daily_quotes() -> tuple:
+    """
+    取得全市場當日收盤行情（上市、上櫃各一次請求）。
+    :return: (日期 YYYYMMDD, {代號: (收盤價, 成交量(張))})
+    """
+    trade_date, snapshot = fetch_market_snapshot()
+    return trade_date, {code: (row['close'], row['volume']) for code, row in snapshot.items()}
+
+
+def update_price_history(path: str | None = None) -> dict:
+    """抓取當日全市場行情並併入價格歷史檔"""
+    trade_date, quotes = fetch_daily_quotes()
+    if not quotes:
+        raise ValueError('沒有取得任何行情資料')
+    history = load_price_history(path) or PriceHistory.empty()
+    history = PriceHistory(history.codes, history.dates, history.close.copy(), history.volume.copy())
+    history.merge(trade_date, quotes)
+    history.trim(PRICE_HISTORY_DAYS)
+    save_price_history(history, path)
+    return {'date': trade_date, 'symbols': len(quotes),
+            'total_symbols': len(history.codes), 'days': len(history.dates)}
+
+
+def backfill_price_history(codes: list, days: int = 90, path: str | None = None,
+                           requests_per_second: float = 5) -> int:
+    """
+    以逐檔日線圖表資料回補歷史（首次建立時使用，較慢）
+    :return: 成功回補的股票數
+    """
+    history = load_price_history(path) or PriceHistory.empty()
+    history = PriceHistory(history.codes, history.dates, history.close.copy(), history.volume.copy())
+    limiter = RateLimiter(requests_per_second)
+    by_date = {}
+    filled = 0
+    for index, code in enumerate(codes, 1):
+        limiter.acquire()
+        chart = get_stock_chart_data(code, days)
+        if not chart or not chart.get('success'):
+            continue
+        for item in chart.get('data', []):
+            date = item['time'][:10].replace('-', '')
+            by_date.setdefault(date, {})[code] = (float(item['price']), np.nan)
+        filled += 1
+        if index % 50 == 0:
+            print(f"📊 已回補 {index}/{len(codes)} 支股票")
+    for date in sorted(by_date):
+        history.merge(date, by_date[date], overwrite=False)
+    history.trim(PRICE_HISTORY_DAYS)
+    save_price_history(history, path)
+    return filled
@@ -0,0 +1,46 @@
+"""
+請求速率限制
+以權杖桶（token bucket）限制對上游資料來源的請求頻率，可跨執行緒共用
+"""
+
+import time
+import threading
+
+
+class RateLimiter:
+    """權杖桶速率限制器：平均每秒 rate 次，最多累積 burst 次"""
+
+    def __init__(self, rate: float, burst: int | None = None):
+        self.rate = float(rate)
+        self.burst = burst if burst is not None else max(1, int(rate))
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        elapsed = now - self._updated
+        self._tokens = min(self.burst, self._tokens + elapsed * self.rate)
+        self._updated = now
+
+    def acquire(self, timeout: float | None = None) -> bool:
+        """
+        取得一個權杖，必要時等待。
+
+        :param timeout: 最長等待秒數；None 表示一直等待
+        :return: 是否取得權杖
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                wait = (1 - self._tokens) / self.rate
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                wait = min(wait, remaining)
+            time.sleep(wait)
@@ -0,0 +1,264 @@
+"""
+評分歷史
+每次分析（StockScreener 新算出的分析、每日選股表）的評分與主要指標快照寫入只新增的
+score_history 表，以 (股票, 時間) 與時間索引查詢：
+  - score_series：單一股票的評分走勢
+  - rank_changes：兩個時間點之間評分 / 排名變化最大的股票（例如本週評分進步最多）
+彙整工作（rollup）將超過 SCORE_HISTORY_RAW_DAYS 天的原始紀錄降為每日最後一筆，
+超過 SCORE_HISTORY_DAILY_DAYS 天的每日紀錄再降為每週最後一筆。
+
+分析多在執行緒池中產生，沒有 Flask app context：record() 只放進記憶體緩衝區，
+由背景執行緒（start_score_recorder）定期在 app context 中批次寫入。
+"""
+
+import os
+import time
+import threading
+from collections import deque
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, delete, func, insert, select
+
+from database import db, ScoreHistory
+
+FLUSH_INTERVAL = int(os.environ.get('SCORE_HISTORY_FLUSH_INTERVAL', 30))
+BUFFER_SIZE = int(os.environ.get('SCORE_HISTORY_BUFFER_SIZE', 20000))
+RAW_DAYS = int(os.environ.get('SCORE_HISTORY_RAW_DAYS', 14))
+DAILY_DAYS = int(os.environ.get('SCORE_HISTORY_DAILY_DAYS', 180))
+
+# 記錄的指標快照欄位
+SNAPSHOT_FIELDS = ('current_price', 'rsi', 'macd', 'histogram', 'ma20', 'price_change_5d')
+
+_buffer = deque(maxlen=BUFFER_SIZE)
+_recorder_thread = None
+_recorder_lock = threading.Lock()
+
+
+def _float(value):
+    try:
+        return None if value is None else float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _row_values(analysis: dict, recorded_at: datetime | None = None) -> dict:
+    if recorded_at is None:
+        try:
+            recorded_at = datetime.fromisoformat(analysis['analysis_time'])
+        except (KeyError, TypeError, ValueError):
+            recorded_at = datetime.now()
+    row = {
+        'stock_code': analysis['stock_code'],
+        'recorded_at': recorded_at,
+        'resolution': 'raw',
+        'samples': 1,
+        'score': int(analysis['score']),
+        'volume': int(analysis.get('volume') or 0),
+    }
+    row.update({field: _float(analysis.get(field)) for field in SNAPSHOT_FIELDS})
+    return row
+
+
+def record(analysis: dict) -> None:
+    """將一筆分析放進寫入緩衝區（不需 app context；緩衝區滿時捨棄最舊的紀錄）"""
+    if analysis and analysis.get('score') is not None:
+        _buffer.append(_row_values(analysis))
+
+
+def write_scores(analyses: list, recorded_at: datetime | None = None, replace: bool = False) -> int:
+    """
+    直接寫入多筆分析（需在 app context 中）
+    :param recorded_at: 統一的紀錄時間（例如每日選股表的行情日期）；預設為各分析的 analysis_time
+    :param replace: 先刪除同一時間的原始紀錄（同一天重新執行時不重複記錄）
+    """
+    rows = [_row_values(analysis, recorded_at) for analysis in analyses
+            if analysis and analysis.get('score') is not None]
+    if not rows:
+        return 0
+    try:
+        if replace and recorded_at is not None:
+            db.session.execute(delete(ScoreHistory).where(ScoreHistory.recorded_at == recorded_at,
+                                                          ScoreHistory.resolution == 'raw'))
+        db.session.execute(insert(ScoreHistory), rows)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return len(rows)
+
+
+def flush() -> int:
+    """將緩衝區寫入資料庫（需在 app context 中），回傳寫入筆數"""
+    rows = []
+    while _buffer:
+        try:
+            rows.append(_buffer.popleft())
+        except IndexError:
+            break
+    if not rows:
+        return 0
+    try:
+        db.session.execute(insert(ScoreHistory), rows)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        # 寫入失敗時放回緩衝區，下次再試
+        _buffer.extendleft(reversed(rows))
+        raise
+    return len(rows)
+
+
+def start_score_recorder(app, interval: int | None = None) -> threading.Thread:
+    """啟動背景寫入執行緒（每個行程只會啟動一次）"""
+    global _recorder_thread
+    interval = FLUSH_INTERVAL if interval is None else interval
+
+    with _recorder_lock:
+        if _recorder_thread is not None and _recorder_thread.is_alive():
+            return _recorder_thread
+
+        def _run():
+            while True:
+                time.sleep(interval)
+                try:
+                    with app.app_context():
+                        flush()
+                except Exception as e:
+                    print(f"❌ 評分歷史寫入失敗: {e}")
+
+        _recorder_thread = threading.Thread(target=_run, name='score-recorder', daemon=True)
+        _recorder_thread.start()
+        return _recorder_thread
+
+
+# ── 查詢 ───────────────────────────────────────────────
+
+def _row_dict(row) -> dict:
+    data = {'time': row.recorded_at.isoformat(), 'resolution': row.resolution, 'score': row.score,
+            'volume': row.volume}
+    data.update({field: getattr(row, field) for field in SNAPSHOT_FIELDS})
+    return data
+
+
+def score_series(stock_code: str, start: datetime | None = None, end: datetime | None = None) -> list:
+    """單一股票的評分走勢（時間由舊到新）"""
+    query = ScoreHistory.query.filter(ScoreHistory.stock_code == stock_code)
+    if start is not None:
+        query = query.filter(ScoreHistory.recorded_at >= start)
+    if end is not None:
+        query = query.filter(ScoreHistory.recorded_at <= end)
+    return [_row_dict(row) for row in query.order_by(ScoreHistory.recorded_at)]
+
+
+def scores_at(moment: datetime, stock_codes: list | None = None) -> dict:
+    """各股票在 moment（含）之前的最後一筆評分 {代號: 評分}"""
+    latest = select(ScoreHistory.stock_code, func.max(ScoreHistory.recorded_at).label('recorded_at')) \
+        .where(ScoreHistory.recorded_at <= moment)
+    if stock_codes is not None:
+        latest = latest.where(ScoreHistory.stock_code.in_(stock_codes))
+    latest = latest.group_by(ScoreHistory.stock_code).subquery()
+    rows = db.session.execute(
+        select(ScoreHistory.stock_code, ScoreHistory.score).join(
+            latest, and_(ScoreHistory.stock_code == latest.c.stock_code,
+                         ScoreHistory.recorded_at == latest.c.recorded_at)))
+    return {stock_code: score for stock_code, score in rows}
+
+
+def _ranks(scores: dict) -> dict:
+    """依評分由高到低的名次（同分同名次）"""
+    ranks = {}
+    previous, rank = None, 0
+    for index, (stock_code, score) in enumerate(sorted(scores.items(), key=lambda item: -item[1]), 1):
+        if score != previous:
+            previous, rank = score, index
+        ranks[stock_code] = rank
+    return ranks
+
+
+def rank_changes(start: datetime, end: datetime | None = None, limit: int = 20,
+                 direction: str = 'up', stock_codes: list | None = None) -> list:
+    """
+    比較兩個時間點的評分與全市場排名（只計入兩個時間點都有紀錄的股票）
+    :param direction: up 為評分進步最多、down 為退步最多
+    :raises ValueError: direction 不合法
+    """
+    if direction not in ('up', 'down'):
+        raise ValueError('direction 必須為 up 或 down')
+    end = end or datetime.now()
+    before = scores_at(start, stock_codes)
+    after = scores_at(end, stock_codes)
+    common = before.keys() & after.keys()
+    before_ranks = _ranks({code: before[code] for code in common})
+    after_ranks = _ranks({code: after[code] for code in common})
+    changes = [{
+        'stock_code': code,
+        'score_before': before[code],
+        'score_after': after[code],
+        'score_change': after[code] - before[code],
+        'rank_before': before_ranks[code],
+        'rank_after': after_ranks[code],
+        'rank_change': before_ranks[code] - after_ranks[code],  # 正值代表名次上升
+    } for code in common]
+    sign = -1 if direction == 'up' else 1
+    changes.sort(key=lambda item: (sign * item['score_change'], sign * item['rank_change'], item['stock_code']))
+    return changes[:limit]
+
+
+# ── 彙整 ───────────────────────────────────────────────
+
+def _day_bucket(moment: datetime):
+    return moment.date()
+
+
+def _week_bucket(moment: datetime):
+    return moment.date() - timedelta(days=moment.weekday())
+
+
+def _downsample(source: str, target: str, before: datetime, bucket) -> tuple:
+    """
+    將 before 之前解析度為 source 的紀錄，每支股票每個期間只保留最後一筆（解析度改為 target）
+    :return: (讀取筆數, 寫入筆數)
+    """
+    rows = ScoreHistory.query.filter(ScoreHistory.resolution == source,
+                                     ScoreHistory.recorded_at < before) \
+        .order_by(ScoreHistory.stock_code, ScoreHistory.recorded_at).all()
+    if not rows:
+        return 0, 0
+
+    merged = {}
+    for row in rows:
+        key = (row.stock_code, bucket(row.recorded_at))
+        samples = merged[key]['samples'] if key in merged else 0
+        values = {column: getattr(row, column) for column in
+                  ('stock_code', 'recorded_at', 'score', 'volume') + SNAPSHOT_FIELDS}
+        values.update({'resolution': target, 'samples': samples + row.samples})
+        merged[key] = values
+
+    ids = [row.id for row in rows]
+    try:
+        for index in range(0, len(ids), 500):
+            db.session.execute(delete(ScoreHistory).where(ScoreHistory.id.in_(ids[index:index + 500])))
+        db.session.execute(insert(ScoreHistory), list(merged.values()))
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return len(rows), len(merged)
+
+
+def rollup(raw_days: int = RAW_DAYS, daily_days: int = DAILY_DAYS, now: datetime | None = None) -> dict:
+    """
+    降採樣舊資料：原始紀錄 → 每日最後一筆 → 每週最後一筆（需在 app context 中）
+    """
+    now = now or datetime.now()
+    # 以整日為界，避免把尚未結束的一天拆成兩筆
+    raw_before = datetime.combine(now.date() - timedelta(days=raw_days), datetime.min.time())
+    daily_before = datetime.combine(_week_bucket(now - timedelta(days=daily_days)), datetime.min.time())
+    raw_read, daily_written = _downsample('raw', 'day', raw_before, _day_bucket)
+    daily_read, weekly_written = _downsample('day', 'week', daily_before, _week_bucket)
+    report = {'raw_rows': raw_read, 'daily_rows': daily_written,
+              'daily_rolled': daily_read, 'weekly_rows': weekly_written}
+    print(f"🗜️ 評分歷史彙整：原始 {raw_read} 筆 → 每日 {daily_written} 筆，"
+          f"每日 {daily_read} 筆 → 每週 {weekly_written} 筆")
+    return report
+
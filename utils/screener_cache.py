@@ -0,0 +1,116 @@
+"""
+選股結果快取
+即時選股的結果依正規化條件與選股範圍快取，有效時間與報價快取（stock_basic）一致。
+條件分成兩部分：
+  - 門檻（min_rsi、max_rsi、min_score、price_trend、volume_filter）：越嚴格，符合的股票越少
+  - 其餘條件與實際篩選的股票代號（StockScreener.screened_codes）：必須完全相同
+同一組「其餘條件」的結果放在同一筆快取（screener_<雜湊>）中。查詢時先找門檻完全相同的結果；
+否則找門檻較寬鬆的結果，以 meets_criteria 重新過濾，不需重新抓取任何資料。
+
+較寬鬆的結果若已截斷（達 max_results 支，後面可能還有符合的股票），只有全部結果都通過
+新門檻時才能沿用；未截斷的結果一定包含所有符合較嚴格門檻的股票。
+"""
+
+import time
+
+from utils import cache, universe
+
+CACHE_PREFIX = 'screener_'
+
+# 門檻欄位；其餘欄位（運算式、自訂指標、選股範圍等）需完全相同才能共用結果
+THRESHOLD_FIELDS = ('min_rsi', 'max_rsi', 'min_score', 'price_trend', 'volume_filter')
+
+# 每組條件最多保留的結果數
+MAX_RUNS = 20
+
+
+def _ttl() -> int:
+    return cache.CACHE_NAMESPACES['screener']['ttl']
+
+
+def _thresholds(criteria: dict) -> dict:
+    return {
+        'min_rsi': criteria.get('min_rsi', 0),
+        'max_rsi': criteria.get('max_rsi', 100),
+        'min_score': criteria.get('min_score', 0),
+        'price_trend': criteria.get('price_trend', 'any'),
+        'volume_filter': bool(criteria.get('volume_filter', False)),
+    }
+
+
+def _covers(loose: dict, strict: dict) -> bool:
+    """loose 的門檻是否不比 strict 嚴格（符合 strict 的股票一定符合 loose）"""
+    return (loose['min_rsi'] <= strict['min_rsi']
+            and loose['max_rsi'] >= strict['max_rsi']
+            and loose['min_score'] <= strict['min_score']
+            and loose['price_trend'] in ('any', strict['price_trend'])
+            and (not loose['volume_filter'] or strict['volume_filter']))
+
+
+def cache_key(criteria: dict, stock_codes: list) -> str:
+    """
+    門檻以外的條件與選股範圍（實際股票代號）的正規化雜湊
+    :param criteria: 已經 validate_criteria 的條件
+    """
+    rest = {key: value for key, value in criteria.items()
+            if key not in THRESHOLD_FIELDS and key not in ('universe', 'watchlist', 'source')}
+    return f"{CACHE_PREFIX}{cache.content_version({'criteria': rest, 'codes': list(stock_codes)})}"
+
+
+def _stock_codes(screener, criteria: dict) -> list:
+    """實際篩選的股票代號；沒有價格歷史時大範圍只涵蓋前 live_universe_limit 支"""
+    stock_codes = universe.resolve_universe(criteria.get('universe'), screener.stock_pool,
+                                            criteria.get('watchlist'))
+    return screener.screened_codes(stock_codes)[0]
+
+
+def _fresh_runs(key: str) -> list:
+    entry = cache.get_cache(key) or {}
+    now = time.time()
+    return [run for run in entry.get('runs', []) if now - run['created'] <= _ttl()]
+
+
+def lookup(screener, criteria: dict):
+    """
+    以快取回應選股條件
+    :param criteria: 已經 validate_criteria 的條件
+    :return: {'results', 'exact', 'cached_at'}；沒有可用的快取時回傳 None
+    :raises ValueError: 選股範圍不合法
+    """
+    key = cache_key(criteria, _stock_codes(screener, criteria))
+    wanted = _thresholds(criteria)
+    runs = _fresh_runs(key)
+
+    for run in runs:
+        if run['thresholds'] == wanted:
+            return {'results': run['results'], 'exact': True, 'cached_at': run['created']}
+
+    # 由最嚴格（結果最少）的較寬鬆結果開始嘗試
+    for run in sorted(runs, key=lambda run: len(run['results'])):
+        if not _covers(run['thresholds'], wanted):
+            continue
+        results = [analysis for analysis in run['results'] if screener.meets_criteria(analysis, criteria)]
+        if run['complete'] or len(results) == len(run['results']):
+            return {'results': results, 'exact': False, 'cached_at': run['created']}
+    return None
+
+
+def store(screener, criteria: dict, results: list) -> None:
+    """
+    快取一次完整（未取消）選股的結果
+    :param criteria: 已經 validate_criteria 的條件
+    """
+    try:
+        key = cache_key(criteria, _stock_codes(screener, criteria))
+    except ValueError:
+        return
+    thresholds = _thresholds(criteria)
+    runs = [run for run in _fresh_runs(key) if run['thresholds'] != thresholds]
+    runs.append({
+        'thresholds': thresholds,
+        'results': results,
+        # 少於 max_results 支表示沒有提前結束或截斷，已包含所有符合條件的股票
+        'complete': len(results) < screener.max_results,
+        'created': time.time(),
+    })
+    cache.save_cache(key, {'runs': runs[-MAX_RUNS:]})
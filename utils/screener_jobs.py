@@ -0,0 +1,311 @@
+"""
+選股工作佇列
+相同條件（經 validate_criteria 正規化後）的選股請求共用同一個工作：
+第一個請求建立工作並交給有上限的執行緒池執行，之後的請求直接加入等待，
+上游抓取只做一次。完成的結果保留 SCREENER_JOB_TTL 秒，供輪詢或訂閱讀取，
+並寫入選股結果快取（utils/screener_cache.py）。
+
+工作狀態與事件同步寫入共用檔案快取（screener_job_<job_id>），多個 gunicorn worker 下
+任一 worker 都能查詢、訂閱或加入其他 worker 執行中的工作。
+幾乎同時送達不同 worker 的第一個請求可能各自執行一次，結果相同，只是多抓一次上游。
+"""
+
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from utils import cache, screener_cache, universe
+
+JOB_WORKERS = int(os.environ.get('SCREENER_JOB_WORKERS', 2))
+JOB_TTL = int(os.environ.get('SCREENER_JOB_TTL', 300))  # 完成後保留秒數
+# 執行中的工作最多每隔此秒數寫入一次共用紀錄；其他 worker 亦以此間隔輪詢
+SYNC_INTERVAL = float(os.environ.get('SCREENER_JOB_SYNC_INTERVAL', 0.5))
+
+# 工作狀態
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+
+def _record_key(job_id: str) -> str:
+    return f'screener_job_{job_id}'
+
+
+def _load_record(job_id: str):
+    """讀取共用快取中的工作紀錄；不存在或已過期時回傳 None"""
+    return cache.get_cache(_record_key(job_id))
+
+
+def _summarize(record: dict, include_results: bool = True) -> dict:
+    """由工作紀錄產生 API 回應用的摘要"""
+    progress = next((event for event in reversed(record['events']) if event['type'] == 'progress'), None)
+    data = {
+        'job_id': record['job_id'],
+        'status': record['status'],
+        'criteria': record['criteria'],
+        'progress': {key: progress[key] for key in ('processed', 'total', 'errors', 'found')}
+                    if progress else None,
+        'created_at': record['created_at'],
+        'finished_at': record['finished_at'],
+    }
+    if record['error']:
+        data['error'] = record['error']
+    if include_results and record['status'] == DONE:
+        data['results'] = record['results']
+    return data
+
+
+class ScreenerJob:
+    """單一選股工作：記錄 iter_screen 的事件序列，供多個請求共用"""
+
+    def __init__(self, job_id: str, criteria: dict, ttl: int = JOB_TTL):
+        self.id = job_id
+        self.criteria = criteria
+        self.ttl = ttl
+        self.status = QUEUED
+        self.events = []
+        self.results = None
+        self.error = None
+        self.created_at = datetime.now()
+        self.finished_at = None
+        self._finished_monotonic = None
+        self._synced_monotonic = 0.0
+        self._condition = threading.Condition()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (DONE, FAILED)
+
+    def expired(self, ttl: int) -> bool:
+        return self.finished and time.monotonic() - self._finished_monotonic > ttl
+
+    def record(self) -> dict:
+        """可寫入共用快取的工作紀錄"""
+        with self._condition:
+            return {
+                'job_id': self.id,
+                'status': self.status,
+                'criteria': self.criteria,
+                'events': list(self.events),
+                'results': self.results,
+                'error': self.error,
+                'created_at': self.created_at.isoformat(),
+                'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+            }
+
+    def sync(self, force: bool = False) -> None:
+        """
+        將工作紀錄寫入共用快取（執行中最多每 SYNC_INTERVAL 秒一次）
+        紀錄每次寫入都以 ttl 重新計時：完成後保留 ttl 秒；執行中的 worker 停止時，
+        紀錄於 ttl 秒後過期，其他 worker 即視為失敗並可重新建立工作
+        """
+        now = time.monotonic()
+        if not force and now - self._synced_monotonic < SYNC_INTERVAL:
+            return
+        self._synced_monotonic = now
+        cache.save_cache(_record_key(self.id), self.record(), ttl=self.ttl)
+
+    def _append(self, event: dict) -> None:
+        with self._condition:
+            self.events.append(event)
+            self._condition.notify_all()
+        self.sync()
+
+    def _finish(self, status: str, results=None, error=None) -> None:
+        with self._condition:
+            self.status = status
+            self.results = results
+            self.error = error
+            self.finished_at = datetime.now()
+            self._finished_monotonic = time.monotonic()
+            self._condition.notify_all()
+        self.sync(force=True)
+
+    def run(self, screener) -> None:
+        with self._condition:
+            self.status = RUNNING
+        self.sync(force=True)
+        try:
+            results = []
+            for event in screener.iter_screen(self.criteria):
+                if event['type'] == 'done':
+                    results = event['results']
+                    if not event.get('cancelled'):
+                        screener_cache.store(screener, self.criteria, results)
+                self._append(event)
+            self._finish(DONE, results=results)
+        except Exception as e:
+            print(f"❌ 選股工作 {self.id} 失敗: {e}")
+            self._append({'type': 'error', 'error': f'選股處理失敗: {e}'})
+            self._finish(FAILED, error=str(e))
+
+    def wait(self, timeout: float | None = None) -> bool:
+        """等待工作完成，回傳是否已完成"""
+        with self._condition:
+            return self._condition.wait_for(lambda: self.finished, timeout)
+
+    def iter_events(self, timeout: float | None = None):
+        """
+        依序產生工作事件（先重播已發生的事件，再等待新事件），工作完成後結束
+        :param timeout: 單次等待新事件的秒數上限；逾時即結束
+        """
+        index = 0
+        while True:
+            with self._condition:
+                if not self._condition.wait_for(
+                        lambda: index < len(self.events) or self.finished, timeout):
+                    return
+                pending = self.events[index:]
+                finished = self.finished
+            index += len(pending)
+            yield from pending
+            if finished and index >= len(self.events):
+                return
+
+    def to_dict(self, include_results: bool = True) -> dict:
+        return _summarize(self.record(), include_results)
+
+
+class RemoteScreenerJob:
+    """
+    其他 worker 執行中（或已完成）的選股工作，介面同 ScreenerJob
+    狀態與事件以 SYNC_INTERVAL 秒為間隔輪詢共用快取中的紀錄
+    """
+
+    def __init__(self, record: dict):
+        self._record = record
+
+    @property
+    def id(self) -> str:
+        return self._record['job_id']
+
+    @property
+    def status(self) -> str:
+        return self._record['status']
+
+    @property
+    def events(self) -> list:
+        return self._record['events']
+
+    @property
+    def results(self):
+        return self._record['results']
+
+    @property
+    def error(self):
+        return self._record['error']
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (DONE, FAILED)
+
+    def refresh(self) -> None:
+        """重新讀取紀錄；執行中的紀錄消失（執行的 worker 已停止）時視為失敗"""
+        record = _load_record(self.id)
+        if record is not None:
+            self._record = record
+        elif not self.finished:
+            self._record = dict(self._record, status=FAILED, finished_at=datetime.now().isoformat(),
+                                error='執行此選股工作的 worker 已停止')
+
+    def wait(self, timeout: float | None = None) -> bool:
+        """等待工作完成，回傳是否已完成"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self.finished:
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(SYNC_INTERVAL)
+            self.refresh()
+        return True
+
+    def iter_events(self, timeout: float | None = None):
+        """
+        依序產生工作事件（先重播已發生的事件，再輪詢新事件），工作完成後結束
+        :param timeout: 連續沒有新事件的秒數上限；逾時即結束
+        """
+        index = 0
+        last_event = time.monotonic()
+        while True:
+            pending = self.events[index:]
+            index += len(pending)
+            yield from pending
+            if self.finished and index >= len(self.events):
+                return
+            if pending:
+                last_event = time.monotonic()
+            elif timeout is not None and time.monotonic() - last_event > timeout:
+                return
+            time.sleep(SYNC_INTERVAL)
+            self.refresh()
+
+    def to_dict(self, include_results: bool = True) -> dict:
+        return _summarize(self._record, include_results)
+
+
+class ScreenerJobQueue:
+    """以正規化條件去除重複的選股工作佇列"""
+
+    def __init__(self, workers: int = JOB_WORKERS, ttl: int = JOB_TTL, screener_factory=None):
+        if screener_factory is None:
+            from utils.stock_screener import StockScreener
+            screener_factory = StockScreener
+        self.ttl = ttl
+        self._screener_factory = screener_factory
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='screener-job')
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def _purge(self) -> None:
+        for job_id in [job_id for job_id, job in self._jobs.items() if job.expired(self.ttl)]:
+            del self._jobs[job_id]
+
+    def submit(self, criteria: dict | None) -> tuple:
+        """
+        建立或加入選股工作（本行程的工作優先，其次為共用紀錄中其他 worker 的工作）
+        :return: (job, created)；created 為 False 表示加入既有工作
+        """
+        screener = self._screener_factory()
+        normalized = screener.validate_criteria(criteria or {})
+        # 先檢查選股範圍，設定不合法時直接拋出 ValueError，不建立工作
+        universe.resolve_universe(normalized.get('universe'), [], normalized.get('watchlist'))
+        job_id = cache.content_version(normalized)
+        with self._lock:
+            self._purge()
+            job = self._jobs.get(job_id)
+            # 失敗的工作不共用，重新執行
+            if job is not None and job.status != FAILED:
+                return job, False
+            record = _load_record(job_id)
+            if record is not None and record['status'] != FAILED:
+                return RemoteScreenerJob(record), False
+            job = ScreenerJob(job_id, normalized, ttl=self.ttl)
+            self._jobs[job_id] = job
+        job.sync(force=True)
+        self._executor.submit(job.run, screener)
+        print(f"📥 新增選股工作 {job_id}")
+        return job, True
+
+    def get(self, job_id: str):
+        """取得工作（本行程或其他 worker）；不存在或已過期時回傳 None"""
+        with self._lock:
+            self._purge()
+            job = self._jobs.get(job_id)
+        if job is not None:
+            return job
+        record = _load_record(job_id)
+        return RemoteScreenerJob(record) if record is not None else None
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_job_queue() -> ScreenerJobQueue:
+    """行程內共用的選股工作佇列"""
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            _queue = ScreenerJobQueue()
+        return _queue
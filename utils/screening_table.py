@@ -0,0 +1,224 @@
+"""
+每日選股表
+收盤後以價格歷史庫一次分析全市場，將每支股票的分析結果寫入 screening_snapshots 表；
+/api/screener 以索引範圍查詢（RSI、評分、5 日漲跌、成交量）回應選股條件，
+不需逐檔抓取。盤中可只重新分析評分最高的熱門股（refresh_hot_subset）。
+
+需在 Flask app context 中呼叫。
+"""
+
+import os
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+try:
+    from zoneinfo import ZoneInfo
+except ImportError:  # pragma: no cover
+    ZoneInfo = None
+
+from sqlalchemy import delete, func, insert
+from sqlalchemy.exc import SQLAlchemyError
+
+from database import db, ScreeningSnapshot
+from utils import score_history, universe
+
+HOT_SUBSET_SIZE = int(os.environ.get('SCREENING_HOT_SUBSET_SIZE', 50))
+# 當日選股表預期完成的時間（台北時間 HH:MM）；此時間前以前一個交易日為最新資料日
+READY_TIME = os.environ.get('SCREENING_TABLE_READY', '18:00')
+
+
+def _screener():
+    from utils.stock_screener import StockScreener
+    return StockScreener()
+
+
+def _taipei_now():
+    return datetime.now(ZoneInfo('Asia/Taipei')) if ZoneInfo else datetime.now()
+
+
+def expected_data_date(now: datetime | None = None) -> str:
+    """
+    選股表應有的最新資料日（YYYYMMDD）：週一至週五 READY_TIME 之後為當日，
+    否則為前一個平日（不含國定假日，假日後的第一個交易日前會改以即時篩選）
+    """
+    now = now or _taipei_now()
+    hour, minute = (int(part) for part in READY_TIME.split(':'))
+    day = now.date()
+    if now.weekday() >= 5 or (now.hour, now.minute) < (hour, minute):
+        day -= timedelta(days=1)
+    while day.weekday() >= 5:
+        day -= timedelta(days=1)
+    return day.strftime('%Y%m%d')
+
+
+def _calendar_days(trading_days: int) -> int:
+    """涵蓋 trading_days 個交易日所需的日曆天數（含連假的餘裕）"""
+    return trading_days * 7 // 5 + 14
+
+
+def _row_values(analysis: dict) -> dict:
+    return {
+        'stock_code': analysis['stock_code'],
+        'stock_name': analysis.get('stock_name'),
+        'data_date': analysis['data_date'],
+        'current_price': float(analysis['current_price']),
+        'rsi': float(analysis['rsi']),
+        'score': int(analysis['score']),
+        'price_change_5d': float(analysis.get('price_change_5d') or 0),
+        'volume': int(analysis.get('volume') or 0),
+        'analysis': json.dumps(analysis, ensure_ascii=False, default=str),
+        'updated_at': datetime.utcnow(),
+    }
+
+
+def write_snapshots(analyses: list, replace: bool = False) -> int:
+    """
+    寫入分析結果
+    :param replace: True 時先清空整張表（每日重建），否則只取代同代號的列
+    """
+    rows = [_row_values(analysis) for analysis in analyses]
+    try:
+        if replace:
+            db.session.execute(delete(ScreeningSnapshot))
+        elif rows:
+            codes = [row['stock_code'] for row in rows]
+            db.session.execute(delete(ScreeningSnapshot).where(ScreeningSnapshot.stock_code.in_(codes)))
+        if rows:
+            db.session.execute(insert(ScreeningSnapshot), rows)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return len(rows)
+
+
+def build_screening_table(stock_codes: list | None = None) -> dict:
+    """
+    以價格歷史庫重建選股表（建議每個交易日收盤、更新價格資料後執行）
+    :param stock_codes: 預設為股票清單主檔中的全部股票（沒有清單檔時為價格歷史中的全部股票）
+    :raises ValueError: 沒有價格歷史資料
+    """
+    from utils.price_history import load_price_history
+
+    history = load_price_history()
+    if history is None or not history.dates:
+        raise ValueError('沒有價格歷史資料，請先更新股票清單與價格資料')
+    if stock_codes is None:
+        stock_codes = [row['code'] for row in universe.load_listings()] or list(history.codes)
+
+    start = time.perf_counter()
+    analyses = _screener().analyze_history(stock_codes, history)
+    rows = write_snapshots(analyses, replace=True)
+    # 收盤評分記入評分歷史，時間為行情日期收盤（13:30）
+    closed_at = datetime.strptime(history.dates[-1], '%Y%m%d').replace(hour=13, minute=30)
+    score_history.write_scores(analyses, closed_at, replace=True)
+    elapsed = time.perf_counter() - start
+    print(f"🗂️ 選股表已重建：{history.dates[-1]}，{rows} 支股票（{elapsed:.1f} 秒）")
+    return {'date': history.dates[-1], 'symbols': len(stock_codes), 'rows': rows,
+            'seconds': round(elapsed, 2)}
+
+
+def refresh_hot_subset(limit: int = HOT_SUBSET_SIZE) -> int:
+    """
+    盤中以即時資料重新分析選股表中評分最高的 limit 支股票
+    :return: 更新的股票數
+    """
+    codes = [code for (code,) in db.session.query(ScreeningSnapshot.stock_code)
+             .order_by(ScreeningSnapshot.score.desc()).limit(limit)]
+    if not codes:
+        return 0
+
+    screener = _screener()
+    # 與建表相同取最近 history_days 個交易日，而非 chart_days 個日曆天
+    screener.chart_days = _calendar_days(screener.history_days)
+    with ThreadPoolExecutor(max_workers=screener.max_workers) as executor:
+        inputs = list(executor.map(screener.fetch_inputs, codes))
+    batch = []
+    for code, item in zip(codes, inputs):
+        if item:
+            basic_info, chart_data = item
+            trimmed = dict(chart_data, data=chart_data.get('data', [])[-screener.history_days:])
+            batch.append((code, basic_info, trimmed))
+    today = _taipei_now().strftime('%Y%m%d')
+    analyses = []
+    for analysis in screener.build_analyses(batch).values():
+        if screener.is_valid_analysis(analysis):
+            analysis['data_date'] = today
+            analyses.append(analysis)
+    updated = write_snapshots(analyses)
+    print(f"🔄 選股表熱門股已更新：{updated}/{len(codes)} 支")
+    return updated
+
+
+def table_status():
+    """選股表狀態；資料表不存在時回傳 None"""
+    try:
+        rows, data_date, updated_at = db.session.query(
+            func.count(ScreeningSnapshot.id),
+            func.min(ScreeningSnapshot.data_date),
+            func.max(ScreeningSnapshot.updated_at),
+        ).one()
+    except SQLAlchemyError:
+        db.session.rollback()
+        return None
+    return {'rows': rows, 'data_date': data_date,
+            'updated_at': updated_at.isoformat() if updated_at else None}
+
+
+def query_screening_table(criteria: dict, stock_codes: list | None = None, limit: int | None = 20) -> list:
+    """
+    以索引範圍查詢選股表，條件與 StockScreener.meets_criteria 相同（條件運算式除外），依評分由高到低
+    :param criteria: 已經 validate_criteria 的條件
+    :param stock_codes: 限定的股票代號；None 表示不限
+    :param limit: None 表示回傳所有符合的列
+    """
+    query = ScreeningSnapshot.query.filter(
+        ScreeningSnapshot.score >= criteria.get('min_score', 0),
+        ScreeningSnapshot.rsi.between(criteria.get('min_rsi', 0), criteria.get('max_rsi', 100)),
+    )
+    # 價格趨勢與 meets_criteria 一致，允許小幅反向波動
+    if criteria.get('price_trend') == 'up':
+        query = query.filter(ScreeningSnapshot.price_change_5d >= -5)
+    elif criteria.get('price_trend') == 'down':
+        query = query.filter(ScreeningSnapshot.price_change_5d <= 5)
+    if criteria.get('volume_filter'):
+        query = query.filter(ScreeningSnapshot.volume >= 100)
+    if stock_codes is not None:
+        query = query.filter(ScreeningSnapshot.stock_code.in_(stock_codes))
+    rows = query.order_by(ScreeningSnapshot.score.desc(), ScreeningSnapshot.rsi)
+    if limit is not None:
+        rows = rows.limit(limit)
+    return [json.loads(row.analysis) for row in rows]
+
+
+def screen_from_table(criteria: dict | None):
+    """
+    以選股表回應選股條件
+    :return: {'results', 'data_date', 'elapsed_ms'}；選股表不存在、沒有資料或
+             早於價格歷史最新交易日（沒有價格歷史時為 expected_data_date）時回傳 None（改以即時篩選）
+    :raises ValueError: 選股範圍不合法
+    """
+    from utils.price_history import load_price_history
+
+    status = table_status()
+    if not status or not status['rows']:
+        return None
+    history = load_price_history()
+    latest = history.dates[-1] if history is not None and history.dates else expected_data_date()
+    if status['data_date'] < latest:
+        return None
+
+    start = time.perf_counter()
+    screener = _screener()
+    criteria = screener.validate_criteria(criteria or {})
+    stock_codes = universe.resolve_universe(criteria.get('universe'), screener.stock_pool,
+                                            criteria.get('watchlist'))
+    if criteria.get('expression'):
+        # 範圍查詢縮小候選後，條件運算式以向量化遮罩計算，再取評分最高的 max_results 支
+        results = screener.select_top(query_screening_table(criteria, stock_codes, None), criteria)
+    else:
+        results = query_screening_table(criteria, stock_codes, screener.max_results)
+    return {'results': results, 'data_date': status['data_date'],
+            'elapsed_ms': round((time.perf_counter() - start) * 1000, 2)}
@@ -0,0 +1,383 @@
+"""
+分散式選股（協調者 / worker）
+全市場選股超過單機負荷時，協調者依股票代號雜湊將選股範圍切成多個分片，寫入共用的
+佇列目錄；各節點上的 worker 以 os.rename 認領分片（原子操作，只有一個 worker 會成功），
+分析後寫回該分片評分最高的 k 支股票，協調者再合併各分片的 top-k。
+
+佇列目錄（SCREENER_SHARD_DIR，多台機器時放在共用檔案系統上）：
+    pending/<run>_<分片>.json             待處理
+    claimed/<run>_<分片>.<worker>.json    處理中；worker 定期更新 mtime 作為心跳
+    results/<run>/<分片>.json             結果（或錯誤）
+
+分片失敗或 worker 心跳逾時（SCREENER_SHARD_TIMEOUT 秒）時重新排入佇列，
+最多重試 SCREENER_SHARD_ATTEMPTS 次；整體最多等待 SCREENER_SHARD_DEADLINE 秒。
+本機啟動的 worker 閒置 2 × SCREENER_SHARD_TIMEOUT 秒才結束，其他 worker 終止時
+仍在線上認領收回的分片；協調者結束時一併終止。
+
+用法（單機以多個 worker 行程模擬多個節點）：
+    python -m utils.sharded_screener worker [--id node-1]
+    python -m utils.sharded_screener screen --universe all --shards 16 [--spawn 4] [--criteria '{"min_score": 60}']
+"""
+
+import os
+import sys
+import json
+import time
+import zlib
+import uuid
+import heapq
+import socket
+import argparse
+import itertools
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+from utils import universe
+
+QUEUE_DIR = os.environ.get('SCREENER_SHARD_DIR', os.path.join('data', 'shards'))
+SHARD_TIMEOUT = int(os.environ.get('SCREENER_SHARD_TIMEOUT', 120))  # 心跳逾時秒數
+SHARD_ATTEMPTS = int(os.environ.get('SCREENER_SHARD_ATTEMPTS', 3))
+SHARD_DEADLINE = float(os.environ.get('SCREENER_SHARD_DEADLINE', 1800))  # 整體等待秒數上限
+HEARTBEAT_INTERVAL = float(os.environ.get('SCREENER_SHARD_HEARTBEAT', 5))  # 需遠小於 SHARD_TIMEOUT
+POLL_INTERVAL = 0.5
+
+
+def _paths(queue_dir: str) -> tuple:
+    paths = tuple(os.path.join(queue_dir, name) for name in ('pending', 'claimed', 'results'))
+    for path in paths:
+        os.makedirs(path, exist_ok=True)
+    return paths
+
+
+def _write_json(path: str, data) -> None:
+    """先寫入暫存檔再以 os.replace 置換，讀取端不會看到寫一半的檔案"""
+    tmp_file = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, default=str)
+    os.replace(tmp_file, path)
+
+
+def _read_json(path: str):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def shard_of(stock_code: str, shards: int) -> int:
+    """穩定的股票分片（不受 Python 雜湊隨機化影響，各節點結果一致）"""
+    return zlib.crc32(stock_code.encode('utf-8')) % shards
+
+
+def partition(stock_codes: list, shards: int) -> list:
+    """依代號雜湊分成 shards 份（保持原順序），略過空的分片"""
+    buckets = [[] for _ in range(shards)]
+    for stock_code in stock_codes:
+        buckets[shard_of(stock_code, shards)].append(stock_code)
+    return buckets
+
+
+def merge_top_k(partials: list, k: int) -> list:
+    """合併各分片依評分排序的結果，取評分最高的 k 支"""
+    return list(itertools.islice(heapq.merge(*partials, key=lambda analysis: -analysis['score']), k))
+
+
+# ── worker ─────────────────────────────────────────────
+
+def screen_shard(task: dict) -> dict:
+    """
+    分析一個分片並回傳評分最高的 k 支（依評分排序）
+    有價格歷史庫時以向量化引擎一次分析；否則逐檔抓取即時資料
+    """
+    from utils.stock_screener import StockScreener
+    from utils.price_history import load_price_history
+
+    screener = StockScreener()
+    screener.max_results = task['k']
+    criteria, codes = task['criteria'], task['codes']
+    history = load_price_history(task.get('history'))
+    if history is not None and history.dates:
+        results = screener.screen_history(codes, criteria, history)
+        return {'results': results, 'processed': len(codes)}
+
+    with ThreadPoolExecutor(max_workers=screener.max_workers) as executor:
+        inputs = list(executor.map(screener.fetch_inputs, codes))
+    batch = [(code,) + item for code, item in zip(codes, inputs) if item]
+    analyses = [analysis for analysis in screener.build_analyses(batch).values()
+                if screener.is_valid_analysis(analysis)]
+    results = screener.select_top(analyses, criteria, len(codes), len(codes) - len(analyses))
+    return {'results': results, 'processed': len(codes)}
+
+
+def _claim(pending_dir: str, claimed_dir: str, worker_id: str):
+    """認領一個待處理分片；沒有可認領的分片時回傳 None"""
+    for name in sorted(os.listdir(pending_dir)):
+        if not name.endswith('.json'):
+            continue
+        claimed = os.path.join(claimed_dir, f"{name[:-len('.json')]}.{worker_id}.json")
+        try:
+            os.rename(os.path.join(pending_dir, name), claimed)
+        except OSError:
+            continue  # 已被其他 worker 認領
+        task = _read_json(claimed)
+        if task is None:
+            os.remove(claimed)
+            continue
+        return claimed, task
+    return None
+
+
+def _heartbeat(path: str, stop: threading.Event) -> None:
+    while not stop.wait(HEARTBEAT_INTERVAL):
+        try:
+            os.utime(path)
+        except OSError:
+            return  # 協調者已將分片收回
+
+
+def run_worker(queue_dir: str | None = None, worker_id: str | None = None,
+               idle_exit: float | None = None) -> int:
+    """
+    持續認領並處理分片
+    :param idle_exit: 連續閒置超過此秒數即結束；None 表示不結束
+    :return: 處理的分片數
+    """
+    queue_dir = queue_dir or QUEUE_DIR
+    worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+    pending_dir, claimed_dir, results_dir = _paths(queue_dir)
+    print(f"👷 選股 worker {worker_id} 啟動，佇列目錄 {queue_dir}")
+
+    handled = 0
+    idle_since = time.monotonic()
+    while True:
+        claimed = _claim(pending_dir, claimed_dir, worker_id)
+        if claimed is None:
+            if idle_exit is not None and time.monotonic() - idle_since > idle_exit:
+                return handled
+            time.sleep(POLL_INTERVAL)
+            continue
+
+        path, task = claimed
+        stop = threading.Event()
+        threading.Thread(target=_heartbeat, args=(path, stop), daemon=True).start()
+        started = time.perf_counter()
+        try:
+            result = screen_shard(task)
+        except Exception as e:
+            print(f"❌ 分片 {task['run']}#{task['shard']} 失敗: {e}")
+            result = {'error': str(e)}
+        finally:
+            stop.set()
+        result.update({'shard': task['shard'], 'attempt': task['attempt'], 'worker': worker_id,
+                       'seconds': round(time.perf_counter() - started, 3)})
+        run_dir = os.path.join(results_dir, task['run'])
+        os.makedirs(run_dir, exist_ok=True)
+        _write_json(os.path.join(run_dir, f"{task['shard']}.json"), result)
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        handled += 1
+        idle_since = time.monotonic()
+
+
+# ── 協調者 ─────────────────────────────────────────────
+
+class ShardedScreen:
+    """一次分散式選股：建立分片、監看結果、重試失敗或逾時的分片並合併 top-k"""
+
+    def __init__(self, criteria: dict, stock_codes: list, shards: int, k: int,
+                 queue_dir: str | None = None, history: str | None = None,
+                 timeout: float = SHARD_TIMEOUT, attempts: int = SHARD_ATTEMPTS):
+        self.run_id = uuid.uuid4().hex[:12]
+        self.criteria = criteria
+        self.k = k
+        self.history = history
+        self.timeout = timeout
+        self.attempts = attempts
+        self.pending_dir, self.claimed_dir, results_dir = _paths(queue_dir or QUEUE_DIR)
+        self.run_dir = os.path.join(results_dir, self.run_id)
+        os.makedirs(self.run_dir, exist_ok=True)
+        self.shards = {index: codes for index, codes in enumerate(partition(stock_codes, shards)) if codes}
+        self.results = {}
+        self.failed = {}
+        self.retries = 0
+
+    def _enqueue(self, shard: int, attempt: int) -> None:
+        task = {'run': self.run_id, 'shard': shard, 'attempt': attempt, 'k': self.k,
+                'criteria': self.criteria, 'codes': self.shards[shard], 'history': self.history}
+        _write_json(os.path.join(self.pending_dir, f"{self.run_id}_{shard}.json"), task)
+
+    def _retry(self, shard: int, attempt: int, reason: str) -> None:
+        if attempt >= self.attempts:
+            print(f"❌ 分片 #{shard} 已重試 {attempt} 次仍失敗: {reason}")
+            self.failed[shard] = reason
+            return
+        print(f"🔁 分片 #{shard} 重新排入佇列（第 {attempt + 1} 次）: {reason}")
+        self.retries += 1
+        self._enqueue(shard, attempt + 1)
+
+    def _collect(self) -> None:
+        for name in os.listdir(self.run_dir):
+            if not name.endswith('.json'):
+                continue
+            path = os.path.join(self.run_dir, name)
+            result = _read_json(path)
+            if result is None:
+                continue
+            os.remove(path)
+            shard = result['shard']
+            if shard in self.results or shard in self.failed:
+                continue  # 逾時重派後原 worker 才交回的重複結果
+            if 'error' in result:
+                self._retry(shard, result['attempt'], result['error'])
+            else:
+                self.results[shard] = result
+
+    def _reclaim_stale(self) -> None:
+        """收回心跳逾時的分片（worker 行程或節點已終止）"""
+        now = time.time()
+        prefix = f"{self.run_id}_"
+        for name in os.listdir(self.claimed_dir):
+            if not name.startswith(prefix):
+                continue
+            path = os.path.join(self.claimed_dir, name)
+            try:
+                if now - os.path.getmtime(path) <= self.timeout:
+                    continue
+                task = _read_json(path)
+                os.remove(path)
+            except OSError:
+                continue
+            if task is not None and task['shard'] not in self.results:
+                worker_id = name[len(prefix):-len('.json')].split('.', 1)[-1]
+                self._retry(task['shard'], task['attempt'], f"worker {worker_id} 心跳逾時")
+
+    def _cleanup(self) -> None:
+        prefix = f"{self.run_id}_"
+        for directory in (self.pending_dir, self.claimed_dir):
+            for name in os.listdir(directory):
+                if name.startswith(prefix):
+                    try:
+                        os.remove(os.path.join(directory, name))
+                    except OSError:
+                        pass
+        try:
+            for name in os.listdir(self.run_dir):
+                os.remove(os.path.join(self.run_dir, name))
+            os.rmdir(self.run_dir)
+        except OSError:
+            pass
+
+    def run(self, deadline: float | None = SHARD_DEADLINE) -> dict:
+        """
+        派送所有分片並等待完成
+        :param deadline: 整體等待秒數上限，逾時仍未完成的分片記為失敗；None 表示不限
+        :return: {'results', 'processed', 'shards', 'failed_shards', 'retries', 'seconds'}
+        """
+        started = time.perf_counter()
+        for shard in self.shards:
+            self._enqueue(shard, 1)
+        print(f"📤 分散式選股 {self.run_id}：{sum(map(len, self.shards.values()))} 支股票，"
+              f"{len(self.shards)} 個分片")
+        try:
+            while len(self.results) + len(self.failed) < len(self.shards):
+                if deadline is not None and time.perf_counter() - started > deadline:
+                    for shard in self.shards:
+                        if shard not in self.results:
+                            self.failed.setdefault(shard, '等待逾時')
+                    break
+                time.sleep(POLL_INTERVAL)
+                self._collect()
+                self._reclaim_stale()
+        finally:
+            self._cleanup()
+
+        partials = [self.results[shard]['results'] for shard in sorted(self.results)]
+        elapsed = time.perf_counter() - started
+        if self.failed:
+            print(f"⚠️ {len(self.failed)} 個分片失敗，結果不完整: {sorted(self.failed)}")
+        return {
+            'results': merge_top_k(partials, self.k),
+            'processed': sum(result['processed'] for result in self.results.values()),
+            'shards': len(self.shards),
+            'failed_shards': self.failed,
+            'retries': self.retries,
+            'seconds': round(elapsed, 3),
+        }
+
+
+def sharded_screen(criteria: dict | None = None, shards: int = 8, queue_dir: str | None = None,
+                   history: str | None = None, deadline: float | None = SHARD_DEADLINE) -> dict:
+    """
+    以佇列目錄上的 worker 執行分散式選股，回傳合併後評分最高的 max_results 支
+    :raises ValueError: 條件或選股範圍不合法
+    """
+    from utils.stock_screener import StockScreener
+
+    screener = StockScreener()
+    criteria = screener.validate_criteria(criteria or {})
+    stock_codes = universe.resolve_universe(criteria.get('universe'), screener.stock_pool,
+                                            criteria.get('watchlist'))
+    screen = ShardedScreen(criteria, stock_codes, shards, screener.max_results, queue_dir, history)
+    return screen.run(deadline)
+
+
+def spawn_workers(count: int, queue_dir: str | None = None, idle_exit: float | None = None) -> list:
+    """
+    在本機啟動 count 個 worker 行程（模擬多個節點）
+    :param idle_exit: 閒置結束秒數，預設 2 × SHARD_TIMEOUT；需長於分片逾時，
+                      終止的 worker 所認領的分片收回後才有 worker 接手
+    """
+    idle_exit = 2 * SHARD_TIMEOUT if idle_exit is None else idle_exit
+    command = [sys.executable, '-m', 'utils.sharded_screener', 'worker', '--idle-exit', str(idle_exit)]
+    if queue_dir:
+        command += ['--dir', queue_dir]
+    return [subprocess.Popen(command + ['--id', f"local-{index + 1}"]) for index in range(count)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='分散式選股（協調者 / worker）')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    worker = subparsers.add_parser('worker', help='認領並處理分片')
+    worker.add_argument('--dir', default=None, help='佇列目錄（預設 SCREENER_SHARD_DIR）')
+    worker.add_argument('--id', default=None, help='worker 名稱，預設為主機名稱-行程編號')
+    worker.add_argument('--idle-exit', type=float, default=None, help='閒置超過秒數即結束')
+
+    screen = subparsers.add_parser('screen', help='派送分片並合併結果')
+    screen.add_argument('--dir', default=None)
+    screen.add_argument('--criteria', default='{}', help='選股條件 JSON')
+    screen.add_argument('--universe', default=None, help='選股範圍，例如 all、tse')
+    screen.add_argument('--shards', type=int, default=8)
+    screen.add_argument('--history', default=None, help='價格歷史檔（預設 PRICE_HISTORY_FILE）')
+    screen.add_argument('--spawn', type=int, default=0, help='同時在本機啟動的 worker 數')
+    screen.add_argument('--deadline', type=float, default=SHARD_DEADLINE, help='整體等待秒數上限')
+    args = parser.parse_args()
+
+    if args.command == 'worker':
+        run_worker(args.dir, args.id, args.idle_exit)
+        return
+
+    criteria = json.loads(args.criteria)
+    if args.universe:
+        criteria['universe'] = args.universe
+    workers = spawn_workers(args.spawn, args.dir) if args.spawn else []
+    try:
+        report = sharded_screen(criteria, args.shards, args.dir, args.history, args.deadline)
+    finally:
+        for process in workers:
+            process.terminate()
+            process.wait()
+
+    print(f"✅ {report['shards']} 個分片、處理 {report['processed']} 支股票，重試 {report['retries']} 次，"
+          f"耗時 {report['seconds']} 秒")
+    for rank, analysis in enumerate(report['results'], 1):
+        print(f"{rank:>3}. {analysis['stock_code']:<8}{analysis.get('stock_name', ''):<12}"
+              f"評分 {analysis['score']:>3}  RSI {analysis['rsi']:>6}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""
+共享記憶體陣列
+將多個 NumPy 陣列連續放進同一塊 multiprocessing.shared_memory，子行程以名稱與
+配置表（manifest）掛載為唯讀視圖，不需把大型矩陣 pickle 傳給每個 worker。
+"""
+
+import sys
+from multiprocessing import shared_memory
+
+import numpy as np
+
+_ALIGNMENT = 64
+
+
+class SharedArrays:
+    """
+    建立者：SharedArrays.create({'close': matrix, ...}) 或 allocate(...)，用完呼叫 close()（一併刪除）
+    使用者：SharedArrays.attach(name, manifest)，用完呼叫 close()；writable=True 時可寫入結果
+    """
+
+    def __init__(self, shm: shared_memory.SharedMemory, manifest: dict, owner: bool,
+                 writable: bool | None = None):
+        self.shm = shm
+        self.manifest = manifest
+        self.owner = owner
+        self.arrays = {
+            key: np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf, offset=offset)
+            for key, (offset, shape, dtype) in manifest.items()
+        }
+        if not (owner if writable is None else writable):
+            for array in self.arrays.values():
+                array.flags.writeable = False
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    @classmethod
+    def create(cls, arrays: dict) -> 'SharedArrays':
+        shared = cls.allocate({key: (np.shape(array), np.asarray(array).dtype)
+                               for key, array in arrays.items()})
+        for key, array in arrays.items():
+            shared.arrays[key][...] = array
+        return shared
+
+    @classmethod
+    def allocate(cls, specs: dict) -> 'SharedArrays':
+        """配置未初始化的共享陣列 {名稱: (shape, dtype)}，供子行程寫入結果"""
+        manifest = {}
+        size = 0
+        for key, (shape, dtype) in specs.items():
+            dtype = np.dtype(dtype)
+            size = -(-size // _ALIGNMENT) * _ALIGNMENT
+            manifest[key] = (size, tuple(shape), dtype.str)
+            size += int(np.prod(shape)) * dtype.itemsize
+        shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        return cls(shm, manifest, owner=True)
+
+    @classmethod
+    def attach(cls, name: str, manifest: dict, writable: bool = False) -> 'SharedArrays':
+        # 行程池的子行程與建立者共用同一個 resource_tracker，重複登記不影響；
+        # 3.13 起可直接略過登記
+        if sys.version_info >= (3, 13):
+            shm = shared_memory.SharedMemory(name=name, track=False)
+        else:
+            shm = shared_memory.SharedMemory(name=name)
+        return cls(shm, manifest, owner=False, writable=writable)
+
+    def close(self, unlink: bool | None = None) -> None:
+        """釋放視圖並關閉；建立者預設一併刪除共享區塊"""
+        self.arrays = {}
+        self.shm.close()
+        if self.owner if unlink is None else unlink:
+            self.shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
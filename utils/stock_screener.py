@@ -1,25 +1,39 @@
 import requests
-import json
 import os
 import time
 import random
-from datetime import datetime, timedelta
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from utils import cache, score_history, universe
+from utils.rate_limit import RateLimiter
+from utils.streaming_indicators import StreamingIndicators
 from utils.twse import get_stock_basic_info, get_stock_chart_data, HEADERS, CONFIG
 try:
     import numpy as np
+    from utils import criteria_expr, indicator_service, price_history
 except ImportError:
     np = None
+    criteria_expr = None
+    indicator_service = None
+    price_history = None
 try:
     import pandas as pd
 except ImportError:
     pd = None
 
+# 上游請求的權杖桶由行程內所有 StockScreener 共用（每個 API 請求、工作與分片都會建立新的選股器，
+# 各自持有限制器時並行篩選會各拿到一份完整額度）
+RATE_LIMITER = RateLimiter(
+    float(os.environ.get('SCREENER_REQUESTS_PER_SECOND', 10)),
+    burst=int(os.environ.get('SCREENER_REQUEST_BURST', 10))
+)
+
 class StockScreener:
     """股票選股器 - 基於技術指標進行選股分析"""
     
     def __init__(self):
-        self.cache_dir = 'cache'
-        os.makedirs(self.cache_dir, exist_ok=True)
+        self.cache_dir = cache.CACHE_DIR
         
         # 台股常見股票池（優化版 - 更小但更穩定的股票池）
         self.stock_pool = [
@@ -37,18 +51,30 @@ class StockScreener:
             '1216', '2609', '2201', '1102', '2104', '2204', '2618'
         ]
         
-        # 快取設定
+        # 快取設定（analyze_stock 依輸入資料版本判斷是否重算，不受此時間限制）
         self.cache_timeout = 300  # 5分鐘快取
         self.max_retries = 3
         self.request_delay = 1  # 請求間隔1秒
+        self.chart_days = 90  # 約 60 個交易日的日線，足以計算 MA60 與完整 MACD
+        
+        # 並行篩選設定：抓取階段在有限的執行緒池中進行，並以權杖桶限制上游請求頻率
+        self.max_workers = int(os.environ.get('SCREENER_MAX_WORKERS', 8))
+        self.max_results = 20  # 找到足夠結果即提前結束
+        self.compute_batch_size = 8  # 累積幾支股票後以向量化引擎一次計算指標
+        self.compute_batch_interval = 0.5  # 秒，串流篩選時未滿一批也定期計算，盡快送出結果
+        
+        # 選股範圍超過此數量時改讀價格歷史庫批次篩選，不逐檔請求
+        self.live_universe_limit = int(os.environ.get('SCREENER_LIVE_UNIVERSE_LIMIT', 100))
+        self.history_days = 90  # 批次篩選使用的交易日數
+        self.rate_limiter = RATE_LIMITER
     
     def calculate_rsi(self, prices, period=14):
         """計算RSI指標 - 適應性版本"""
         if len(prices) < 2:
             return 50  # 預設中性值
         
-        # 調整週期以適應可用資料
-        actual_period = min(period, len(prices) - 1, 10)
+        # 資料不足 period 天時才縮短週期；資料足夠時與向量化引擎使用相同週期
+        actual_period = min(period, len(prices) - 1)
         if actual_period < 2:
             return 50
         
@@ -70,6 +96,11 @@ class StockScreener:
             else:
                 avg_gain = sum(gains[:actual_period]) / actual_period
                 avg_loss = sum(losses[:actual_period]) / actual_period
+                
+                # Wilder 平滑：後續每一天都納入計算，與向量化引擎一致
+                for gain, loss in zip(gains[actual_period:], losses[actual_period:]):
+                    avg_gain = (avg_gain * (actual_period - 1) + gain) / actual_period
+                    avg_loss = (avg_loss * (actual_period - 1) + loss) / actual_period
             
             if avg_loss == 0:
                 return 100
@@ -100,8 +131,9 @@ class StockScreener:
                 ema12 = ema(prices, min(12, len(prices) // 2))
                 ema26 = ema(prices, min(26, len(prices) - 1))
                 
-                macd_line = ema12[-1] - ema26[-1]
-                signal_line = macd_line * 0.8  # 簡化signal計算
+                macd_values = [fast - slow for fast, slow in zip(ema12, ema26)]
+                macd_line = macd_values[-1]
+                signal_line = ema(macd_values, 9)[-1]
                 histogram = macd_line - signal_line
                 
                 return round(macd_line, 3), round(signal_line, 3), round(histogram, 3)
@@ -173,76 +205,14 @@ class StockScreener:
         try:
             print(f"📊 分析股票: {stock_code}")
             
-            # 檢查快取
-            cache_key = f"analysis_{stock_code}"
-            cached_analysis = self.get_cache(cache_key)
-            if cached_analysis:
-                print(f"✅ 使用快取分析: {stock_code}")
-                return cached_analysis
-            
             # 延遲請求避免過於頻繁
             if retries > 0:
                 time.sleep(self.request_delay * retries)
             
-            # 獲取基本資訊
-            basic_info = self.get_stock_info_with_retry(stock_code)
-            if not basic_info or basic_info.get('錯誤'):
-                print(f"❌ 無法獲取基本資訊: {stock_code}")
-                return None
-            
-            # 獲取價格資料 - 進一步降低要求，提高成功率
-            chart_data = self.get_chart_data_with_retry(stock_code, 14)  # 只要14天的資料
-            if not chart_data or not chart_data.get('success'):
-                print(f"❌ 無法獲取圖表資料: {stock_code}")
+            inputs = self.fetch_inputs(stock_code)
+            if inputs is None:
                 return None
-                
-            data_points = chart_data.get('data', [])
-            if len(data_points) < 5:  # 進一步降低最低資料要求
-                print(f"❌ 資料點不足: {stock_code} ({len(data_points)} 點)")
-                return None
-            
-            # 解析價格資料
-            prices = []
-            for item in data_points:
-                try:
-                    price = float(item['price'])
-                    if price > 0:  # 確保價格有效
-                        prices.append(price)
-                except (ValueError, KeyError):
-                    continue
-            
-            if len(prices) < 3:  # 進一步降低要求
-                print(f"❌ 有效價格資料不足: {stock_code}")
-                return None
-            
-            current_price = prices[-1]
-            
-            # 計算技術指標 - 安全版本
-            analysis = {
-                'stock_code': stock_code,
-                'stock_name': basic_info.get('股票名稱', stock_code),
-                'current_price': current_price,
-                'analysis_time': datetime.now().isoformat()
-            }
-            
-            # 計算價格變化（安全版本）
-            analysis.update(self.calculate_price_changes(prices))
-            
-            # 計算技術指標（安全版本）
-            analysis.update(self.calculate_technical_indicators(prices))
-            
-            # 解析成交量
-            analysis['volume'] = self.parse_volume(basic_info.get('成交量', '0'))
-            
-            # 產生投資建議和評分
-            analysis['signals'] = self.generate_signals(analysis)
-            analysis['score'] = self.calculate_score(analysis)
-            
-            # 儲存快取
-            self.save_cache(cache_key, analysis)
-            
-            print(f"✅ 成功分析: {stock_code} (評分: {analysis['score']})")
-            return analysis
+            return self.build_analysis(stock_code, *inputs)
             
         except Exception as e:
             print(f"❌ 分析股票 {stock_code} 時發生錯誤: {e}")
@@ -255,12 +225,179 @@ class StockScreener:
             
             return None
     
+    def fetch_inputs(self, stock_code):
+        """
+        抓取分析所需的輸入資料（I/O 階段）
+        :return: (basic_info, chart_data)，任一資料無法取得時回傳 None
+        """
+        # 獲取基本資訊
+        basic_info = self.get_stock_info_with_retry(stock_code)
+        if not basic_info or basic_info.get('錯誤'):
+            print(f"❌ 無法獲取基本資訊: {stock_code}")
+            return None
+        
+        # 獲取價格資料 - 進一步降低要求，提高成功率
+        chart_data = self.get_chart_data_with_retry(stock_code, self.chart_days)
+        if not chart_data or not chart_data.get('success'):
+            print(f"❌ 無法獲取圖表資料: {stock_code}")
+            return None
+        
+        return basic_info, chart_data
+    
+    def build_analysis(self, stock_code, basic_info, chart_data):
+        """由輸入資料計算技術分析（計算階段，不發出網路請求）"""
+        return self.build_analyses([(stock_code, basic_info, chart_data)]).get(stock_code)
+    
+    def build_analyses(self, batch):
+        """
+        批次計算技術分析：輸入未變動者沿用快取，其餘股票的指標一次計算
+        :param batch: [(stock_code, basic_info, chart_data), ...]
+        :return: {stock_code: analysis}，資料不足的股票不在結果中
+        """
+        analyses = {}
+        pending = []
+        for stock_code, basic_info, chart_data in batch:
+            prepared = self._prepare_analysis(stock_code, basic_info, chart_data)
+            if prepared is None:
+                continue
+            cached_analysis, prices, input_versions, times = prepared
+            if cached_analysis is not None:
+                analyses[stock_code] = cached_analysis
+            else:
+                pending.append((stock_code, basic_info, prices, input_versions, times))
+        
+        indicator_rows = self.calculate_indicators_batch(
+            [item[2] for item in pending],
+            series_keys=[(item[0], item[4]) for item in pending]
+        )
+        for (stock_code, basic_info, prices, input_versions, _), indicators in zip(pending, indicator_rows):
+            analyses[stock_code] = self._finish_analysis(
+                stock_code, basic_info, prices, input_versions, indicators)
+        return analyses
+    
+    def _prepare_analysis(self, stock_code, basic_info, chart_data):
+        """
+        解析價格並檢查分析快取
+        :return: (快取的分析, None, None, None) 或 (None, prices, input_versions, times)；
+                 資料不足回傳 None
+        """
+        data_points = chart_data.get('data', [])
+        if len(data_points) < 5:  # 進一步降低最低資料要求
+            print(f"❌ 資料點不足: {stock_code} ({len(data_points)} 點)")
+            return None
+        
+        # 檢查快取：報價與圖表資料都未變動時沿用上次的分析結果
+        input_versions = {
+            'quote': cache.content_version(basic_info),
+            'chart': cache.content_version(data_points),
+        }
+        cached_entry = cache.get_cache(f"analysis_{stock_code}")
+        if cached_entry and cached_entry.get('inputs') == input_versions:
+            print(f"✅ 輸入資料未變動，使用快取分析: {stock_code}")
+            return cached_entry['analysis'], None, None, None
+        
+        # 解析價格資料
+        prices = []
+        times = []
+        for item in data_points:
+            try:
+                price = float(item['price'])
+                if price > 0:  # 確保價格有效
+                    prices.append(price)
+                    times.append(item.get('time'))
+            except (ValueError, KeyError):
+                continue
+        
+        if len(prices) < 3:  # 進一步降低要求
+            print(f"❌ 有效價格資料不足: {stock_code}")
+            return None
+        
+        return None, prices, input_versions, times
+    
+    def _finish_analysis(self, stock_code, basic_info, prices, input_versions, indicators):
+        """組合分析結果、產生訊號與評分並寫入快取"""
+        analysis = self._assemble_analysis(
+            stock_code, basic_info.get('股票名稱', stock_code), prices,
+            self.parse_volume(basic_info.get('成交量', '0')), indicators
+        )
+        
+        # 儲存快取（連同輸入資料版本，輸入變動時才重新計算）
+        cache.save_cache(f"analysis_{stock_code}", {'inputs': input_versions, 'analysis': analysis})
+        # 新算出的分析記入評分歷史（沿用快取的分析不重複記錄）
+        score_history.record(analysis)
+        
+        print(f"✅ 成功分析: {stock_code} (評分: {analysis['score']})")
+        return analysis
+    
+    def _assemble_analysis(self, stock_code, stock_name, prices, volume, indicators):
+        """由價格序列與指標組合分析結果，並產生投資建議和評分"""
+        analysis = {
+            'stock_code': stock_code,
+            'stock_name': stock_name,
+            'current_price': prices[-1],
+            'analysis_time': datetime.now().isoformat()
+        }
+        
+        # 計算價格變化（安全版本）
+        analysis.update(self.calculate_price_changes(prices))
+        
+        # 技術指標
+        analysis.update(indicators)
+        analysis['volume'] = volume
+        
+        # 產生投資建議和評分
+        analysis['signals'] = self.generate_signals(analysis)
+        analysis['score'] = self.calculate_score(analysis)
+        return analysis
+    
+    def update_live_indicators(self, stock_code, price, bar_time=None):
+        """
+        以盤中報價增量更新指標並產生即時訊號，每筆報價為常數時間
+        指標狀態保存在快取（indicator_state_<代號>），首次使用時才以歷史收盤價建立
+        :param bar_time: K 棒時間標記，預設為今天日期（同一天的報價修正當日 K 棒）
+        """
+        state_key = f"indicator_state_{stock_code}"
+        state = cache.get_cache(state_key)
+        streaming = StreamingIndicators.from_dict(state) if state else self._seed_live_indicators(stock_code)
+        if streaming is None:
+            return None
+        
+        values = streaming.on_price(price, bar_time or datetime.now().strftime('%Y-%m-%d'))
+        cache.save_cache(state_key, streaming.to_dict())
+        
+        analysis = {
+            'stock_code': stock_code,
+            'current_price': price,
+            'analysis_time': datetime.now().isoformat()
+        }
+        analysis.update(self.calculate_price_changes(streaming.recent_prices))
+        analysis.update(self._fill_indicator_defaults(values, price))
+        
+        analysis['signals'] = self.generate_signals(analysis)
+        analysis['score'] = self.calculate_score(analysis)
+        return analysis
+    
+    def _seed_live_indicators(self, stock_code):
+        """以與批次分析相同的 chart_days 日線收盤價建立增量指標狀態（EMA / MACD 起算點一致）"""
+        chart_data = self.get_chart_data_with_retry(stock_code, self.chart_days)
+        if not chart_data or not chart_data.get('success'):
+            print(f"❌ 無法建立即時指標: {stock_code}")
+            return None
+        streaming = StreamingIndicators()
+        for item in chart_data.get('data', []):
+            try:
+                streaming.on_price(float(item['price']), item['time'][:10])
+            except (ValueError, KeyError, TypeError):
+                continue
+        return streaming
+    
     def get_stock_info_with_retry(self, stock_code):
         """帶重試機制的股票資訊獲取"""
         for attempt in range(self.max_retries):
             try:
                 if attempt > 0:
                     time.sleep(1 * attempt)
+                self._throttle(f"stock_basic_{stock_code}")
                 return get_stock_basic_info(stock_code)
             except Exception as e:
                 print(f"⚠️ 獲取 {stock_code} 基本資訊失敗 (嘗試 {attempt + 1}): {e}")
@@ -274,6 +411,7 @@ class StockScreener:
             try:
                 if attempt > 0:
                     time.sleep(1 * attempt)
+                self._throttle(f"chart_{stock_code}_{days}")
                 return get_stock_chart_data(stock_code, days)
             except Exception as e:
                 print(f"⚠️ 獲取 {stock_code} 圖表資料失敗 (嘗試 {attempt + 1}): {e}")
@@ -281,6 +419,11 @@ class StockScreener:
                     return None
         return None
     
+    def _throttle(self, cache_key):
+        """即將向上游發出請求時（快取未命中）才消耗速率限制權杖"""
+        if not cache.has_fresh_cache(cache_key):
+            self.rate_limiter.acquire()
+    
     def calculate_price_changes(self, prices):
         """計算價格變化 - 安全版本"""
         changes = {}
@@ -352,6 +495,62 @@ class StockScreener:
         
         return indicators
     
+    def calculate_indicators_batch(self, price_lists, series_keys=None):
+        """
+        批次計算多支股票的技術指標，回傳與 price_lists 對應的最新指標 dict 列表。
+        有 NumPy 時依序列長度分組，以向量化引擎一次計算整組完整序列；否則逐支計算。
+        :param series_keys: 對應每支股票的 (stock_code, times)；提供時讀寫指標序列快取，
+                            與 /api/stock/<code>/indicators 共用同一份計算結果
+        """
+        if indicator_service is None:
+            return [self.calculate_technical_indicators(prices) for prices in price_lists]
+        
+        params = indicator_service.normalize_params()
+        rows = [None] * len(price_lists)
+        groups = {}
+        for index, prices in enumerate(price_lists):
+            if series_keys:
+                stock_code, _ = series_keys[index]
+                series = indicator_service.get_cached_series(stock_code, self.chart_days, params, prices)
+                if series:
+                    rows[index] = self._fill_indicator_defaults(
+                        indicator_service.latest_values(series), prices[-1])
+                    continue
+            groups.setdefault(len(prices), []).append(index)
+        
+        for indexes in groups.values():
+            try:
+                matrix = np.array([price_lists[index] for index in indexes], dtype=float)
+                columns = indicator_service.compute_columns(matrix, params)
+            except Exception as e:
+                print(f"⚠️ 向量化指標計算失敗，改為逐支計算: {e}")
+                for index in indexes:
+                    rows[index] = self.calculate_technical_indicators(price_lists[index])
+                continue
+            for row, index in enumerate(indexes):
+                if series_keys:
+                    stock_code, times = series_keys[index]
+                    series = indicator_service.pack_series(
+                        stock_code, self.chart_days, params, times, price_lists[index], columns, row)
+                    indicator_service.save_series(series)
+                    values = indicator_service.latest_values(series)
+                else:
+                    values = {name: None if np.isnan(column[row, -1]) else float(column[row, -1])
+                              for name, column in columns.items()}
+                rows[index] = self._fill_indicator_defaults(values, price_lists[index][-1])
+        return rows
+    
+    def _fill_indicator_defaults(self, values, current_price):
+        """四捨五入指標值；資料不足（None）的指標使用與 calculate_technical_indicators 相同的預設值"""
+        defaults = {'rsi': 50, 'macd': 0, 'signal': 0, 'histogram': 0}
+        indicators = {}
+        for name, value in values.items():
+            if value is None:
+                indicators[name] = defaults.get(name, current_price)
+            else:
+                indicators[name] = round(value, 3 if name in ('macd', 'signal', 'histogram') else 2)
+        return indicators
+    
     def parse_volume(self, volume_str):
         """解析成交量 - 安全版本"""
         try:
@@ -363,33 +562,12 @@ class StockScreener:
             return 0
     
     def get_cache(self, key):
-        """獲取快取資料"""
-        cache_file = os.path.join(self.cache_dir, f"{key}.json")
-        try:
-            if os.path.exists(cache_file):
-                with open(cache_file, 'r', encoding='utf-8') as f:
-                    cache_data = json.load(f)
-                
-                # 檢查快取是否過期
-                cache_time = datetime.fromisoformat(cache_data['timestamp'])
-                if datetime.now() - cache_time < timedelta(seconds=self.cache_timeout):
-                    return cache_data['data']
-        except Exception as e:
-            print(f"❌ 讀取快取失敗: {e}")
-        return None
+        """獲取快取資料（共用 utils.cache 的分片快取，使用選股器自己的有效時間）"""
+        return cache.get_cache(key, max_age=self.cache_timeout)
     
     def save_cache(self, key, data):
         """儲存快取資料"""
-        cache_file = os.path.join(self.cache_dir, f"{key}.json")
-        try:
-            cache_data = {
-                'timestamp': datetime.now().isoformat(),
-                'data': data
-            }
-            with open(cache_file, 'w', encoding='utf-8') as f:
-                json.dump(cache_data, f, ensure_ascii=False, indent=2)
-        except Exception as e:
-            print(f"❌ 儲存快取失敗: {e}")
+        cache.save_cache(key, data, ttl=self.cache_timeout)
     
     def generate_signals(self, analysis):
         """基於技術指標產生投資信號"""
@@ -499,8 +677,35 @@ class StockScreener:
         
         return max(0, min(100, score))
     
+    def screened_codes(self, stock_codes):
+        """
+        實際篩選的股票代號：超過 live_universe_limit 支時以價格歷史批次篩選全部股票，
+        沒有價格歷史時只即時篩選前 live_universe_limit 支
+        :return: (stock_codes, history)；history 為 None 表示逐檔即時篩選
+        """
+        if len(stock_codes) > self.live_universe_limit:
+            history = price_history.load_price_history() if price_history else None
+            if history is not None and history.dates:
+                return stock_codes, history
+            return stock_codes[:self.live_universe_limit], None
+        return stock_codes, None
+    
     def screen_stocks(self, criteria=None):
         """執行股票篩選 - 優化版"""
+        results = []
+        for event in self.iter_screen(criteria):
+            if event['type'] == 'done':
+                results = event['results']
+        return results
+    
+    def iter_screen(self, criteria=None, cancel_event=None):
+        """
+        逐步執行股票篩選，依序產生事件 dict：
+        start（total）、result（data 為符合條件的分析）、
+        progress（processed / errors / found）、done（results 為排序後結果）
+        :param cancel_event: threading.Event，設定後停止篩選並取消尚未開始的抓取；
+                             產生器被關閉（例如用戶端斷線）時亦同
+        """
         if criteria is None:
             criteria = {
                 'min_rsi': 0,    # 放寬條件
@@ -512,51 +717,189 @@ class StockScreener:
         
         # 確保條件合理
         criteria = self.validate_criteria(criteria)
+        stop_event = cancel_event or threading.Event()
+        
+        # 選股範圍：未指定時為預設股票池
+        resolved = universe.resolve_universe(
+            criteria.get('universe'), self.stock_pool, criteria.get('watchlist'))
+        stock_codes, history = self.screened_codes(resolved)
+        if history is not None:
+            yield {'type': 'start', 'total': len(stock_codes)}
+            results = self.screen_history(stock_codes, criteria, history)
+            for analysis in results:
+                yield {'type': 'result', 'data': analysis}
+            yield {'type': 'done', 'results': results, 'processed': len(stock_codes),
+                   'found': len(results), 'cancelled': False}
+            return
+        if len(stock_codes) < len(resolved):
+            print(f"⚠️ 沒有價格歷史資料，僅即時篩選前 {self.live_universe_limit} 支股票")
         
         results = []
         processed = 0
         errors = 0
         
-        print(f"🔍 開始篩選 {len(self.stock_pool)} 支股票...")
+        print(f"🔍 開始篩選 {len(stock_codes)} 支股票...")
         print(f"📋 篩選條件: RSI({criteria['min_rsi']}-{criteria['max_rsi']}), 最低評分({criteria['min_score']})")
+        yield {'type': 'start', 'total': len(stock_codes)}
         
         # 隨機打亂股票順序，避免總是從同樣的股票開始
-        import random
-        shuffled_stocks = self.stock_pool.copy()
+        shuffled_stocks = list(stock_codes)
         random.shuffle(shuffled_stocks)
         
-        for stock_code in shuffled_stocks:
-            try:
-                # 添加處理進度
-                if processed % 3 == 0:
-                    print(f"📊 已處理 {processed}/{len(self.stock_pool)} 支股票，找到 {len(results)} 支符合條件")
-                
-                analysis = self.analyze_stock(stock_code)
+        # 抓取（I/O）在執行緒池並行，指標於本執行緒依完成順序分批向量化計算
+        def fetch(stock_code):
+            if stop_event.is_set():
+                return None
+            return self.fetch_inputs(stock_code)
+        
+        executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        try:
+            futures = {executor.submit(fetch, code): code for code in shuffled_stocks}
+            ready = []
+            last_flush = time.monotonic()
+            for future in as_completed(futures):
+                if stop_event.is_set():
+                    break
+                stock_code = futures[future]
                 processed += 1
-                
-                if analysis:
-                    # 先檢查基本有效性
-                    if self.is_valid_analysis(analysis):
-                        # 再檢查是否符合篩選條件
-                        if self.meets_criteria(analysis, criteria):
-                            results.append(analysis)
-                            print(f"✅ 找到符合條件股票: {stock_code} ({analysis['stock_name']}) - 評分: {analysis['score']}")
-                            
-                            # 如果已經找到足夠的結果，可以提前結束
-                            if len(results) >= 20:
-                                print(f"🎯 已找到 {len(results)} 支股票，提前結束篩選")
-                                break
+                try:
+                    inputs = future.result()
+                except Exception as e:
+                    print(f"❌ 處理 {stock_code} 時發生錯誤: {e}")
+                    inputs = None
+                if inputs:
+                    ready.append((stock_code,) + inputs)
                 else:
                     errors += 1
                 
-                # 減少延遲
-                time.sleep(0.2)
+                # 添加處理進度
+                if processed % 5 == 0:
+                    print(f"📊 已處理 {processed}/{len(stock_codes)} 支股票，找到 {len(results)} 支符合條件")
                 
-            except Exception as e:
-                print(f"❌ 處理 {stock_code} 時發生錯誤: {e}")
-                errors += 1
+                # 累積一批（或等待超過 compute_batch_interval 秒）再一次計算指標；最後一批不足也要處理
+                if (len(ready) < self.compute_batch_size and processed < len(futures)
+                        and time.monotonic() - last_flush < self.compute_batch_interval):
+                    continue
+                try:
+                    analyses = self.build_analyses(ready)
+                except Exception as e:
+                    print(f"❌ 批次分析時發生錯誤: {e}")
+                    analyses = {}
+                errors += len(ready) - len(analyses)
+                ready = []
+                last_flush = time.monotonic()
+                
+                for stock_code, analysis in analyses.items():
+                    # 先檢查基本有效性，再檢查是否符合篩選條件
+                    if self.is_valid_analysis(analysis) and self.meets_criteria(analysis, criteria):
+                        results.append(analysis)
+                        print(f"✅ 找到符合條件股票: {stock_code} ({analysis['stock_name']}) - 評分: {analysis['score']}")
+                        yield {'type': 'result', 'data': analysis}
+                        
+                        # 如果已經找到足夠的結果，可以提前結束
+                        if len(results) >= self.max_results:
+                            print(f"🎯 已找到 {len(results)} 支股票，提前結束篩選")
+                            stop_event.set()
+                            break
+                yield {'type': 'progress', 'processed': processed, 'total': len(stock_codes),
+                       'errors': errors, 'found': len(results)}
+                if stop_event.is_set():
+                    break
+        finally:
+            # 取消尚未開始的抓取；執行中的請求完成後自然結束，不阻塞回應
+            stop_event.set()
+            executor.shutdown(wait=False, cancel_futures=True)
+        
+        cancelled = cancel_event is not None and len(results) < self.max_results and processed < len(stock_codes)
+        if cancelled:
+            print(f"🛑 篩選已取消（已處理 {processed}/{len(stock_codes)} 支）")
+        results = self._summarize(results, processed, errors)
+        yield {'type': 'done', 'results': results, 'processed': processed, 'errors': errors,
+               'found': len(results), 'cancelled': cancelled}
+    
+    def screen_history(self, stock_codes, criteria, history):
+        """
+        以價格歷史庫批次篩選（全市場範圍），不發出逐檔 HTTP 請求；
+        所有股票的指標以向量化引擎一次計算，回傳評分最高的 max_results 支
+        """
+        print(f"📚 以價格歷史庫（{history.dates[-1]}，{len(history.dates)} 個交易日）篩選 {len(stock_codes)} 支股票")
+        analyses = self.analyze_history(stock_codes, history)
+        return self.select_top(analyses, criteria, len(stock_codes), len(stock_codes) - len(analyses))
+    
+    def select_top(self, analyses, criteria, processed=None, errors=0):
+        """
+        以欄位式分析表一次計算所有股票的條件遮罩，再以 top-k 選出評分最高的 max_results 支
+        （不逐筆檢查、不完整排序）
+        """
+        columns = criteria_expr.columns_from_analyses(analyses)
+        mask = self.criteria_mask(columns, criteria)
+        indexes = criteria_expr.top_k(columns['score'], mask, self.max_results)
+        results = [analyses[index] for index in indexes]
+        expression = self._compiled_expression(criteria)
+        if expression is not None:
+            custom = expression.custom_values(columns)
+            for index, analysis in zip(indexes, results):
+                analysis['custom_indicators'] = {
+                    name: None if np.isnan(values[index]) else round(float(values[index]), 4)
+                    for name, values in custom.items()}
+        print(f"🧮 條件遮罩: {int(mask.sum())}/{len(analyses)} 支符合")
+        return self._summarize(results, len(analyses) if processed is None else processed, errors)
+    
+    def criteria_mask(self, columns, criteria):
+        """與 meets_criteria 相同的條件，對欄位式分析表一次計算布林遮罩"""
+        rsi = columns['rsi']
+        score = columns['score']
+        mask = ((rsi >= criteria.get('min_rsi', 0)) & (rsi <= criteria.get('max_rsi', 100))
+                & (score >= criteria.get('min_score', 0)))
+        price_trend = criteria.get('price_trend', 'any')
+        change_5d = np.nan_to_num(columns['price_change_5d'])
+        if price_trend == 'up':
+            mask &= change_5d >= -5
+        elif price_trend == 'down':
+            mask &= change_5d <= 5
+        if criteria.get('volume_filter', False):
+            mask &= np.nan_to_num(columns['volume']) >= 100
+        expression = self._compiled_expression(criteria)
+        if expression is not None:
+            mask &= expression.mask(columns)
+        return mask
+    
+    def _compiled_expression(self, criteria):
+        """條件中的運算式（已快取編譯結果）；沒有運算式時回傳 None"""
+        if not criteria.get('expression'):
+            return None
+        return criteria_expr.compile_expression(criteria['expression'], criteria.get('custom_indicators'))
+    
+    def analyze_history(self, stock_codes, history):
+        """以價格歷史庫一次分析多支股票，回傳有效的分析結果（不套用篩選條件）"""
+        names = universe.listing_names()
+        
+        codes, price_lists, volumes = [], [], []
+        for stock_code in stock_codes:
+            row = history.row_of(stock_code)
+            if row is None:
+                continue
+            prices = history.series(stock_code, self.history_days)
+            if len(prices) < 3:
                 continue
+            volume = history.volume[row, -1]
+            codes.append(stock_code)
+            price_lists.append(prices)
+            volumes.append(0 if np.isnan(volume) else int(volume))
         
+        indicator_rows = self.calculate_indicators_batch(price_lists)
+        
+        analyses = []
+        for stock_code, prices, volume, indicators in zip(codes, price_lists, volumes, indicator_rows):
+            analysis = self._assemble_analysis(
+                stock_code, names.get(stock_code, stock_code), prices, volume, indicators)
+            analysis['data_date'] = history.dates[-1]
+            if self.is_valid_analysis(analysis):
+                analyses.append(analysis)
+        return analyses
+    
+    def _summarize(self, results, processed, errors):
+        """依評分排序並輸出篩選摘要"""
         # 依照評分排序
         if results:
             results.sort(key=lambda x: x.get('score', 0), reverse=True)
@@ -594,6 +937,12 @@ class StockScreener:
         if criteria.get('price_trend') not in ['up', 'down', 'any']:
             validated['price_trend'] = 'any'
         
+        # 條件運算式：解析一次確認語法與欄位，不合法時拋出 ValueError
+        if criteria.get('expression') or criteria.get('custom_indicators'):
+            if criteria_expr is None:
+                raise ValueError('條件運算式需要安裝 NumPy')
+            criteria_expr.compile_expression(criteria.get('expression'), criteria.get('custom_indicators'))
+        
         return validated
     
     def is_valid_analysis(self, analysis):
@@ -658,6 +1007,11 @@ class StockScreener:
                 if volume < 100:  # 降低最低成交量要求
                     return False
             
+            # 條件運算式
+            expression = self._compiled_expression(criteria)
+            if expression is not None and not expression.matches(analysis):
+                return False
+            
             return True
             
         except Exception as e:
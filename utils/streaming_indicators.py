@@ -0,0 +1,332 @@
+"""
+增量技術指標
+每根新 K 棒（update）或盤中同一根 K 棒的新成交價（revise）皆以常數時間更新，
+不需重新處理整段歷史；狀態可序列化存入快取（to_dict / from_dict）。
+
+計算方式與 utils/indicators.py 的向量化引擎一致：
+EMA 以第一筆價格為初始值、RSI 為 Wilder 平滑、布林通道為母體標準差；
+均線與布林通道未累積滿窗格時為 None（向量化引擎為 NaN）。
+"""
+
+from collections import deque
+
+
+class EMA:
+    """指數移動平均"""
+
+    def __init__(self, span: int):
+        self.span = span
+        self.alpha = 2 / (span + 1)
+        self.value = None
+        self._previous = None  # 最後一根 K 棒之前的值，供 revise 使用
+        self._count = 0
+
+    def _apply(self, price: float, previous) -> float:
+        return price if previous is None else self.alpha * price + (1 - self.alpha) * previous
+
+    def update(self, price: float) -> float:
+        """新增一根 K 棒"""
+        self._previous = self.value
+        self.value = self._apply(price, self._previous)
+        self._count += 1
+        return self.value
+
+    def revise(self, price: float) -> float:
+        """以新價格修正最後一根 K 棒"""
+        if self._count == 0:
+            return self.update(price)
+        self.value = self._apply(price, self._previous)
+        return self.value
+
+    def to_dict(self) -> dict:
+        return {'span': self.span, 'value': self.value,
+                'previous': self._previous, 'count': self._count}
+
+    @classmethod
+    def from_dict(cls, state: dict) -> 'EMA':
+        indicator = cls(state['span'])
+        indicator.value = state['value']
+        indicator._previous = state['previous']
+        indicator._count = state['count']
+        return indicator
+
+
+class WilderRSI:
+    """Wilder RSI：前 period 筆漲跌幅平均為初始值，之後以 Wilder 平滑遞推"""
+
+    _FIELDS = ('last_price', 'count', 'avg_gain', 'avg_loss')
+
+    def __init__(self, period: int = 14):
+        self.period = period
+        self.last_price = None
+        self.count = 0  # 已累計的漲跌幅筆數
+        self.avg_gain = 0.0
+        self.avg_loss = 0.0
+        self._previous = None
+
+    def _apply(self, price: float) -> None:
+        if self.last_price is not None:
+            delta = price - self.last_price
+            gain = max(delta, 0.0)
+            loss = max(-delta, 0.0)
+            self.count += 1
+            if self.count <= self.period:
+                # 初始期間：累加後取平均
+                self.avg_gain += (gain - self.avg_gain) / self.count
+                self.avg_loss += (loss - self.avg_loss) / self.count
+            else:
+                self.avg_gain = (self.avg_gain * (self.period - 1) + gain) / self.period
+                self.avg_loss = (self.avg_loss * (self.period - 1) + loss) / self.period
+        self.last_price = price
+
+    def update(self, price: float):
+        """新增一根 K 棒"""
+        self._previous = {field: getattr(self, field) for field in self._FIELDS}
+        self._apply(price)
+        return self.value
+
+    def revise(self, price: float):
+        """以新價格修正最後一根 K 棒"""
+        if self._previous is None:
+            return self.update(price)
+        for field, value in self._previous.items():
+            setattr(self, field, value)
+        self._apply(price)
+        return self.value
+
+    @property
+    def value(self):
+        """RSI 值；資料不足 period 筆漲跌幅時為 None"""
+        if self.count < self.period:
+            return None
+        if self.avg_loss == 0:
+            return 100.0
+        return 100 - 100 / (1 + self.avg_gain / self.avg_loss)
+
+    def to_dict(self) -> dict:
+        state = {field: getattr(self, field) for field in self._FIELDS}
+        state.update({'period': self.period, 'previous': self._previous})
+        return state
+
+    @classmethod
+    def from_dict(cls, state: dict) -> 'WilderRSI':
+        indicator = cls(state['period'])
+        for field in cls._FIELDS:
+            setattr(indicator, field, state[field])
+        indicator._previous = state['previous']
+        return indicator
+
+
+class MACD:
+    """MACD：快慢 EMA 差，signal 線為 MACD 線的 EMA"""
+
+    def __init__(self, fast: int = 12, slow: int = 26, signal: int = 9):
+        self.fast = EMA(fast)
+        self.slow = EMA(slow)
+        self.signal = EMA(signal)
+
+    def update(self, price: float) -> tuple:
+        """新增一根 K 棒，回傳 (macd, signal, histogram)"""
+        macd_line = self.fast.update(price) - self.slow.update(price)
+        self.signal.update(macd_line)
+        return self.values
+
+    def revise(self, price: float) -> tuple:
+        """以新價格修正最後一根 K 棒"""
+        macd_line = self.fast.revise(price) - self.slow.revise(price)
+        self.signal.revise(macd_line)
+        return self.values
+
+    @property
+    def values(self) -> tuple:
+        if self.fast.value is None:
+            return None, None, None
+        macd_line = self.fast.value - self.slow.value
+        return macd_line, self.signal.value, macd_line - self.signal.value
+
+    def to_dict(self) -> dict:
+        return {'fast': self.fast.to_dict(), 'slow': self.slow.to_dict(),
+                'signal': self.signal.to_dict()}
+
+    @classmethod
+    def from_dict(cls, state: dict) -> 'MACD':
+        indicator = cls()
+        indicator.fast = EMA.from_dict(state['fast'])
+        indicator.slow = EMA.from_dict(state['slow'])
+        indicator.signal = EMA.from_dict(state['signal'])
+        return indicator
+
+
+class RollingStats:
+    """
+    滾動平均與母體變異數（SMA、布林通道）。
+    以相對於基準價的一次、二次和維護，並每 window 次更新重新精確加總一次，
+    避免浮點誤差累積；攤提後每次更新仍為常數時間。
+    """
+
+    def __init__(self, window: int):
+        self.window = window
+        self.values = deque(maxlen=window)
+        self._offset = None
+        self._total = 0.0
+        self._total_sq = 0.0
+        self._updates = 0
+
+    def _add(self, price: float, sign: int) -> None:
+        centered = price - self._offset
+        self._total += sign * centered
+        self._total_sq += sign * centered * centered
+
+    def _resync(self) -> None:
+        centered = [price - self._offset for price in self.values]
+        self._total = sum(centered)
+        self._total_sq = sum(value * value for value in centered)
+
+    def update(self, price: float) -> float:
+        """新增一根 K 棒"""
+        if self._offset is None:
+            self._offset = price
+        if len(self.values) == self.window:
+            self._add(self.values[0], -1)
+        self.values.append(price)
+        self._add(price, 1)
+        self._updates += 1
+        if self._updates % self.window == 0:
+            self._resync()
+        return self.mean
+
+    def revise(self, price: float) -> float:
+        """以新價格修正最後一根 K 棒"""
+        if not self.values:
+            return self.update(price)
+        self._add(self.values[-1], -1)
+        self.values[-1] = price
+        self._add(price, 1)
+        return self.mean
+
+    @property
+    def ready(self) -> bool:
+        """是否已累積滿 window 筆"""
+        return len(self.values) == self.window
+
+    @property
+    def mean(self):
+        """平均；未滿 window 筆時以現有資料計算"""
+        if not self.values:
+            return None
+        return self._offset + self._total / len(self.values)
+
+    @property
+    def std(self):
+        """母體標準差"""
+        if not self.values:
+            return None
+        count = len(self.values)
+        centered_mean = self._total / count
+        return max(self._total_sq / count - centered_mean * centered_mean, 0.0) ** 0.5
+
+    def to_dict(self) -> dict:
+        return {'window': self.window, 'values': list(self.values), 'offset': self._offset,
+                'updates': self._updates}
+
+    @classmethod
+    def from_dict(cls, state: dict) -> 'RollingStats':
+        indicator = cls(state['window'])
+        indicator.values.extend(state['values'])
+        indicator._offset = state['offset']
+        indicator._updates = state['updates']
+        if indicator.values:
+            indicator._resync()
+        return indicator
+
+
+class StreamingIndicators:
+    """
+    單一股票的整組增量指標（RSI、MACD、均線、布林通道），
+    輸出欄位與 StockScreener 的分析結果相同，可直接交給 generate_signals。
+    """
+
+    MA_WINDOWS = (5, 10, 20, 60)
+
+    def __init__(self, rsi_period: int = 14, macd_fast: int = 12, macd_slow: int = 26,
+                 macd_signal: int = 9, bb_window: int = 20, bb_std: float = 2.0):
+        self.rsi = WilderRSI(rsi_period)
+        self.macd = MACD(macd_fast, macd_slow, macd_signal)
+        self.averages = {window: RollingStats(window) for window in self.MA_WINDOWS}
+        self.bb_window = bb_window
+        self.bb_std = bb_std
+        if bb_window not in self.averages:
+            self.averages[bb_window] = RollingStats(bb_window)
+        self.bar_time = None  # 最後一根 K 棒的時間標記
+
+    def update(self, price: float) -> dict:
+        """新增一根 K 棒"""
+        self.rsi.update(price)
+        self.macd.update(price)
+        for stats in self.averages.values():
+            stats.update(price)
+        return self.values()
+
+    def revise(self, price: float) -> dict:
+        """以新價格修正最後一根 K 棒"""
+        self.rsi.revise(price)
+        self.macd.revise(price)
+        for stats in self.averages.values():
+            stats.revise(price)
+        return self.values()
+
+    def on_price(self, price: float, bar_time) -> dict:
+        """
+        盤中報價：bar_time 與最後一根 K 棒相同時修正該棒，否則新增一根
+        :param bar_time: K 棒時間標記（例如日線用 '2024-05-02'）
+        """
+        if self.bar_time is not None and bar_time == self.bar_time:
+            return self.revise(price)
+        self.bar_time = bar_time
+        return self.update(price)
+
+    @property
+    def recent_prices(self) -> list:
+        """最近 max(MA_WINDOWS) 根 K 棒的收盤價（舊到新）"""
+        return list(self.averages[max(self.MA_WINDOWS)].values)
+
+    def values(self) -> dict:
+        """目前各指標值；資料不足的指標（未滿窗格的均線、布林通道）為 None"""
+        macd_line, signal_line, histogram = self.macd.values
+        result = {
+            'rsi': self.rsi.value,
+            'macd': macd_line,
+            'signal': signal_line,
+            'histogram': histogram,
+        }
+        for window in self.MA_WINDOWS:
+            stats = self.averages[window]
+            result[f'ma{window}'] = stats.mean if stats.ready else None
+        bb = self.averages[self.bb_window]
+        if bb.ready:
+            result['bb_middle'] = bb.mean
+            result['bb_upper'] = bb.mean + self.bb_std * bb.std
+            result['bb_lower'] = bb.mean - self.bb_std * bb.std
+        else:
+            result['bb_middle'] = result['bb_upper'] = result['bb_lower'] = None
+        return result
+
+    def to_dict(self) -> dict:
+        return {
+            'rsi': self.rsi.to_dict(),
+            'macd': self.macd.to_dict(),
+            'averages': [stats.to_dict() for stats in self.averages.values()],
+            'bb_window': self.bb_window,
+            'bb_std': self.bb_std,
+            'bar_time': self.bar_time,
+        }
+
+    @classmethod
+    def from_dict(cls, state: dict) -> 'StreamingIndicators':
+        indicator = cls(bb_window=state['bb_window'], bb_std=state['bb_std'])
+        indicator.rsi = WilderRSI.from_dict(state['rsi'])
+        indicator.macd = MACD.from_dict(state['macd'])
+        for stats_state in state['averages']:
+            indicator.averages[stats_state['window']] = RollingStats.from_dict(stats_state)
+        indicator.bar_time = state['bar_time']
+        return indicator
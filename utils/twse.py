@@ -1,13 +1,18 @@
 import re
 import requests
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 
-from utils.cache import get_cache, save_cache
+from utils.cache import (
+    get_cache, save_cache, get_stale_cache,
+    get_negative_cache, save_negative_cache, clear_negative_cache,
+)
 
 # ── HTTP 配置 ────────────────────────────────────────────
 CONFIG = {
     'timeout': 20,
     'retry_times': 3,
+    'realtime_batch_size': 50,  # 證交所即時報價每次請求的股票數
 }
 
 # 請求標頭
@@ -21,6 +26,14 @@ HEADERS = {
 }
 
 
+class SymbolNotFound(Exception):
+    """資料來源明確回應查無此股票代號（不同於逾時、連線失敗等暫時性錯誤）"""
+
+
+# 能明確回應查無代號的資料來源數（證交所即時報價、Yahoo Finance）
+_AUTHORITATIVE_SOURCES = 2
+
+
 def get_stock_from_yahoo(stock_code):
     """從 Yahoo Finance 獲取股票資料（備用方案）"""
     try:
@@ -33,6 +46,8 @@ def get_stock_from_yahoo(stock_code):
         url = f"https://query1.finance.yahoo.com/v8/finance/chart/{yahoo_symbol}"
         
         resp = requests.get(url, timeout=CONFIG['timeout'], headers=HEADERS)
+        if resp.status_code == 404:
+            raise SymbolNotFound(f"Yahoo Finance 查無 {yahoo_symbol}")
         resp.raise_for_status()
         data = resp.json()
         
@@ -116,6 +131,8 @@ def get_stock_from_yahoo(stock_code):
             print(f"✅ Yahoo Finance 成功獲取 {stock_code} 資料")
             return stock_info
             
+    except SymbolNotFound:
+        raise
     except Exception as e:
         print(f"Yahoo Finance 獲取失敗: {e}")
         return None
@@ -223,6 +240,55 @@ def get_stock_from_alternative_api(stock_code):
     return None
 
 
+def _parse_twse_realtime(stock_code, stock_data):
+    """將證交所即時報價的一筆 msgArray 資料轉為基本資訊格式"""
+    # 獲取各項資料
+    current_price = stock_data.get('z', '0')    # 目前價格
+    open_price = stock_data.get('o', '0')       # 開盤價
+    high_price = stock_data.get('h', '0')       # 最高價
+    low_price = stock_data.get('l', '0')        # 最低價
+    volume = stock_data.get('v', '0')           # 成交量
+    name = stock_data.get('n', '')              # 股票名稱
+    prev_close = stock_data.get('y', '0')       # 昨日收盤價
+    
+    stock_info = {
+        '股票代碼': stock_code,
+        '股票名稱': name if name else get_stock_name(stock_code),
+        '即時股價': current_price if current_price != '0' else "N/A",
+        '收盤價': current_price if current_price != '0' else "N/A",  # 即時股價也是收盤價
+        '開盤價': open_price if open_price != '0' else "N/A",
+        '最高價': high_price if high_price != '0' else "N/A",
+        '最低價': low_price if low_price != '0' else "N/A",
+        '成交量': f"{int(volume):,}" if volume and volume != '0' else "N/A",
+    }
+    
+    # 計算漲跌資料
+    try:
+        if prev_close and prev_close != '0' and current_price and current_price != '0':
+            prev_val = float(prev_close)
+            curr_val = float(current_price)
+            
+            # 計算漲跌價差
+            change_val = curr_val - prev_val
+            stock_info['漲跌價差'] = f"{change_val:+.2f}"
+            
+            # 計算漲跌幅
+            if prev_val > 0:
+                change_percent = (change_val / prev_val) * 100
+                stock_info['漲跌幅'] = f"{change_percent:+.2f}%"
+            else:
+                stock_info['漲跌幅'] = "N/A"
+        else:
+            stock_info['漲跌價差'] = "N/A"
+            stock_info['漲跌幅'] = "N/A"
+            
+    except Exception as e:
+        print(f"⚠️ 漲跌計算錯誤: {e}")
+        stock_info['漲跌價差'] = "N/A"
+        stock_info['漲跌幅'] = "N/A"
+    return stock_info
+
+
 def get_stock_from_twse_realtime(stock_code):
     """從證交所即時報價獲取資料"""
     try:
@@ -242,57 +308,18 @@ def get_stock_from_twse_realtime(stock_code):
         if data.get('msgArray') and len(data['msgArray']) > 0:
             stock_data = data['msgArray'][0]
             
-            # 獲取各項資料
-            current_price = stock_data.get('z', '0')    # 目前價格
-            open_price = stock_data.get('o', '0')       # 開盤價
-            high_price = stock_data.get('h', '0')       # 最高價
-            low_price = stock_data.get('l', '0')        # 最低價
-            volume = stock_data.get('v', '0')           # 成交量
-            name = stock_data.get('n', '')              # 股票名稱
-            prev_close = stock_data.get('y', '0')       # 昨日收盤價
-            
-            stock_info = {
-                '股票代碼': stock_code,
-                '股票名稱': name if name else get_stock_name(stock_code),
-                '即時股價': current_price if current_price != '0' else "N/A",
-                '收盤價': current_price if current_price != '0' else "N/A",  # 即時股價也是收盤價
-                '開盤價': open_price if open_price != '0' else "N/A",
-                '最高價': high_price if high_price != '0' else "N/A",
-                '最低價': low_price if low_price != '0' else "N/A",
-                '成交量': f"{int(volume):,}" if volume and volume != '0' else "N/A",
-            }
-            
-            # 計算漲跌資料
-            try:
-                if prev_close and prev_close != '0' and current_price and current_price != '0':
-                    prev_val = float(prev_close)
-                    curr_val = float(current_price)
-                    
-                    # 計算漲跌價差
-                    change_val = curr_val - prev_val
-                    stock_info['漲跌價差'] = f"{change_val:+.2f}"
-                    
-                    # 計算漲跌幅
-                    if prev_val > 0:
-                        change_percent = (change_val / prev_val) * 100
-                        stock_info['漲跌幅'] = f"{change_percent:+.2f}%"
-                    else:
-                        stock_info['漲跌幅'] = "N/A"
-                else:
-                    stock_info['漲跌價差'] = "N/A"
-                    stock_info['漲跌幅'] = "N/A"
-                    
-            except Exception as e:
-                print(f"⚠️ 漲跌計算錯誤: {e}")
-                stock_info['漲跌價差'] = "N/A"
-                stock_info['漲跌幅'] = "N/A"
-            
+            stock_info = _parse_twse_realtime(stock_code, stock_data)
             print(f"✅ 證交所即時報價成功獲取 {stock_code} 資料")
             return stock_info
+        elif data.get('rtcode') == '0000':
+            # 請求成功但沒有此代號的報價
+            raise SymbolNotFound(f"證交所即時報價查無 {stock_code}")
         else:
             print(f"❌ 證交所即時報價無資料: {stock_code}")
             return None
             
+    except SymbolNotFound:
+        raise
     except Exception as e:
         print(f"證交所即時報價獲取失敗: {e}")
         return None
@@ -377,6 +404,12 @@ def get_stock_basic_info(stock_code):
         print(f"🔄 使用快取資料: {clean_code}")
         return cached_data
     
+    # 檢查負向快取（近期已確認查無資料的代號，避免重複打所有資料來源）
+    negative_data = get_negative_cache(cache_key)
+    if negative_data:
+        print(f"🚫 使用負向快取: {clean_code}")
+        return negative_data
+    
     print(f"🔍 開始獲取股票 {clean_code} 的即時資料...")
     
     # 多重資料來源策略 - 優先使用證交所
@@ -387,42 +420,151 @@ def get_stock_basic_info(stock_code):
         ("替代 API", lambda: get_stock_from_alternative_api(clean_code)),
     ]
     
+    not_found = 0  # 明確回應查無代號的資料來源數
     for source_name, get_data_func in data_sources:
         try:
             print(f"📡 嘗試 {source_name}...")
             stock_data = get_data_func()
             
             if stock_data and not stock_data.get('錯誤'):
-                # 檢查是否有有效的股價資料
-                realtime_price = stock_data.get('即時股價', 'N/A')
-                close_price = stock_data.get('收盤價', 'N/A')
-                
                 # 如果股價資料有效（不是 "-", "N/A", "0" 或空值）
-                if (realtime_price not in ['-', 'N/A', '0', '', None] or 
-                    close_price not in ['-', 'N/A', '0', '', None]):
+                if _has_valid_price(stock_data):
                     # 儲存快取
                     save_cache(cache_key, stock_data)
+                    clear_negative_cache(cache_key)
                     print(f"✅ 成功從 {source_name} 獲取資料並快取")
                     return stock_data
                 else:
-                    print(f"⚠️ {source_name} 回傳資料但股價無效: 即時股價={realtime_price}, 收盤價={close_price}")
+                    print(f"⚠️ {source_name} 回傳資料但股價無效: "
+                          f"即時股價={stock_data.get('即時股價')}, 收盤價={stock_data.get('收盤價')}")
             else:
                 print(f"❌ {source_name} 資料不完整或有錯誤")
                 
+        except SymbolNotFound as e:
+            not_found += 1
+            print(f"🚫 {e}")
+            continue
         except Exception as e:
             print(f"❌ {source_name} 發生異常: {e}")
             continue
     
-    # 所有資料來源都失敗
+    # 所有資料來源都失敗：先嘗試 stale 期間內的舊資料
+    stale_data = get_stale_cache(cache_key)
+    if stale_data:
+        print(f"⚠️ 所有資料來源都失敗，使用過期快取: {clean_code}")
+        return stale_data
+    
     error_result = {
         '股票代碼': clean_code,
         '股票名稱': get_stock_name(clean_code),
         '錯誤': f'無法從任何資料來源獲取股票 {clean_code} 的資料'
     }
-    print(f"❌ 所有資料來源都失敗: {clean_code}")
+    if not not_found:
+        # 只有逾時、連線或上游錯誤等暫時性失敗，不記錄為查無資料
+        print(f"❌ 所有資料來源都失敗: {clean_code}（暫時性錯誤，不寫入負向快取）")
+        return error_result
+    # 只有部分來源確認查無代號時（其餘為暫時性失敗），不延長有效時間
+    ttl = save_negative_cache(cache_key, error_result, extend=not_found >= _AUTHORITATIVE_SOURCES)
+    print(f"❌ 所有資料來源都失敗: {clean_code}（負向快取 {ttl} 秒）")
     return error_result
 
 
+def _has_valid_price(stock_data):
+    """即時股價或收盤價是否有效（不是 "-", "N/A", "0" 或空值）"""
+    invalid = ['-', 'N/A', '0', '', None]
+    return stock_data.get('即時股價', 'N/A') not in invalid or stock_data.get('收盤價', 'N/A') not in invalid
+
+
+def get_stocks_from_twse_realtime(stock_codes):
+    """
+    從證交所即時報價批次獲取多檔資料（每次請求 CONFIG['realtime_batch_size'] 檔）
+    :return: {代號: 基本資訊}，查無資料的代號不在結果中
+    """
+    results = {}
+    batch_size = CONFIG['realtime_batch_size']
+    headers = {
+        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
+        'Referer': 'https://mis.twse.com.tw/',
+        'Accept': 'application/json'
+    }
+    for start in range(0, len(stock_codes), batch_size):
+        batch = stock_codes[start:start + batch_size]
+        ex_ch = '|'.join(f"tse_{code}.tw" for code in batch)
+        url = f"https://mis.twse.com.tw/stock/api/getStockInfo.jsp?ex_ch={ex_ch}"
+        try:
+            resp = requests.get(url, timeout=CONFIG['timeout'], headers=headers)
+            resp.raise_for_status()
+            for stock_data in resp.json().get('msgArray') or []:
+                code = stock_data.get('c')
+                if code not in batch:
+                    continue
+                try:
+                    results[code] = _parse_twse_realtime(code, stock_data)
+                except (TypeError, ValueError) as e:
+                    # 單筆格式異常（例如成交量為 "-"）時留給逐檔查詢
+                    print(f"⚠️ 證交所即時報價資料格式異常 {code}: {e}")
+        except Exception as e:
+            print(f"證交所即時報價批次獲取失敗（{len(batch)} 檔）: {e}")
+    return results
+
+
+def get_stocks_basic_info(stock_codes, max_workers=8):
+    """
+    批次獲取多檔個股基本資訊
+    先一次檢查所有代號的快取與負向快取；未命中的代號以證交所即時報價批次查詢，
+    仍查無有效股價的再並行走 get_stock_basic_info 的多重資料來源
+    :return: ({代號: 基本資訊}, {代號: 錯誤訊息})，皆依輸入順序
+    """
+    codes = list(dict.fromkeys(code for code in (_clean_code(str(c)) for c in stock_codes) if code))
+    quotes, errors, missing = {}, {}, []
+    for code in codes:
+        cache_key = f"stock_basic_{code}"
+        cached_data = get_cache(cache_key)
+        if cached_data:
+            quotes[code] = cached_data
+            continue
+        negative_data = get_negative_cache(cache_key)
+        if negative_data:
+            errors[code] = negative_data.get('錯誤', f'查無股票 {code} 的資料')
+            continue
+        missing.append(code)
+
+    if missing:
+        for code, stock_data in get_stocks_from_twse_realtime(missing).items():
+            if _has_valid_price(stock_data):
+                save_cache(f"stock_basic_{code}", stock_data)
+                clear_negative_cache(f"stock_basic_{code}")
+                quotes[code] = stock_data
+        remaining = [code for code in missing if code not in quotes]
+        if remaining:
+            with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(remaining)))) as executor:
+                for code, info in zip(remaining, executor.map(get_stock_basic_info, remaining)):
+                    if info and not info.get('錯誤'):
+                        quotes[code] = info
+                    else:
+                        errors[code] = (info or {}).get('錯誤', f'無法從任何資料來源獲取股票 {code} 的資料')
+        print(f"📦 批次報價：{len(codes)} 檔，快取命中 {len(codes) - len(missing)} 檔，"
+              f"批次取得 {len(missing) - len(remaining)} 檔，逐檔查詢 {len(remaining)} 檔")
+
+    return ({code: quotes[code] for code in codes if code in quotes},
+            {code: errors[code] for code in codes if code in errors})
+
+
+def _clean_code(stock_code):
+    """移除空白與非文字字元，作為快取 key 使用"""
+    return re.sub(r'[^\w]', '', stock_code.strip())
+
+
+def _get_negative_stock_info(stock_code):
+    """取得股票代號的負向快取內容（近期確認查無資料時回傳錯誤 dict）"""
+    return get_negative_cache(f"stock_basic_{_clean_code(stock_code)}")
+
+
+def is_unknown_symbol(stock_code):
+    """股票代號是否在負向快取中（近期確認查無資料）"""
+    return _get_negative_stock_info(stock_code) is not None
+
+
 def get_stock_name_from_api(stock_code):
     """從 API 動態獲取股票名稱"""
     try:
@@ -488,9 +630,21 @@ def get_stock_name_from_api(stock_code):
 
 def get_stock_name(stock_code):
     """取得股票名稱 - 先嘗試 API，失敗則使用預設名稱"""
+    # 負向快取中的代號不再查詢 API
+    negative_data = _get_negative_stock_info(stock_code)
+    if negative_data:
+        return negative_data.get('股票名稱', stock_code)
+    
+    # 股票名稱幾乎不變（stock_name 命名空間快取一天）
+    cache_key = f"stock_name_{_clean_code(stock_code)}"
+    cached_name = get_cache(cache_key)
+    if cached_name:
+        return cached_name
+    
     # 先嘗試從 API 動態獲取
     api_name = get_stock_name_from_api(stock_code)
     if api_name:
+        save_cache(cache_key, api_name)
         return api_name
     
     # 備用：常見股票的預設名稱（只保留最常見的）
@@ -546,7 +700,12 @@ def get_market_summary():
             print(f"❌ {source_name} 獲取失敗: {e}")
             continue
     
-    # 所有資料來源都失敗，回傳模擬資料
+    # 所有資料來源都失敗：先嘗試 stale 期間內的舊資料，再回傳模擬資料
+    stale_data = get_stale_cache(cache_key)
+    if stale_data:
+        print("⚠️ 所有大盤資料來源都失敗，使用過期快取")
+        return stale_data
+    
     print("⚠️ 所有大盤資料來源都失敗，使用模擬資料")
     return {
         '指數': '18,500.00',
@@ -695,6 +854,11 @@ if __name__ == '__main__':
 
 def get_stock_chart_data(stock_code, days=7):
     """獲取股票圖表資料（最近N天）"""
+    cache_key = f"chart_{_clean_code(stock_code)}_{days}"
+    cached_data = get_cache(cache_key)
+    if cached_data:
+        return cached_data
+    
     try:
         # 台股在 Yahoo Finance 的格式
         if not stock_code.endswith('.TW'):
@@ -721,11 +885,17 @@ def get_stock_chart_data(stock_code, days=7):
                 'range': '1mo',     # 使用1個月範圍，但會在後面過濾到14天
                 'interval': '1d',   # 1天間隔是最安全的選擇
             }
-        else:
+        elif days <= 30:
             params = {
                 'range': '1mo',
                 'interval': '1d',   # 1天間隔
             }
+        else:
+            # 技術指標需要較長的日線歷史（例如 MA60）
+            params = {
+                'range': '3mo' if days <= 90 else '6mo' if days <= 180 else '1y',
+                'interval': '1d',
+            }
         
         resp = requests.get(url, params=params, timeout=CONFIG['timeout'], headers=HEADERS)
         resp.raise_for_status()
@@ -778,16 +948,22 @@ def get_stock_chart_data(stock_code, days=7):
             if 'datetime' in item:
                 del item['datetime']
         
-        return {
+        chart_result = {
             'success': True,
             'data': chart_data,
             'stock_code': stock_code,
             'symbol': yahoo_symbol,
             'period': f"{days}天"
         }
+        save_cache(cache_key, chart_result)
+        return chart_result
         
     except Exception as e:
         print(f"圖表資料獲取錯誤: {e}")
+        stale_data = get_stale_cache(cache_key)
+        if stale_data:
+            print(f"⚠️ 使用過期圖表快取: {stock_code}")
+            return stale_data
         return {
             'success': False,
             'error': str(e),
@@ -0,0 +1,167 @@
+"""
+選股範圍（股票清單主檔）
+將證券編碼公告（isin.twse.com.tw）整理為 data/listings.csv（代號、名稱、市場、類別、產業），
+StockScreener 依範圍設定取得股票代號：上市、上櫃、ETF、產業或自選股。
+"""
+
+import os
+import csv
+import threading
+
+import requests
+from bs4 import BeautifulSoup
+
+from utils.twse import HEADERS, CONFIG
+
+LISTING_FILE = os.environ.get('LISTING_FILE', os.path.join('data', 'listings.csv'))
+LISTING_FIELDS = ('code', 'name', 'market', 'type', 'industry')
+
+# 證券編碼公告：strMode=2 上市、strMode=4 上櫃
+ISIN_SOURCES = {
+    'tse': 'https://isin.twse.com.tw/isin/C_public.jsp?strMode=2',
+    'otc': 'https://isin.twse.com.tw/isin/C_public.jsp?strMode=4',
+}
+
+# 公告中的分類標題 → 類別；權證、特別股、債券等其他分類不列入選股範圍
+_SECTION_TYPES = {
+    '股票': 'stock',
+    '創新板': 'stock',
+    'ETF': 'etf',
+}
+
+# 範圍設定可用的代號（另有 industry:<產業別>）
+UNIVERSE_TOKENS = ('default', 'all', 'tse', 'otc', 'etf', 'watchlist')
+
+_lock = threading.Lock()
+_listings: list = []
+_listings_mtime = None
+
+
+def parse_isin_page(html: str, market: str) -> list:
+    """解析證券編碼公告頁面，回傳清單列"""
+    soup = BeautifulSoup(html, 'lxml')
+    rows = []
+    section = None
+    for tr in soup.find_all('tr'):
+        cells = [td.get_text(strip=True) for td in tr.find_all('td')]
+        if len(cells) == 1:
+            section = _SECTION_TYPES.get(cells[0])
+            continue
+        if section is None or len(cells) < 5:
+            continue
+        # 第一欄為「代號　名稱」，以全形空白分隔
+        parts = cells[0].replace('　', ' ').split(None, 1)
+        if len(parts) != 2:
+            continue
+        rows.append({
+            'code': parts[0],
+            'name': parts[1].strip(),
+            'market': market,
+            'type': section,
+            'industry': cells[4] or ('ETF' if section == 'etf' else ''),
+        })
+    return rows
+
+
+def refresh_listings(path: str | None = None) -> int:
+    """下載證券編碼公告並覆寫清單檔，回傳筆數"""
+    path = path or LISTING_FILE
+    rows = []
+    for market, url in ISIN_SOURCES.items():
+        resp = requests.get(url, headers=HEADERS, timeout=CONFIG['timeout'])
+        resp.raise_for_status()
+        resp.encoding = 'cp950'
+        market_rows = parse_isin_page(resp.text, market)
+        print(f"📋 {market.upper()} 清單: {len(market_rows)} 筆")
+        rows.extend(market_rows)
+    if not rows:
+        raise ValueError('證券編碼公告沒有可用的資料')
+
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_file = f"{path}.tmp"
+    with open(tmp_file, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=LISTING_FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+    os.replace(tmp_file, path)
+    return len(rows)
+
+
+def load_listings(path: str | None = None) -> list:
+    """讀取清單檔（檔案變動時才重新讀取）；檔案不存在時回傳空清單"""
+    global _listings, _listings_mtime
+    path = path or LISTING_FILE
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return []
+    with _lock:
+        if _listings_mtime != (path, mtime):
+            with open(path, 'r', encoding='utf-8', newline='') as f:
+                _listings = [row for row in csv.DictReader(f) if row.get('code')]
+            _listings_mtime = (path, mtime)
+        return _listings
+
+
+def listing_names() -> dict:
+    """代號 → 名稱"""
+    return {row['code']: row['name'] for row in load_listings()}
+
+
+def available_universes() -> dict:
+    """可用的範圍設定與各產業股票數"""
+    listings = load_listings()
+    industries = {}
+    for row in listings:
+        if row['type'] == 'stock' and row['industry']:
+            industries[row['industry']] = industries.get(row['industry'], 0) + 1
+    return {
+        'tokens': list(UNIVERSE_TOKENS),
+        'listing_available': bool(listings),
+        'total': len(listings),
+        'industries': dict(sorted(industries.items())),
+    }
+
+
+def resolve_universe(spec, default: list, watchlist: list | None = None) -> list:
+    """
+    依範圍設定取得股票代號（保持順序、去除重複）。
+
+    :param spec: 逗號分隔字串或清單，例如 'tse,etf'、'industry:半導體業'、'watchlist'；
+                 未指定時為 default
+    :param default: 預設股票池；清單檔不存在時以此代替需要清單檔的範圍
+    :param watchlist: 使用者自選股代號
+    :raises ValueError: 範圍設定不合法
+    """
+    if not spec:
+        return list(default)
+    tokens = spec.split(',') if isinstance(spec, str) else list(spec)
+    listings = load_listings()
+
+    codes = []
+    for token in (str(token).strip() for token in tokens):
+        if not token:
+            continue
+        if token == 'default':
+            codes.extend(default)
+        elif token == 'watchlist':
+            codes.extend(watchlist or [])
+        elif token in ('all', 'tse', 'otc', 'etf') or token.startswith('industry:'):
+            if not listings:
+                print(f"⚠️ 找不到股票清單檔 {LISTING_FILE}，範圍 {token} 改用預設股票池")
+                codes.extend(default)
+            else:
+                codes.extend(row['code'] for row in listings if _matches(row, token))
+        else:
+            raise ValueError(f'未知的選股範圍: {token}')
+    return list(dict.fromkeys(codes))
+
+
+def _matches(row: dict, token: str) -> bool:
+    if token == 'all':
+        return True
+    if token == 'etf':
+        return row['type'] == 'etf'
+    if token.startswith('industry:'):
+        return row['type'] == 'stock' and row['industry'] == token.split(':', 1)[1]
+    return row['type'] == 'stock' and row['market'] == token
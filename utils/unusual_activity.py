@@ -0,0 +1,293 @@
+"""
+異常交易掃描
+以全市場行情快照（fetch_market_snapshot，上市、上櫃各一次請求）為輸入，
+每支股票保留最近 UNUSUAL_WINDOW 個交易日的成交量與真實波幅（環狀緩衝的 float32 矩陣），
+每份快照以一次向量化運算標記：
+  - volume      成交量 z-score ≥ UNUSUAL_VOLUME_Z
+  - gap         開盤跳空幅度 ≥ UNUSUAL_GAP_PCT %
+  - range       當日真實波幅 ≥ 平常波幅的 UNUSUAL_RANGE_RATIO 倍
+  - limit_up / limit_down  收盤價距離漲跌停（±10%）在 UNUSUAL_LIMIT_PROXIMITY % 以內
+基準由價格歷史庫（utils/price_history.py）建立；歷史庫只有收盤價，初始的平常波幅以收盤價
+漲跌幅計算，之後每個交易日以快照的最高、最低價滾動更新。
+最新的掃描結果保存在記憶體中，由背景執行緒每 UNUSUAL_SCAN_INTERVAL 秒更新。
+"""
+
+import os
+import time
+import threading
+from datetime import datetime
+
+import numpy as np
+
+WINDOW = int(os.environ.get('UNUSUAL_WINDOW', 20))  # 基準交易日數
+MIN_SAMPLES = int(os.environ.get('UNUSUAL_MIN_SAMPLES', 5))  # 基準至少需要的交易日數
+VOLUME_Z = float(os.environ.get('UNUSUAL_VOLUME_Z', 3.0))
+GAP_PCT = float(os.environ.get('UNUSUAL_GAP_PCT', 3.0))
+RANGE_RATIO = float(os.environ.get('UNUSUAL_RANGE_RATIO', 3.0))
+LIMIT_PROXIMITY_PCT = float(os.environ.get('UNUSUAL_LIMIT_PROXIMITY', 1.0))
+SCAN_INTERVAL = int(os.environ.get('UNUSUAL_SCAN_INTERVAL', 300))
+LIMIT_PCT = 10.0  # 台股漲跌幅限制
+
+FLAG_TYPES = ('volume', 'gap', 'range', 'limit_up', 'limit_down')
+SNAPSHOT_FIELDS = ('open', 'high', 'low', 'close', 'volume', 'change')
+
+
+def _row_stats(values: np.ndarray) -> tuple:
+    """逐列忽略 NaN 的平均、標準差與樣本數（全為 NaN 的列回傳 NaN，不產生警告）"""
+    valid = ~np.isnan(values)
+    count = valid.sum(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = np.where(valid, values, 0).sum(axis=1) / count
+        variance = np.where(valid, (values - mean[:, None]) ** 2, 0).sum(axis=1) / count
+    return mean, np.sqrt(variance), count
+
+
+class UnusualActivityScanner:
+    """
+    :param window: 基準交易日數
+    其餘參數為各類異常的門檻，預設取自環境變數
+    """
+
+    def __init__(self, window: int = WINDOW, volume_z: float = VOLUME_Z, gap_pct: float = GAP_PCT,
+                 range_ratio: float = RANGE_RATIO, limit_proximity: float = LIMIT_PROXIMITY_PCT,
+                 min_samples: int = MIN_SAMPLES):
+        self.window = window
+        self.volume_z = volume_z
+        self.gap_pct = gap_pct
+        self.range_ratio = range_ratio
+        self.limit_proximity = limit_proximity
+        self.min_samples = min_samples
+        self.codes = []
+        self._index = {}
+        self.volume = np.full((0, window), np.nan, dtype=np.float32)  # 成交量（張）
+        self.range = np.full((0, window), np.nan, dtype=np.float32)  # 真實波幅（%）
+        self.prev_close = np.full(0, np.nan)
+        self.date = None  # 基準最後一個交易日
+        self.latest = None
+        self._pos = 0  # 環狀緩衝下一個寫入的欄位
+        self._lock = threading.Lock()
+
+    def _rows_of(self, codes: list) -> np.ndarray:
+        """股票代號對應的列，未見過的股票新增空白列"""
+        new_codes = [code for code in dict.fromkeys(codes) if code not in self._index]
+        if new_codes:
+            for code in new_codes:
+                self._index[code] = len(self.codes)
+                self.codes.append(code)
+            padding = np.full((len(new_codes), self.window), np.nan, dtype=np.float32)
+            self.volume = np.vstack([self.volume, padding])
+            self.range = np.vstack([self.range, padding])
+            self.prev_close = np.concatenate([self.prev_close, np.full(len(new_codes), np.nan)])
+        return np.fromiter((self._index[code] for code in codes), dtype=np.intp, count=len(codes))
+
+    def seed_from_history(self, history, before: str | None = None) -> None:
+        """
+        以價格歷史庫建立基準（取代現有基準）
+        :param before: 只使用此日期（YYYYMMDD）之前的交易日，避免基準包含要掃描的當日
+        """
+        columns = [column for column, date in enumerate(history.dates) if before is None or date < before]
+        columns = columns[-(self.window + 1):]
+        with self._lock:
+            self.codes, self._index = [], {}
+            self.volume = np.full((0, self.window), np.nan, dtype=np.float32)
+            self.range = np.full((0, self.window), np.nan, dtype=np.float32)
+            self.prev_close = np.full(0, np.nan)
+            self._pos, self.date, self.latest = 0, None, None
+            rows = self._rows_of(history.codes)
+            if not columns:
+                return
+            close = np.asarray(history.close, dtype=float)[:, columns]
+            volume = np.asarray(history.volume, dtype=float)[:, columns]
+            with np.errstate(divide='ignore', invalid='ignore'):
+                moves = np.abs(close[:, 1:] / close[:, :-1] - 1) * 100
+            # 舊的在左、新的在右，不足 window 天時左側補 NaN；下一個寫入位置即最舊的一欄
+            self.volume[rows, self.window - min(self.window, volume.shape[1]):] = volume[:, -self.window:]
+            if moves.shape[1]:
+                self.range[rows, self.window - moves.shape[1]:] = moves
+            # 前一日收盤價：每列最後一個有效的收盤價（停牌時沿用前一次成交）
+            positions = np.where(~np.isnan(close), np.arange(close.shape[1]), 0)
+            last = np.maximum.accumulate(positions, axis=1)[:, -1]
+            self.prev_close[rows] = close[np.arange(close.shape[0]), last]
+            self.date = history.dates[columns[-1]]
+        print(f"📐 異常交易基準：{len(self.codes)} 支股票 × {len(columns)} 個交易日（至 {self.date}）")
+
+    def scan(self, snapshot: dict, date: str | None = None, final: bool = True) -> dict:
+        """
+        掃描一份全市場快照
+        :param snapshot: {代號: {'open', 'high', 'low', 'close', 'volume'(張), 'change'}}，缺少的欄位視為 NaN
+        :param date: 快照的交易日（YYYYMMDD）
+        :param final: 收盤後的快照；日期晚於基準時，掃描後把當日併入基準（盤中快照不併入）
+        """
+        date = date or datetime.now().strftime('%Y%m%d')
+        codes = list(snapshot)
+        values = np.array([[snapshot[code].get(field, np.nan) for field in SNAPSHOT_FIELDS]
+                           for code in codes], dtype=float).reshape(len(codes), len(SNAPSHOT_FIELDS))
+        open_, high, low, close, volume, change = values.T
+
+        with self._lock:
+            rows = self._rows_of(codes)
+            prev = self.prev_close[rows]
+            # 沒有基準的股票以快照的漲跌推算前一日收盤價
+            prev = np.where(np.isnan(prev), close - change, prev)
+            volume_mean, volume_std, volume_samples = _row_stats(self.volume[rows].astype(float))
+            typical_range, _, range_samples = _row_stats(self.range[rows].astype(float))
+
+            with np.errstate(divide='ignore', invalid='ignore'):
+                prev = np.where(prev > 0, prev, np.nan)
+                change_pct = (close - prev) / prev * 100
+                gap_pct = (open_ - prev) / prev * 100
+                top = np.fmax(np.fmax(high, close), prev)
+                bottom = np.fmin(np.fmin(low, close), prev)
+                range_pct = (top - bottom) / prev * 100
+                z = np.where((volume_samples >= self.min_samples) & (volume_std > 0),
+                             (volume - volume_mean) / volume_std, np.nan)
+                ratio = np.where((range_samples >= self.min_samples) & (typical_range > 0),
+                                 range_pct / typical_range, np.nan)
+                to_limit_up = LIMIT_PCT - change_pct
+                to_limit_down = LIMIT_PCT + change_pct
+
+            flags = {
+                'volume': z >= self.volume_z,
+                'gap': np.abs(gap_pct) >= self.gap_pct,
+                'range': ratio >= self.range_ratio,
+                'limit_up': (change_pct > 0) & (to_limit_up <= self.limit_proximity),
+                'limit_down': (change_pct < 0) & (to_limit_down <= self.limit_proximity),
+            }
+            # 嚴重程度：各類指標相對門檻的倍數取最大值（觸及漲跌停為 2）
+            severity = np.nanmax(np.vstack([
+                np.where(flags['volume'], z / self.volume_z, 0),
+                np.where(flags['gap'], np.abs(gap_pct) / self.gap_pct, 0),
+                np.where(flags['range'], ratio / self.range_ratio, 0),
+                np.where(flags['limit_up'], 2 - np.clip(to_limit_up, 0, None) / self.limit_proximity, 0),
+                np.where(flags['limit_down'], 2 - np.clip(to_limit_down, 0, None) / self.limit_proximity, 0),
+            ]), axis=0)
+            flagged = np.flatnonzero(severity > 0)
+            flagged = flagged[np.argsort(-severity[flagged], kind='stable')]
+
+            results = []
+            for index in flagged:
+                results.append({
+                    'stock_code': codes[index],
+                    'flags': [name for name in FLAG_TYPES if flags[name][index]],
+                    'severity': round(float(severity[index]), 2),
+                    'close': round(float(close[index]), 2),
+                    'prev_close': None if np.isnan(prev[index]) else round(float(prev[index]), 2),
+                    'change_pct': None if np.isnan(change_pct[index]) else round(float(change_pct[index]), 2),
+                    'gap_pct': None if np.isnan(gap_pct[index]) else round(float(gap_pct[index]), 2),
+                    'volume': None if np.isnan(volume[index]) else int(volume[index]),
+                    'avg_volume': None if np.isnan(volume_mean[index]) else round(float(volume_mean[index]), 1),
+                    'volume_z': None if np.isnan(z[index]) else round(float(z[index]), 2),
+                    'range_pct': None if np.isnan(range_pct[index]) else round(float(range_pct[index]), 2),
+                    'range_ratio': None if np.isnan(ratio[index]) else round(float(ratio[index]), 2),
+                })
+
+            if final and (self.date is None or date > self.date):
+                self._roll(rows, volume, range_pct, close)
+                self.date = date
+
+            self.latest = {
+                'date': date,
+                'final': final,
+                'scanned_at': datetime.now().isoformat(),
+                'symbols': len(codes),
+                'thresholds': {'volume_z': self.volume_z, 'gap_pct': self.gap_pct,
+                               'range_ratio': self.range_ratio, 'limit_proximity': self.limit_proximity},
+                'results': results,
+            }
+            return self.latest
+
+    def _roll(self, rows: np.ndarray, volume: np.ndarray, range_pct: np.ndarray, close: np.ndarray) -> None:
+        """將一個收盤交易日寫入環狀緩衝（快照中沒有的股票該日記為 NaN）"""
+        self.volume[:, self._pos] = np.nan
+        self.range[:, self._pos] = np.nan
+        self.volume[rows, self._pos] = volume
+        self.range[rows, self._pos] = range_pct
+        self.prev_close[rows] = np.where(np.isnan(close), self.prev_close[rows], close)
+        self._pos = (self._pos + 1) % self.window
+
+    def results(self, flag_type: str | None = None, limit: int | None = None) -> list:
+        """
+        最新一次掃描的結果（依嚴重程度排序）
+        :param flag_type: 只取某一類異常；limit 為涵蓋 limit_up 與 limit_down 的簡寫
+        :raises ValueError: flag_type 不合法
+        """
+        if flag_type and flag_type not in FLAG_TYPES + ('limit',):
+            raise ValueError(f"type 必須為 {', '.join(FLAG_TYPES + ('limit',))} 之一")
+        results = self.latest['results'] if self.latest else []
+        if flag_type == 'limit':
+            results = [item for item in results if 'limit_up' in item['flags'] or 'limit_down' in item['flags']]
+        elif flag_type:
+            results = [item for item in results if flag_type in item['flags']]
+        return results if limit is None else results[:limit]
+
+
+_scanner = None
+_scanner_lock = threading.Lock()
+_refresh_lock = threading.Lock()
+_scanner_thread = None
+
+
+def get_scanner() -> UnusualActivityScanner:
+    """行程內共用的掃描器"""
+    global _scanner
+    with _scanner_lock:
+        if _scanner is None:
+            _scanner = UnusualActivityScanner()
+        return _scanner
+
+
+def refresh(scanner: UnusualActivityScanner | None = None) -> dict | None:
+    """
+    抓取全市場快照並掃描；同一交易日已掃描過時直接回傳記憶體中的結果
+    基準尚未建立（或落後於歷史庫）時先由價格歷史庫建立
+    """
+    from utils.price_history import fetch_market_snapshot, load_price_history
+
+    scanner = scanner or get_scanner()
+    with _refresh_lock:
+        trade_date, snapshot = fetch_market_snapshot()
+        if not snapshot:
+            print("⚠️ 異常交易掃描：沒有取得任何行情")
+            return scanner.latest
+        if scanner.latest and scanner.latest['date'] == trade_date and scanner.latest['final']:
+            return scanner.latest
+        if scanner.date is None or scanner.date >= trade_date:
+            history = load_price_history()
+            if history is not None:
+                scanner.seed_from_history(history, before=trade_date)
+        started = time.perf_counter()
+        latest = scanner.scan(snapshot, trade_date, final=True)
+        print(f"🔎 異常交易掃描 {trade_date}：{latest['symbols']} 支股票，標記 {len(latest['results'])} 支"
+              f"（{(time.perf_counter() - started) * 1000:.1f} ms）")
+        return latest
+
+
+def start_unusual_scanner(interval: int | None = None) -> threading.Thread:
+    """啟動背景掃描執行緒（每個行程只會啟動一次）"""
+    global _scanner_thread
+    interval = SCAN_INTERVAL if interval is None else interval
+
+    with _scanner_lock:
+        if _scanner_thread is not None and _scanner_thread.is_alive():
+            return _scanner_thread
+
+        def _run():
+            while True:
+                time.sleep(interval)
+                try:
+                    refresh()
+                except Exception as e:
+                    print(f"❌ 異常交易掃描失敗: {e}")
+
+        _scanner_thread = threading.Thread(target=_run, name='unusual-scanner', daemon=True)
+        _scanner_thread.start()
+        return _scanner_thread
+
+
+def get_latest() -> dict | None:
+    """記憶體中的最新掃描結果；第一次使用時同步掃描一次並啟動背景掃描"""
+    scanner = get_scanner()
+    if scanner.latest is None:
+        refresh(scanner)
+    start_unusual_scanner()
+    return scanner.latest